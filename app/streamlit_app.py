@@ -1,5 +1,6 @@
 import streamlit as st
 import httpx
+import hashlib
 from datetime import date, datetime, timedelta
 import pandas as pd
 from PIL import Image
@@ -9,6 +10,8 @@ import os
 from pathlib import Path
 
 API_URL = os.getenv("API_URL", "http://localhost:8000")
+# Arquivos acima deste tamanho usam o upload em blocos (retomável)
+CHUNKED_UPLOAD_THRESHOLD = int(os.getenv("CHUNKED_UPLOAD_THRESHOLD", 8 * 1024 * 1024))
 
 # Get the directory where this script is located
 SCRIPT_DIR = Path(__file__).parent
@@ -16,6 +19,43 @@ ASSETS_DIR = SCRIPT_DIR / "attached_assets"
 
 st.set_page_config(page_title="OSINT Planning MVP v3", layout="wide")
 
+
+def chunked_upload(client, plan_id, name, data, progress=None):
+    """Envia um arquivo em blocos; se houver upload pendente do mesmo arquivo, retoma do offset salvo"""
+    sha256 = hashlib.sha256(data).hexdigest()
+    key = f"upload_{plan_id}_{sha256}"
+    upload = None
+    if key in st.session_state:
+        r = client.get(f"{API_URL}/evidence/uploads/{st.session_state[key]}")
+        if r.status_code == 200:
+            upload = r.json()
+    if upload is None:
+        r = client.post(f"{API_URL}/evidence/uploads", json={
+            "plan_id": plan_id, "filename": name, "size": len(data), "sha256": sha256,
+        })
+        r.raise_for_status()
+        upload = r.json()
+        st.session_state[key] = upload["upload_id"]
+
+    url = f"{API_URL}/evidence/uploads/{upload['upload_id']}"
+    offset, step = upload["offset"], upload["chunk_size"]
+    while offset < len(data):
+        chunk = data[offset:offset + step]
+        r = client.put(url, params={"offset": offset}, content=chunk,
+                       headers={"X-Chunk-SHA256": hashlib.sha256(chunk).hexdigest()})
+        if r.status_code == 409:
+            offset = client.get(url).json()["offset"]
+            continue
+        r.raise_for_status()
+        offset = r.json()["offset"]
+        if progress is not None:
+            progress.progress(offset / len(data))
+
+    r = client.post(f"{url}/complete")
+    if r.status_code == 200:
+        del st.session_state[key]
+    return r
+
 if "plan" not in st.session_state:
     st.session_state.plan = {
         "title": "Plano de Inteligência",
@@ -516,9 +556,17 @@ elif current == "Revisão & Export":
                 if st.button("⬆️ Enviar Evidência", key=f"upload_btn_{saved['id']}", use_container_width=True):
                     with st.spinner("Calculando hash e enviando..."):
                         with httpx.Client(timeout=60) as client:
-                            files = {"file": (up.name, up.getvalue())}
-                            data = {"plan_id": str(saved["id"])}
-                            r = client.post(f"{API_URL}/evidence/upload", files=files, data=data)
+                            if up.size > CHUNKED_UPLOAD_THRESHOLD:
+                                # Upload em blocos: uma falha de conexão retoma do último bloco recebido
+                                try:
+                                    r = chunked_upload(client, saved["id"], up.name, up.getvalue(), progress=st.progress(0.0))
+                                except httpx.HTTPError as e:
+                                    st.error(f"❌ Upload interrompido: {e}. Clique em Enviar novamente para retomar.")
+                                    st.stop()
+                            else:
+                                files = {"file": (up.name, up.getvalue())}
+                                data = {"plan_id": str(saved["id"])}
+                                r = client.post(f"{API_URL}/evidence/upload", files=files, data=data)
                             if r.status_code == 200:
                                 result = r.json()
                                 st.success(f"✅ Evidência anexada com sucesso!")
@@ -0,0 +1,112 @@
+"""
+Versões async dos endpoints de planos (ativadas com DB_MODE=async)
+
+Usam AsyncSession, liberando o event loop enquanto aguardam o banco em vez de
+ocupar uma thread do threadpool do Starlette por requisição.
+"""
+from fastapi import APIRouter, Depends, HTTPException, Request, Query
+from fastapi.responses import JSONResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .db.async_database import get_async_db
+from .models.models import Plan, Evidence
+from .schemas.schemas import PlanCreate, PlanRead, PlanPage, EvidenceRead
+from .services.audit import log as audit_log
+from .services.lgpd import lgpd_check
+from .services.plan_items import insert_plan_items
+from .main import (
+    limiter, PLANS_PAGE_SIZE, PLANS_MAX_PAGE_SIZE,
+    _to_read, _plan_from_payload, _parse_fields, _project_row,
+)
+
+router = APIRouter()
+
+
+async def _load_evidences(db: AsyncSession, plan_ids: list[int]) -> dict[int, list[Evidence]]:
+    """Carrega as evidências de vários planos em uma única consulta IN (...)"""
+    grouped: dict[int, list[Evidence]] = {pid: [] for pid in plan_ids}
+    if not plan_ids:
+        return grouped
+    result = await db.execute(select(Evidence).where(Evidence.plan_id.in_(plan_ids)).order_by(Evidence.id))
+    for e in result.scalars():
+        grouped[e.plan_id].append(e)
+    return grouped
+
+
+async def _keyset_page(db: AsyncSession, stmt, limit: int, after: int | None, scalars: bool = True):
+    """Paginação por cursor em Plan.id (decrescente); retorna (linhas, next_cursor)"""
+    stmt = stmt.order_by(Plan.id.desc())
+    if after is not None:
+        stmt = stmt.where(Plan.id < after)
+    result = await db.execute(stmt.limit(limit + 1))
+    rows = list(result.scalars() if scalars else result.all())
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return rows, (rows[-1].id if has_more else None)
+
+
+@router.post("/plans", response_model=PlanRead)
+@limiter.limit("20/minute")  # Limite de criação de planos
+async def create_plan_async(request: Request, payload: PlanCreate, db: AsyncSession = Depends(get_async_db)):
+    plan = _plan_from_payload(payload)
+    db.add(plan)
+    await db.flush()
+    pirs = [p.model_dump() for p in payload.pirs]
+    collection = [c.model_dump() for c in payload.collection]
+    await db.run_sync(lambda s: insert_plan_items(s, plan.id, pirs, collection))
+    await db.run_sync(lambda s: audit_log(s, action="create_plan", detail=f"Plan {plan.id} created", plan_id=plan.id, transaction=True))
+    await db.commit()
+    return _to_read(plan, evidences=[])
+
+
+@router.get("/plans/{plan_id}", response_model=PlanRead)
+@limiter.limit("60/minute")  # Leitura pode ser mais frequente
+async def get_plan_async(request: Request, plan_id: int, db: AsyncSession = Depends(get_async_db)):
+    plan = await db.get(Plan, plan_id)
+    if not plan:
+        raise HTTPException(404, "Plan not found")
+    evidences = await _load_evidences(db, [plan.id])
+    return _to_read(plan, evidences=evidences[plan.id])
+
+
+@router.get("/plans", response_model=PlanPage)
+@limiter.limit("30/minute")  # Listagem pode ser moderada
+async def list_plans_async(
+    request: Request,
+    limit: int = Query(PLANS_PAGE_SIZE, ge=1, le=PLANS_MAX_PAGE_SIZE),
+    after: int | None = Query(None, description="Cursor: id do último plano da página anterior"),
+    fields: str | None = Query(None, description="Campos a retornar, separados por vírgula (ex.: id,title,deadline)"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Lista planos em páginas (mais recentes primeiro) usando paginação por cursor"""
+    selected = _parse_fields(fields)
+    if selected is None:
+        plans, next_cursor = await _keyset_page(db, select(Plan), limit, after)
+        evidences = await _load_evidences(db, [p.id for p in plans])
+        return PlanPage(
+            items=[_to_read(p, evidences=evidences[p.id]) for p in plans],
+            next_cursor=next_cursor,
+        )
+
+    columns = [getattr(Plan, f) for f in selected if f != "evidences"]
+    rows, next_cursor = await _keyset_page(db, select(*columns), limit, after, scalars=False)
+    items = [_project_row(r, selected) for r in rows]
+    if "evidences" in selected:
+        evidences = await _load_evidences(db, [r.id for r in rows])
+        for item in items:
+            item["evidences"] = [
+                EvidenceRead(id=e.id, filename=e.filename, sha256=e.sha256, size=e.size).model_dump()
+                for e in evidences[item["id"]]
+            ]
+    return JSONResponse({"items": items, "next_cursor": next_cursor})
+
+
+@router.post("/plans/{plan_id}/lgpd_check")
+@limiter.limit("30/minute")  # Validação LGPD moderada
+async def check_lgpd_async(request: Request, plan_id: int, db: AsyncSession = Depends(get_async_db)):
+    plan = await db.get(Plan, plan_id)
+    if not plan:
+        raise HTTPException(404, "Plan not found")
+    result = lgpd_check(_to_read(plan).model_dump())
+    await db.run_sync(lambda s: audit_log(s, action="lgpd_check", detail=str(result), plan_id=plan.id))
+    return result
@@ -0,0 +1,51 @@
+"""
+Sessões assíncronas (SQLAlchemy AsyncSession) para o modo DB_MODE=async
+
+Requer o driver async do banco configurado: aiosqlite (SQLite) ou asyncpg (PostgreSQL).
+"""
+import asyncio
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from .database import (
+    ASYNC_DATABASE_URL, IS_SQLITE, DB_ENGINE_PROFILE, apply_sqlite_pragmas,
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, pool_gate,
+)
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    poolclass=AsyncAdaptedQueuePool,  # aiosqlite usa NullPool por padrão
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=True,
+)
+
+if IS_SQLITE and DB_ENGINE_PROFILE != "legacy":
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# Event loop das sessões: o dispose do engine async (restauração a quente) precisa rodar nele
+_loop: asyncio.AbstractEventLoop | None = None
+
+
+def _dispose_async_engine() -> None:
+    if _loop is not None and _loop.is_running():
+        asyncio.run_coroutine_threadsafe(async_engine.dispose(), _loop).result(timeout=30)
+
+
+pool_gate.register(async_engine, _dispose_async_engine)
+
+
+async def get_async_db():
+    global _loop
+    _loop = asyncio.get_running_loop()
+    if pool_gate.is_paused:
+        # Restauração em andamento: espera sem bloquear o event loop
+        await asyncio.to_thread(pool_gate.wait_resumed)
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,51 @@
+"""
+Preparação do esquema do banco: tabelas, colunas novas, índices e migrações de dados
+
+Executada na inicialização da API e novamente após uma restauração a quente: um
+backup anterior a uma atualização traz o esquema antigo, e a API continua rodando
+sem passar de novo pela inicialização.
+"""
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+from .database import Base
+from ..models.models import AuditLog
+from ..services.plan_items import backfill_plan_items
+
+
+def _add_missing_columns(bind) -> None:
+    """create_all não altera tabelas existentes: acrescenta as colunas anuláveis novas"""
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            present = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in present and column.nullable and column.server_default is None:
+                    column_type = column.type.compile(dialect=bind.dialect)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}'))
+
+
+def prepare_schema(bind) -> None:
+    """Cria tabelas, colunas e índices ausentes e aplica as migrações de dados pendentes"""
+    Base.metadata.create_all(bind=bind)
+    _add_missing_columns(bind)
+    # create_all não cria índices novos em tabelas já existentes (ex.: audit_logs de versões anteriores)
+    for index in AuditLog.__table__.indexes:
+        index.create(bind=bind, checkfirst=True)
+    with Session(bind=bind) as db:
+        backfill_plan_items(db)
+
+
+def prepare_schema_at(url: str) -> None:
+    """
+    prepare_schema com um engine próprio, fora do pool da API: durante pool_gate.paused()
+    os checkouts do engine principal esperam a retomada
+    """
+    engine = create_engine(url, poolclass=NullPool)
+    try:
+        prepare_schema(engine)
+    finally:
+        engine.dispose()
@@ -1,24 +1,83 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form, Request
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form, Request, Query
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.routing import APIRoute
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
+from sqlalchemy import func, false
 from sqlalchemy.orm import Session
-from .db.database import SessionLocal, engine, Base
-from .models.models import Plan, Evidence
-from .schemas.schemas import PlanCreate, PlanRead, EvidenceRead
-from .services.audit import log as audit_log
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+from .db.database import SessionLocal, engine, DB_MODE
+from .db.schema import prepare_schema
+from .models.models import Plan, Evidence, EvidenceUpload, ExportJob, PlanPir, PlanCollectionTask, AuditLog
+from .schemas.schemas import (
+    PlanCreate, PlanRead, PlanPage, PlanSummary, PlanSummaryPage, EvidenceRead,
+    PlanImportResult, PlanImportReport, EvidenceUploadCreate, EvidenceUploadStatus, ExportJobCreate, ExportJobRead, BulkExportRequest, BackupJobRead,
+    PIRRead, PIRPage, CollectionTaskRead, CollectionTaskPage, AuditLogRead, AuditLogPage,
+)
+from .services.audit import log as audit_log, audit_writer
 from .services.lgpd import lgpd_check
-from .services.pdf import generate_plan_pdf
+from .services.plan_items import insert_plan_items
+from .services.plan_import import RowDecoder, plan_row, insert_plans
+from .services.pdf import generate_plan_pdf, generate_plans_pdf, PDF_TEMPLATE_VERSION
+from .services.html_report import iter_plan_html, HTML_TEMPLATE_VERSION
+from .services.export_cache import cache_key, get_or_render, lookup as cache_lookup
+from .services.export_jobs import export_queue, export_jobs_janitor, render_export, QueueFullError, EXPORT_WORKER_ID
+from .services.bulk_export import render_many, iter_zip
+from .services.evidence_store import (
+    store_upload, append_chunk, finalize_partial, discard_partial, partial_size, resolve_evidence_path,
+    FileTooLargeError, EmptyFileError, OffsetMismatchError, ChecksumMismatchError, UploadBusyError,
+)
+from .services.upload_cleanup import upload_janitor
 from .services.error_handler import setup_exception_handlers
-from .services.backup import create_backup, restore_backup, list_backups, cleanup_old_backups, get_backup_stats
-import json, os, hashlib, base64, datetime
+from .services.http_files import send_file, etag_matches, iter_buffered, iter_fileobj
+from .services.backup import list_backups, get_backup_stats, BACKUP_DIR, is_backup_file
+from .services.backup_jobs import backup_worker
+import json, os, datetime, uuid, tempfile
 from pathlib import Path
 
-Base.metadata.create_all(bind=engine)
+prepare_schema(engine)
 app = FastAPI(title="OSINT Planning API v3")
 
+@app.on_event("startup")
+def start_audit_writer():
+    audit_writer.start()
+
+@app.on_event("shutdown")
+def stop_audit_writer():
+    # Grava de forma síncrona os eventos de auditoria ainda na fila
+    audit_writer.stop()
+
+@app.on_event("startup")
+def start_export_jobs():
+    # Batimento deste processo; jobs pendentes de processos encerrados falham para o cliente recriar
+    export_jobs_janitor.start()
+
+@app.on_event("shutdown")
+def stop_export_queue():
+    export_jobs_janitor.stop()
+    export_queue.shutdown()
+
+@app.on_event("startup")
+def start_backup_worker():
+    # Inclui o agendador de backups quando BACKUP_SCHEDULE=true
+    backup_worker.start()
+
+@app.on_event("shutdown")
+def stop_backup_worker():
+    backup_worker.stop()
+
+@app.on_event("startup")
+def start_upload_janitor():
+    # Descarta uploads em blocos abandonados (UPLOAD_PARTIAL_TTL) na inicialização e periodicamente
+    upload_janitor.start()
+
+@app.on_event("shutdown")
+def stop_upload_janitor():
+    upload_janitor.stop()
+
 # Configurar exception handlers globais
 setup_exception_handlers(app)
 
@@ -29,6 +88,47 @@ REQUIRE_API_KEY = os.environ.get("REQUIRE_API_KEY", "false").lower() == "true"
 # Tamanho máximo de arquivo (padrão: 50MB)
 MAX_FILE_SIZE = int(os.environ.get("MAX_FILE_SIZE", 50 * 1024 * 1024))  # 50MB em bytes
 
+# Exportação NDJSON da auditoria: linhas lidas por consulta
+AUDIT_EXPORT_CHUNK = int(os.environ.get("AUDIT_EXPORT_CHUNK", 1000))
+
+# Importação em lote (POST /plans/bulk): planos por transação e limite de linhas por requisição
+PLANS_IMPORT_BATCH = int(os.environ.get("PLANS_IMPORT_BATCH", 500))
+PLANS_IMPORT_MAX_ROWS = int(os.environ.get("PLANS_IMPORT_MAX_ROWS", 20000))
+
+# Paginação da listagem de planos (keyset sobre Plan.id)
+PLANS_PAGE_SIZE = int(os.environ.get("PLANS_PAGE_SIZE", 50))
+PLANS_MAX_PAGE_SIZE = int(os.environ.get("PLANS_MAX_PAGE_SIZE", 200))
+
+# Colunas de Plan armazenadas como JSON (campo -> valor usado quando nulo)
+PLAN_JSON_FIELDS = {
+    "subject": "{}",
+    "time_window": "{}",
+    "user": "{}",
+    "deadline": "{}",
+    "aspects_essential": "[]",
+    "aspects_known": "[]",
+    "aspects_to_know": "[]",
+    "pirs": "[]",
+    "collection": "[]",
+    "extraordinary": "[]",
+    "security": "[]",
+}
+# Campos selecionáveis via ?fields= na listagem
+PLAN_FIELDS = ("id", "title", "purpose", *PLAN_JSON_FIELDS, "evidences")
+
+# Upload em blocos (retomável): tamanho máximo do arquivo e de cada bloco
+MAX_CHUNKED_FILE_SIZE = int(os.environ.get("MAX_CHUNKED_FILE_SIZE", 2 * 1024 * 1024 * 1024))  # 2GB
+UPLOAD_CHUNK_MAX_SIZE = int(os.environ.get("UPLOAD_CHUNK_MAX_SIZE", 8 * 1024 * 1024))  # 8MB
+
+# Exportação: "cache" grava o relatório em EXPORT_DIR; "stream" renderiza em memória
+# (spool em disco acima de EXPORT_SPOOL_MAX_BYTES) e envia sem caminho compartilhado
+EXPORT_MODE = os.environ.get("EXPORT_MODE", "cache").lower()
+EXPORT_SPOOL_MAX_BYTES = int(os.environ.get("EXPORT_SPOOL_MAX_BYTES", 8 * 1024 * 1024))  # 8MB
+
+# Exportação em lote: máximo de planos por requisição e planos carregados por consulta
+BULK_EXPORT_MAX_PLANS = int(os.environ.get("BULK_EXPORT_MAX_PLANS", 1000))
+BULK_EXPORT_CHUNK = 100
+
 # Tipos de arquivo permitidos (extensões)
 ALLOWED_EXTENSIONS = {
     ".pdf", ".png", ".jpg", ".jpeg", ".gif",  # Documentos e imagens
@@ -53,17 +153,11 @@ ALLOWED_MIME_TYPES = {
 # Permite desabilitar via variável de ambiente RATE_LIMIT_ENABLED=false
 RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "true").lower() == "true"
 
-# Sempre criar o limiter, mas com limites muito altos se desabilitado
-limiter = Limiter(key_func=get_remote_address)
+# Sempre criar o limiter; se desabilitado, os decoradores @limiter.limit() não limitam nada
+limiter = Limiter(key_func=get_remote_address, enabled=RATE_LIMIT_ENABLED)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
-# Se desabilitado, definir limites muito altos (efetivamente sem limite)
-if not RATE_LIMIT_ENABLED:
-    # Override dos limites para valores muito altos quando desabilitado
-    # Isso permite que o código funcione sem mudanças, mas sem limitar
-    pass  # Os decoradores @limiter.limit() ainda funcionam, mas podem ser ignorados em dev
-
 # Configuração CORS
 # Permite configuração via variável de ambiente CORS_ORIGINS
 # Formato: "http://localhost:8501,http://localhost:3000,https://exemplo.com"
@@ -133,33 +227,162 @@ def _to_read(plan: Plan, evidences: list[Evidence] | None = None) -> PlanRead:
         evidences=[EvidenceRead(id=e.id, filename=e.filename, sha256=e.sha256, size=e.size) for e in (evidences or [])]
     )
 
+def _load_evidences(db: Session, plan_ids: list[int]) -> dict[int, list[Evidence]]:
+    """Carrega as evidências de vários planos em uma única consulta IN (...)"""
+    grouped: dict[int, list[Evidence]] = {pid: [] for pid in plan_ids}
+    if not plan_ids:
+        return grouped
+    evs = db.query(Evidence).filter(Evidence.plan_id.in_(plan_ids)).order_by(Evidence.id).all()
+    for e in evs:
+        grouped[e.plan_id].append(e)
+    return grouped
+
+def _parse_fields(fields: str | None) -> list[str] | None:
+    """Valida o parâmetro ?fields= (lista separada por vírgula)"""
+    if not fields:
+        return None
+    wanted = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = sorted(set(wanted) - set(PLAN_FIELDS))
+    if unknown:
+        raise HTTPException(400, f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(PLAN_FIELDS)}")
+    # id sempre presente (usado como cursor)
+    return ["id"] + [f for f in dict.fromkeys(wanted) if f != "id"]
+
+def _project_row(row, fields: list[str]) -> dict:
+    """Monta um dicionário apenas com os campos pedidos, decodificando só o JSON necessário"""
+    item = {}
+    for f in fields:
+        if f == "evidences":
+            continue
+        value = getattr(row, f)
+        if f in PLAN_JSON_FIELDS:
+            value = json.loads(value or PLAN_JSON_FIELDS[f])
+        item[f] = value
+    return item
+
+def _keyset_page(q, limit: int, after: int | None, key=Plan.id):
+    """Aplica paginação por cursor (key decrescente) e retorna (linhas, next_cursor)"""
+    q = q.order_by(key.desc())
+    if after is not None:
+        q = q.filter(key < after)
+    # Busca um registro a mais para saber se existe próxima página
+    rows = q.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return rows, (rows[-1].id if has_more else None)
+
 def _to_dict(plan: Plan) -> dict:
     return _to_read(plan).model_dump()
 
+def _plan_from_payload(payload: PlanCreate) -> Plan:
+    return Plan(**plan_row(payload))
+
 @app.post("/plans", response_model=PlanRead)
 @limiter.limit("20/minute")  # Limite de criação de planos
 def create_plan(request: Request, payload: PlanCreate, db: Session = Depends(get_db)):
-    plan = Plan(
-        title=payload.title,
-        subject=json.dumps(payload.subject.model_dump(), ensure_ascii=False),
-        time_window=json.dumps(payload.time_window.model_dump(), ensure_ascii=False),
-        user=json.dumps(payload.user.model_dump(), ensure_ascii=False),
-        purpose=payload.purpose,
-        deadline=json.dumps(payload.deadline.model_dump(), ensure_ascii=False),
-        aspects_essential=json.dumps(payload.aspects_essential, ensure_ascii=False),
-        aspects_known=json.dumps(payload.aspects_known, ensure_ascii=False),
-        aspects_to_know=json.dumps(payload.aspects_to_know, ensure_ascii=False),
-        pirs=json.dumps([p.model_dump() for p in payload.pirs], ensure_ascii=False),
-        collection=json.dumps([c.model_dump() for c in payload.collection], ensure_ascii=False),
-        extraordinary=json.dumps(payload.extraordinary, ensure_ascii=False),
-        security=json.dumps(payload.security, ensure_ascii=False),
-    )
+    plan = _plan_from_payload(payload)
     db.add(plan)
+    db.flush()
+    insert_plan_items(
+        db, plan.id,
+        [p.model_dump() for p in payload.pirs],
+        [c.model_dump() for c in payload.collection],
+    )
+    audit_log(db, action="create_plan", detail=f"Plan {plan.id} created", plan_id=plan.id, transaction=True)
     db.commit()
     db.refresh(plan)
-    audit_log(db, action="create_plan", detail=f"Plan {plan.id} created", plan_id=plan.id)
     return _to_read(plan, evidences=[])
 
+@app.post("/plans/bulk", response_model=PlanImportReport)
+@limiter.limit("5/minute")
+async def import_plans(request: Request, db: Session = Depends(get_db)):
+    """
+    Importa planos em lote a partir de NDJSON ou de um array JSON (lido em streaming)
+
+    Cada linha é validada com PlanCreate; as válidas são inseridas em lotes de
+    PLANS_IMPORT_BATCH (executemany, um commit por lote). Retorna o resultado por linha;
+    acima de PLANS_IMPORT_MAX_ROWS a leitura para e o relatório vem com truncated=true.
+    """
+    decoder = RowDecoder()
+    report = PlanImportReport()
+    batch: list[tuple[int, PlanCreate]] = []
+    index = 0
+
+    async def flush():
+        rows, batch[:] = list(batch), []
+        try:
+            ids = await run_in_threadpool(insert_plans, db, [payload for _, payload in rows])
+        except Exception as e:
+            report.failed += len(rows)
+            report.results += [
+                PlanImportResult(index=i, status="error", errors=[{"msg": f"Database error: {str(e)}"}])
+                for i, _ in rows
+            ]
+            return
+        report.created += len(ids)
+        report.results += [PlanImportResult(index=i, status="created", id=plan_id) for (i, _), plan_id in zip(rows, ids)]
+
+    async def consume(values: list):
+        nonlocal index
+        for value in values:
+            if index >= PLANS_IMPORT_MAX_ROWS:
+                # Lotes anteriores já foram confirmados: o excedente vira erro no relatório
+                report.truncated = True
+                report.failed += 1
+                report.results.append(PlanImportResult(
+                    index=index, status="error",
+                    errors=[{"msg": f"Row limit exceeded. Maximum: {PLANS_IMPORT_MAX_ROWS}; remaining rows were not imported"}],
+                ))
+                return
+            try:
+                if isinstance(value, Exception):
+                    raise ValueError(f"Invalid JSON: {value}")
+                batch.append((index, PlanCreate.model_validate(value)))
+            except ValidationError as e:
+                report.failed += 1
+                report.results.append(PlanImportResult(
+                    index=index, status="error",
+                    errors=e.errors(include_url=False, include_context=False, include_input=False),
+                ))
+            except ValueError as e:
+                report.failed += 1
+                report.results.append(PlanImportResult(index=index, status="error", errors=[{"msg": str(e)}]))
+            index += 1
+            if len(batch) >= PLANS_IMPORT_BATCH:
+                await flush()
+
+    async for chunk in request.stream():
+        await consume(decoder.feed(chunk))
+        if report.truncated:
+            break
+    if not report.truncated:
+        await consume(decoder.feed(b"", final=True))
+    if batch:
+        await flush()
+    report.results.sort(key=lambda r: r.index)
+    return report
+
+@app.get("/plans/summary", response_model=PlanSummaryPage)
+@limiter.limit("60/minute")  # Projeção leve para seletores e dashboards
+def list_plan_summaries(
+    request: Request,
+    limit: int = Query(PLANS_PAGE_SIZE, ge=1, le=PLANS_MAX_PAGE_SIZE),
+    after: int | None = Query(None, description="Cursor: id do último plano da página anterior"),
+    db: Session = Depends(get_db),
+):
+    """Lista apenas id, título, sigilo e prazo dos planos (sem decodificar as demais colunas)"""
+    rows, next_cursor = _keyset_page(db.query(Plan.id, Plan.title, Plan.user, Plan.deadline), limit, after)
+    items = []
+    for row in rows:
+        user = json.loads(row.user or "{}")
+        items.append(PlanSummary(
+            id=row.id,
+            title=row.title,
+            secrecy=user.get("secrecy"),
+            deadline=json.loads(row.deadline) if row.deadline else None,
+        ))
+    return PlanSummaryPage(items=items, next_cursor=next_cursor)
+
 @app.get("/plans/{plan_id}", response_model=PlanRead)
 @limiter.limit("60/minute")  # Leitura pode ser mais frequente
 def get_plan(request: Request, plan_id: int, db: Session = Depends(get_db)):
@@ -169,15 +392,81 @@ def get_plan(request: Request, plan_id: int, db: Session = Depends(get_db)):
     evs = db.query(Evidence).filter(Evidence.plan_id==plan.id).all()
     return _to_read(plan, evidences=evs)
 
-@app.get("/plans", response_model=list[PlanRead])
+@app.get("/plans", response_model=PlanPage)
 @limiter.limit("30/minute")  # Listagem pode ser moderada
-def list_plans(request: Request, db: Session = Depends(get_db)):
-    plans = db.query(Plan).order_by(Plan.id.desc()).all()
-    result = []
-    for p in plans:
-        evs = db.query(Evidence).filter(Evidence.plan_id==p.id).all()
-        result.append(_to_read(p, evidences=evs))
-    return result
+def list_plans(
+    request: Request,
+    limit: int = Query(PLANS_PAGE_SIZE, ge=1, le=PLANS_MAX_PAGE_SIZE),
+    after: int | None = Query(None, description="Cursor: id do último plano da página anterior"),
+    fields: str | None = Query(None, description="Campos a retornar, separados por vírgula (ex.: id,title,deadline)"),
+    db: Session = Depends(get_db),
+):
+    """Lista planos em páginas (mais recentes primeiro) usando paginação por cursor"""
+    selected = _parse_fields(fields)
+    if selected is None:
+        plans, next_cursor = _keyset_page(db.query(Plan), limit, after)
+        evidences = _load_evidences(db, [p.id for p in plans])
+        return PlanPage(
+            items=[_to_read(p, evidences=evidences[p.id]) for p in plans],
+            next_cursor=next_cursor,
+        )
+
+    # Projeção: consulta apenas as colunas pedidas e devolve objetos parciais
+    columns = [getattr(Plan, f) for f in selected if f != "evidences"]
+    rows, next_cursor = _keyset_page(db.query(*columns), limit, after)
+    items = [_project_row(r, selected) for r in rows]
+    if "evidences" in selected:
+        evidences = _load_evidences(db, [r.id for r in rows])
+        for item in items:
+            item["evidences"] = [
+                EvidenceRead(id=e.id, filename=e.filename, sha256=e.sha256, size=e.size).model_dump()
+                for e in evidences[item["id"]]
+            ]
+    return JSONResponse({"items": items, "next_cursor": next_cursor})
+
+@app.get("/pirs", response_model=PIRPage)
+@limiter.limit("30/minute")
+def list_pirs(
+    request: Request,
+    priority: str | None = None,
+    plan_id: int | None = None,
+    limit: int = Query(PLANS_PAGE_SIZE, ge=1, le=PLANS_MAX_PAGE_SIZE),
+    after: int | None = Query(None, description="Cursor: id da última PIR da página anterior"),
+    db: Session = Depends(get_db),
+):
+    """Consulta PIRs de todos os planos filtrando no banco (ex.: ?priority=critica)"""
+    q = db.query(PlanPir)
+    if priority is not None:
+        q = q.filter(PlanPir.priority == priority)
+    if plan_id is not None:
+        q = q.filter(PlanPir.plan_id == plan_id)
+    rows, next_cursor = _keyset_page(q, limit, after, key=PlanPir.id)
+    return PIRPage(items=[PIRRead.model_validate(r) for r in rows], next_cursor=next_cursor)
+
+@app.get("/collection_tasks", response_model=CollectionTaskPage)
+@limiter.limit("30/minute")
+def list_collection_tasks(
+    request: Request,
+    owner: str | None = None,
+    frequency: str | None = None,
+    max_sla_hours: int | None = Query(None, description="Retorna tarefas com sla_hours <= valor"),
+    plan_id: int | None = None,
+    limit: int = Query(PLANS_PAGE_SIZE, ge=1, le=PLANS_MAX_PAGE_SIZE),
+    after: int | None = Query(None, description="Cursor: id da última tarefa da página anterior"),
+    db: Session = Depends(get_db),
+):
+    """Consulta tarefas de coleta de todos os planos filtrando no banco (ex.: ?owner=X&max_sla_hours=24)"""
+    q = db.query(PlanCollectionTask)
+    if owner is not None:
+        q = q.filter(PlanCollectionTask.owner == owner)
+    if frequency is not None:
+        q = q.filter(PlanCollectionTask.frequency == frequency)
+    if max_sla_hours is not None:
+        q = q.filter(PlanCollectionTask.sla_hours <= max_sla_hours)
+    if plan_id is not None:
+        q = q.filter(PlanCollectionTask.plan_id == plan_id)
+    rows, next_cursor = _keyset_page(q, limit, after, key=PlanCollectionTask.id)
+    return CollectionTaskPage(items=[CollectionTaskRead.model_validate(r) for r in rows], next_cursor=next_cursor)
 
 @app.post("/plans/{plan_id}/lgpd_check")
 @limiter.limit("30/minute")  # Validação LGPD moderada
@@ -190,140 +479,233 @@ def check_lgpd(request: Request, plan_id: int, db: Session = Depends(get_db)):
     audit_log(db, action="lgpd_check", detail=str(result), plan_id=plan.id)
     return result
 
+EXPORT_MEDIA_TYPES = {"pdf": "application/pdf", "html": "text/html"}
+
+def _export_key(data: dict, kind: str) -> tuple[str, str | None]:
+    """Chave de cache e logo usados na exportação de um plano"""
+    if kind == "pdf":
+        return cache_key(data, "pdf", PDF_TEMPLATE_VERSION), None
+    logo_path = os.environ.get("REPORT_LOGO_PATH")
+    return cache_key(data, "html", HTML_TEMPLATE_VERSION, logo_path), logo_path
+
+def _send_export(request: Request, db: Session, plan_id: int, key: str, ext: str, media_type: str, render):
+    """Serve um relatório do cache de exportação (304 se o cliente já tem esta versão)"""
+    if etag_matches(request, f'"{key}"'):
+        return Response(status_code=304, headers={"ETag": f'"{key}"'})
+    path, hit = get_or_render(key, ext, render)
+    audit_log(db, action=f"export_{ext}", detail=f"{path} ({'cache' if hit else 'rendered'})", plan_id=plan_id)
+    return send_file(request, path, etag=key, filename=f"plan_{plan_id}.{ext}", media_type=media_type)
+
+def _stream_export(request: Request, db: Session, plan_id: int, key: str, ext: str, render):
+    """
+    Envia um relatório renderizado sob demanda, sem gravá-lo em EXPORT_DIR
+
+    Args:
+        render: função sem argumentos que retorna (iterador de bytes, cabeçalhos extras)
+    """
+    # ETag fraco: cada renderização embute um novo horário, então os bytes não são idênticos
+    # aos do cache (nem entre duas renderizações); If-None-Match usa comparação fraca
+    etag = f'W/"{key}"'
+    if etag_matches(request, f'"{key}"'):
+        return Response(status_code=304, headers={"ETag": etag})
+    body, headers = render()
+    audit_log(db, action=f"export_{ext}", detail="streamed", plan_id=plan_id)
+    return StreamingResponse(
+        body,
+        media_type=EXPORT_MEDIA_TYPES[ext],
+        headers={
+            "ETag": etag,
+            "Content-Disposition": f'attachment; filename="plan_{plan_id}.{ext}"',
+            **headers,
+        },
+    )
+
+def _use_stream(stream: bool | None) -> bool:
+    return EXPORT_MODE == "stream" if stream is None else stream
+
 @app.get("/export/pdf/{plan_id}")
 @limiter.limit("10/minute")  # Geração de PDF é mais pesada
-def export_pdf(request: Request, plan_id: int, db: Session = Depends(get_db)):
+def export_pdf(
+    request: Request,
+    plan_id: int,
+    stream: bool | None = Query(None, description="Renderizar em memória sem usar o cache (padrão: EXPORT_MODE)"),
+    db: Session = Depends(get_db),
+):
     plan = db.get(Plan, plan_id)
     if not plan:
         raise HTTPException(404, "Plan not found")
     data = _to_dict(plan)
-    os.makedirs("exports", exist_ok=True)
-    outfile = f"exports/plan_{plan.id}.pdf"
-    generate_plan_pdf(data, outfile)
-    audit_log(db, action="export_pdf", detail=outfile, plan_id=plan.id)
-    return FileResponse(outfile, media_type="application/pdf", filename=f"plan_{plan.id}.pdf")
+    key, _ = _export_key(data, "pdf")
+    if _use_stream(stream):
+        def render():
+            # O ReportLab só grava o documento no save(); o buffer é enviado em seguida
+            spool = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_BYTES)
+            generate_plan_pdf(data, spool)
+            return iter_fileobj(spool), {"Content-Length": str(spool.tell())}
+
+        return _stream_export(request, db, plan.id, key, "pdf", render)
+    return _send_export(
+        request, db, plan.id, key, "pdf", EXPORT_MEDIA_TYPES["pdf"],
+        render=lambda outfile: render_export("pdf", data, outfile),
+    )
 
 @app.get("/export/html/{plan_id}")
 @limiter.limit("20/minute")  # HTML é mais leve que PDF
-def export_html(request: Request, plan_id: int, db: Session = Depends(get_db)):
+def export_html(
+    request: Request,
+    plan_id: int,
+    stream: bool | None = Query(None, description="Renderizar em memória sem usar o cache (padrão: EXPORT_MODE)"),
+    db: Session = Depends(get_db),
+):
     plan = db.get(Plan, plan_id)
     if not plan:
         raise HTTPException(404, "Plan not found")
     data = _to_dict(plan)
-    os.makedirs("exports", exist_ok=True)
-    outfile = f"exports/plan_{plan.id}.html"
-    logo_path = os.environ.get("REPORT_LOGO_PATH")
-    logo_html = ""
-    if logo_path and os.path.exists(logo_path):
-        b64 = base64.b64encode(open(logo_path,"rb").read()).decode("utf-8")
-        logo_html = f'<img src="data:image/png;base64,{b64}" style="height:60px;"/>'
-    html = f"""<!doctype html>
-<html lang="pt-br">
-<head>
-<meta charset="utf-8"/>
-<title>Plano de Inteligência — {data.get('title','')}</title>
-<style>
-body{{font-family:Arial,Helvetica,sans-serif;margin:24px;color:#0f172a;}}
-header{{display:flex;align-items:center;gap:16px;border-bottom:2px solid #e2e8f0;padding-bottom:8px;margin-bottom:16px;}}
-h1{{font-size:20px;margin:0;}}
-.section{{margin:16px 0;}}
-.card{{background:#f8fafc;border:1px solid #e2e8f0;border-radius:8px;padding:12px;margin:8px 0;}}
-.table{{width:100%;border-collapse:collapse;font-size:14px;}}
-.table th,.table td{{border:1px solid #e2e8f0;padding:8px;text-align:left;}}
-.mono{{font-family:ui-monospace, SFMono-Regular, Menlo, Monaco, Consolas, "Liberation Mono", "Courier New", monospace;font-size:12px;}}
-</style>
-</head>
-<body>
-<header>
-{logo_html}
-<div>
-<h1>Plano de Inteligência — 1ª Fase (Planejamento)</h1>
-<div class="mono">{datetime.datetime.utcnow().isoformat()}Z</div>
-</div>
-</header>
-
-<div class="section">
-  <div class="card"><b>Título:</b> {data.get('title','')}</div>
-  <div class="card">
-    <b>Assunto:</b><br/>
-    O quê: <strong>{data.get('subject',{}).get('what','')}</strong><br/>
-    Quem: <strong>{data.get('subject',{}).get('who','')}</strong><br/>
-    Onde: <strong>{data.get('subject',{}).get('where','')}</strong>
-  </div>
-  <div class="card">
-    <b>Faixa de Tempo (Pesquisa):</b><br/>
-    Início: <strong>{data.get('time_window',{}).get('start','')}</strong><br/>
-    Fim: <strong>{data.get('time_window',{}).get('end','')}</strong><br/>
-    Notas: {data.get('time_window',{}).get('research_notes','') or '<em>(nenhuma anotação)</em>'}
-  </div>
-  <div class="card">
-    <b>Usuário:</b><br/>
-    Principal: <strong>{data.get('user',{}).get('principal','')}</strong><br/>
-    Outros: {data.get('user',{}).get('others','') or '<em>(nenhum)</em>'}<br/>
-    Profundidade: <strong>{data.get('user',{}).get('depth','')}</strong><br/>
-    Sigilo: <strong>{data.get('user',{}).get('secrecy','')}</strong>
-  </div>
-  <div class="card"><b>Finalidade:</b> {data.get('purpose','')}</div>
-  <div class="card">
-    <b>Prazo:</b><br/>
-    Data Limite: <strong>{data.get('deadline',{}).get('date','')}</strong><br/>
-    Urgência: <strong>{data.get('deadline',{}).get('urgency','')}</strong>
-  </div>
-</div>
-
-<div class="section">
-  <h3>Aspectos</h3>
-  <div class="card"><b>Essenciais</b><br/>{"<br/>".join([f"• {x}" for x in data.get("aspects_essential",[])]) or "-"}</div>
-  <div class="card"><b>Conhecidos</b><br/>{"<br/>".join([f"• {x}" for x in data.get("aspects_known",[])]) or "-"}</div>
-  <div class="card"><b>A Conhecer</b><br/>{"<br/>".join([f"• {x}" for x in data.get("aspects_to_know",[])]) or "-"}</div>
-</div>
-
-<div class="section">
-  <h3>PIRs</h3>
-  <table class="table">
-    <thead><tr><th>#</th><th>Aspecto Ref</th><th>Pergunta</th><th>Prioridade</th></tr></thead>
-    <tbody>
-    { "".join([f"<tr><td>{i}</td><td>{str(p.get('aspect_ref','-'))}</td><td>{p.get('question','')}</td><td>{p.get('priority','')}</td></tr>" for i,p in enumerate(data.get('pirs',[]))]) or "<tr><td colspan='4'>-</td></tr>" }
-    </tbody>
-  </table>
-</div>
-
-<div class="section">
-  <h3>Plano de Coleta</h3>
-  <table class="table">
-    <thead><tr><th>PIR #</th><th>Fonte</th><th>Método</th><th>Freq.</th><th>Owner</th><th>SLA (h)</th></tr></thead>
-    <tbody>
-    { "".join([f"<tr><td>{t.get('pir_index','')}</td><td>{t.get('source','')}</td><td>{t.get('method','')}</td><td>{t.get('frequency','')}</td><td>{t.get('owner','')}</td><td>{t.get('sla_hours',0)}</td></tr>" for t in data.get('collection',[])]) or "<tr><td colspan='6'>-</td></tr>" }
-    </tbody>
-  </table>
-</div>
-
-<div class="section">
-  <h3>Medidas</h3>
-  <div class="card"><b>Extraordinárias</b><br/>{"<br/>".join([f"• {x}" for x in data.get("extraordinary",[])]) or "-"}</div>
-  <div class="card"><b>Segurança</b><br/>{"<br/>".join([f"• {x}" for x in data.get("security",[])]) or "-"}</div>
-</div>
-
-</body>
-</html>"""
-    with open(outfile, "w", encoding="utf-8") as f:
-        f.write(html)
-    audit_log(db, action="export_html", detail=outfile, plan_id=plan.id)
-    return FileResponse(outfile, media_type="text/html", filename=f"plan_{plan.id}.html")
+    key, logo_path = _export_key(data, "html")
+    if _use_stream(stream):
+        # O template é gerado em partes conforme a resposta é enviada
+        return _stream_export(
+            request, db, plan.id, key, "html",
+            render=lambda: (iter_buffered(iter_plan_html(data, logo_path)), {}),
+        )
+    return _send_export(
+        request, db, plan.id, key, "html", EXPORT_MEDIA_TYPES["html"],
+        render=lambda outfile: render_export("html", data, outfile, logo_path),
+    )
 
-@app.post("/evidence/upload", response_model=EvidenceRead)
-@limiter.limit("5/minute")  # Upload é mais restritivo (arquivos grandes)
-async def upload_evidence(request: Request, plan_id: int = Form(...), file: UploadFile = File(...), db: Session = Depends(get_db)):
-    plan = db.get(Plan, plan_id)
+def _export_job_read(job: ExportJob) -> ExportJobRead:
+    return ExportJobRead(
+        job_id=job.id,
+        plan_id=job.plan_id,
+        format=job.format,
+        status=job.status,
+        error=job.error,
+        created_at=job.created_at,
+        finished_at=job.finished_at,
+        download_url=f"/exports/{job.id}/file" if job.status == "done" else None,
+    )
+
+def _get_export_job(db: Session, job_id: str) -> ExportJob:
+    job = db.get(ExportJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return job
+
+@app.post("/exports", response_model=ExportJobRead, status_code=202)
+@limiter.limit("10/minute")  # Mesmo limite da exportação síncrona de PDF
+def create_export_job(request: Request, payload: ExportJobCreate, db: Session = Depends(get_db)):
+    """Enfileira a renderização de um relatório no pool de processos e retorna o job"""
+    plan = db.get(Plan, payload.plan_id)
     if not plan:
-        raise HTTPException(status_code=404, detail="Plan not found")
-    
+        raise HTTPException(404, "Plan not found")
+    data = _to_dict(plan)
+    key, logo_path = _export_key(data, payload.format)
+    job = ExportJob(id=uuid.uuid4().hex, plan_id=plan.id, format=payload.format, status="queued", cache_key=key,
+                    owner=EXPORT_WORKER_ID)
+    if cache_lookup(key, payload.format):
+        # Versão já renderizada: o job nasce concluído
+        job.status = "done"
+        job.finished_at = datetime.datetime.now(datetime.timezone.utc)
+    db.add(job)
+    db.commit()
+    if job.status == "queued":
+        try:
+            export_queue.submit(job.id, payload.format, key, data, logo_path)
+        except QueueFullError as e:
+            db.delete(job)
+            db.commit()
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    audit_log(db, action=f"export_job_{payload.format}", detail=f"Job {job.id} ({job.status})", plan_id=plan.id)
+    return _export_job_read(job)
+
+@app.get("/exports/{job_id}", response_model=ExportJobRead)
+@limiter.limit("120/minute")  # Consultado em polling pelos clientes
+def get_export_job(request: Request, job_id: str, db: Session = Depends(get_db)):
+    """Estado de um job de exportação (download_url quando concluído)"""
+    return _export_job_read(_get_export_job(db, job_id))
+
+@app.get("/exports/{job_id}/file")
+@limiter.limit("30/minute")
+def download_export_job(request: Request, job_id: str, db: Session = Depends(get_db)):
+    """Baixa o relatório de um job concluído"""
+    job = _get_export_job(db, job_id)
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Export job is {job.status}")
+    path = cache_lookup(job.cache_key, job.format)
+    if not path:
+        # Removido do cache pela política LRU; o cliente deve criar um novo job
+        raise HTTPException(status_code=410, detail="Export expired from cache")
+    return send_file(
+        request, path, etag=job.cache_key,
+        filename=f"plan_{job.plan_id}.{job.format}", media_type=EXPORT_MEDIA_TYPES[job.format],
+    )
+
+
+def _bulk_plan_ids(db: Session, payload: BulkExportRequest) -> list[int]:
+    """Ids dos planos selecionados por lista e/ou filtros, em ordem crescente"""
+    q = db.query(Plan.id)
+    if payload.plan_ids is not None:
+        q = q.filter(Plan.id.in_(payload.plan_ids))
+    if payload.created_since is not None:
+        q = q.filter(Plan.created_at >= payload.created_since)
+    if payload.created_until is not None:
+        q = q.filter(Plan.created_at < payload.created_until)
+    if payload.pir_priority is not None:
+        q = q.filter(Plan.id.in_(db.query(PlanPir.plan_id).filter(PlanPir.priority == payload.pir_priority)))
+    ids = [row.id for row in q.order_by(Plan.id).limit(BULK_EXPORT_MAX_PLANS + 1)]
+    if len(ids) > BULK_EXPORT_MAX_PLANS:
+        raise HTTPException(400, f"Too many plans selected (max {BULK_EXPORT_MAX_PLANS}); narrow the filter")
+    if payload.plan_ids is not None:
+        missing = sorted(set(payload.plan_ids) - set(ids))
+        if missing:
+            raise HTTPException(404, f"Plans not found: {missing}")
+    if not ids:
+        raise HTTPException(404, "No plans match the filter")
+    return ids
+
+def _iter_plan_data(plan_ids: list[int]):
+    """Carrega os planos em blocos com sessão própria (usada durante o streaming)"""
+    with SessionLocal() as db:
+        for start in range(0, len(plan_ids), BULK_EXPORT_CHUNK):
+            chunk = plan_ids[start:start + BULK_EXPORT_CHUNK]
+            for plan in db.query(Plan).filter(Plan.id.in_(chunk)).order_by(Plan.id):
+                yield plan.id, _to_dict(plan)
+            db.expunge_all()
+
+@app.post("/exports/bulk")
+@limiter.limit("5/minute")  # Uma requisição cobre centenas de planos
+def export_bulk(request: Request, payload: BulkExportRequest, db: Session = Depends(get_db)):
+    """Exporta vários planos em um ZIP (streaming) ou em um PDF único com sumário"""
+    plan_ids = _bulk_plan_ids(db, payload)
+    audit_log(db, action=f"export_bulk_{payload.format}", detail=f"{len(plan_ids)} plans ({payload.kind})")
+
+    if payload.format == "pdf":
+        plans = [data for _, data in _iter_plan_data(plan_ids)]
+        key = cache_key({"plans": plans}, "pdf-merged", PDF_TEMPLATE_VERSION)
+        path = cache_lookup(key, "pdf")
+        if not path:
+            path = export_queue.render(key, "pdf", generate_plans_pdf, plans=plans).result()
+        return send_file(request, path, etag=key, filename="plans.pdf", media_type=EXPORT_MEDIA_TYPES["pdf"])
+
+    logo_path = os.environ.get("REPORT_LOGO_PATH") if payload.kind == "html" else None
+    items = (
+        (plan_id, _export_key(data, payload.kind)[0], data)
+        for plan_id, data in _iter_plan_data(plan_ids)
+    )
+    return StreamingResponse(
+        iter_zip(render_many(items, payload.kind, logo_path), payload.kind),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="plans.zip"'},
+    )
+
+
+def _validate_evidence_file(filename: str | None, content_type: str | None):
     # Validação de nome de arquivo
-    if not file.filename:
+    if not filename:
         raise HTTPException(status_code=400, detail="Filename is required")
     
     # Validação de extensão
-    file_ext = Path(file.filename).suffix.lower()
+    file_ext = Path(filename).suffix.lower()
     if file_ext not in ALLOWED_EXTENSIONS:
         raise HTTPException(
             status_code=400,
@@ -331,74 +713,43 @@ async def upload_evidence(request: Request, plan_id: int = Form(...), file: Uplo
         )
     
     # Validação de MIME type (se disponível)
-    if file.content_type and file.content_type not in ALLOWED_MIME_TYPES:
+    if content_type and content_type not in ALLOWED_MIME_TYPES:
         raise HTTPException(
             status_code=400,
-            detail=f"File MIME type not allowed: {file.content_type}"
+            detail=f"File MIME type not allowed: {content_type}"
         )
+
+@app.post("/evidence/upload", response_model=EvidenceRead)
+@limiter.limit("5/minute")  # Upload é mais restritivo (arquivos grandes)
+async def upload_evidence(request: Request, plan_id: int = Form(...), file: UploadFile = File(...), db: Session = Depends(get_db)):
+    plan = db.get(Plan, plan_id)
+    if not plan:
+        raise HTTPException(status_code=404, detail="Plan not found")
     
-    # Ler arquivo em chunks para validar tamanho antes de carregar tudo na memória
-    os.makedirs("uploads", exist_ok=True)
-    content = b""
-    chunk_size = 1024 * 1024  # 1MB por chunk
+    _validate_evidence_file(file.filename, file.content_type)
     
     try:
-        while True:
-            chunk = await file.read(chunk_size)
-            if not chunk:
-                break
-            
-            # Verificar tamanho acumulado
-            if len(content) + len(chunk) > MAX_FILE_SIZE:
-                raise HTTPException(
-                    status_code=413,
-                    detail=f"File too large. Maximum size: {MAX_FILE_SIZE / (1024 * 1024):.0f}MB"
-                )
-            
-            content += chunk
-        
-        # Verificar tamanho final
-        if len(content) == 0:
-            raise HTTPException(status_code=400, detail="File is empty")
-        
-        if len(content) > MAX_FILE_SIZE:
+        # Grava em blocos no armazenamento endereçado por conteúdo (hash incremental)
+        try:
+            blob = await store_upload(file, MAX_FILE_SIZE)
+        except FileTooLargeError:
             raise HTTPException(
                 status_code=413,
                 detail=f"File too large. Maximum size: {MAX_FILE_SIZE / (1024 * 1024):.0f}MB"
             )
+        except EmptyFileError:
+            raise HTTPException(status_code=400, detail="File is empty")
         
-        # Calcular hash SHA-256
-        sha256 = hashlib.sha256(content).hexdigest()
-        
-        # Salvar arquivo
+        sha256 = blob.sha256
         # Sanitizar nome do arquivo para evitar path traversal
         safe_filename = os.path.basename(file.filename)
-        path = os.path.join("uploads", safe_filename)
-        
-        # Se arquivo já existe com mesmo hash, não duplicar
-        if os.path.exists(path):
-            existing_hash = hashlib.sha256(open(path, "rb").read()).hexdigest()
-            if existing_hash == sha256:
-                # Arquivo já existe, apenas criar referência no banco
-                pass
-            else:
-                # Nome igual mas conteúdo diferente, adicionar sufixo
-                base_name, ext = os.path.splitext(safe_filename)
-                counter = 1
-                while os.path.exists(path):
-                    safe_filename = f"{base_name}_{counter}{ext}"
-                    path = os.path.join("uploads", safe_filename)
-                    counter += 1
-        
-        with open(path, "wb") as f:
-            f.write(content)
         
         # Criar registro no banco
-        ev = Evidence(plan_id=plan.id, filename=safe_filename, sha256=sha256, size=len(content))
+        ev = Evidence(plan_id=plan.id, filename=safe_filename, sha256=sha256, size=blob.size)
         db.add(ev)
+        audit_log(db, action="upload_evidence", detail=f"{safe_filename} {sha256} ({blob.size} bytes)", plan_id=plan.id, transaction=True)
         db.commit()
         db.refresh(ev)
-        audit_log(db, action="upload_evidence", detail=f"{safe_filename} {sha256} ({len(content)} bytes)", plan_id=plan.id)
         
         return EvidenceRead(id=ev.id, filename=ev.filename, sha256=ev.sha256, size=ev.size)
     
@@ -413,35 +764,237 @@ async def upload_evidence(request: Request, plan_id: int = Form(...), file: Uplo
             detail="An error occurred while uploading the file. Please try again."
         )
 
-# Endpoints de Backup e Recuperação
-@app.post("/backup/create")
-def create_backup_endpoint(db: Session = Depends(get_db)):
-    """Cria um backup do banco de dados"""
+@app.get("/evidence/{evidence_id}")
+@limiter.limit("60/minute")
+def download_evidence(request: Request, evidence_id: int, db: Session = Depends(get_db)):
+    """Baixa o arquivo de uma evidência (streaming, Range e ETag = SHA-256)"""
+    ev = db.get(Evidence, evidence_id)
+    if not ev:
+        raise HTTPException(status_code=404, detail="Evidence not found")
+    path = resolve_evidence_path(ev.sha256, ev.filename)
+    if not path:
+        raise HTTPException(status_code=404, detail="Evidence file not found")
+    response = send_file(request, path, etag=ev.sha256, filename=ev.filename)
+    if response.status_code in (200, 206):
+        audit_log(db, action="download_evidence", detail=f"{ev.filename} {request.headers.get('range', 'full')}", plan_id=ev.plan_id)
+    return response
+
+# Upload em blocos (retomável): iniciar → PUT blocos com offset → finalizar
+def _upload_status(upload: EvidenceUpload) -> EvidenceUploadStatus:
+    return EvidenceUploadStatus(
+        upload_id=upload.id,
+        plan_id=upload.plan_id,
+        filename=upload.filename,
+        size=upload.size,
+        offset=upload.received,
+        chunk_size=UPLOAD_CHUNK_MAX_SIZE,
+    )
+
+def _get_upload(db: Session, upload_id: str) -> EvidenceUpload:
+    upload = db.get(EvidenceUpload, upload_id)
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return upload
+
+@app.post("/evidence/uploads", response_model=EvidenceUploadStatus)
+@limiter.limit("10/minute")
+def create_evidence_upload(request: Request, payload: EvidenceUploadCreate, db: Session = Depends(get_db)):
+    """Inicia um upload em blocos e retorna o upload_id"""
+    if not db.get(Plan, payload.plan_id):
+        raise HTTPException(status_code=404, detail="Plan not found")
+    _validate_evidence_file(payload.filename, payload.content_type)
+    if payload.size > MAX_CHUNKED_FILE_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File too large. Maximum size: {MAX_CHUNKED_FILE_SIZE / (1024 * 1024):.0f}MB"
+        )
+    upload = EvidenceUpload(
+        id=uuid.uuid4().hex,
+        plan_id=payload.plan_id,
+        filename=os.path.basename(payload.filename),
+        content_type=payload.content_type,
+        size=payload.size,
+        sha256=payload.sha256.lower(),
+        received=0,
+    )
+    db.add(upload)
+    db.commit()
+    return _upload_status(upload)
+
+@app.get("/evidence/uploads/{upload_id}", response_model=EvidenceUploadStatus)
+@limiter.limit("120/minute")
+def get_evidence_upload(request: Request, upload_id: str, db: Session = Depends(get_db)):
+    """Estado do upload (offset a partir do qual o cliente deve retomar)"""
+    upload = _get_upload(db, upload_id)
+    # O arquivo parcial é a fonte da verdade (cobre falhas entre a escrita e o commit)
+    upload.received = partial_size(upload.id)
+    return _upload_status(upload)
+
+@app.put("/evidence/uploads/{upload_id}", response_model=EvidenceUploadStatus)
+@limiter.limit("600/minute")  # Um arquivo grande gera centenas de blocos
+async def put_evidence_chunk(request: Request, upload_id: str, offset: int = Query(..., ge=0), db: Session = Depends(get_db)):
+    """
+    Recebe um bloco (corpo bruto) na posição offset; X-Chunk-SHA256 opcional verifica o bloco
+
+    Blocos simultâneos para o mesmo upload não são intercalados: o segundo recebe 409.
+    """
+    upload = _get_upload(db, upload_id)
+    max_bytes = min(UPLOAD_CHUNK_MAX_SIZE, upload.size - offset)
     try:
-        backup_path = create_backup()
-        audit_log(db, action="backup_create", detail=f"Backup created: {backup_path}")
-        
-        # Limpar backups antigos após criar novo
-        cleanup_old_backups()
-        
-        return {
-            "status": "success",
-            "message": "Backup created successfully",
-            "backup_path": backup_path,
-            "created_at": datetime.datetime.now().isoformat()
-        }
-    except Exception as e:
-        audit_log(db, action="backup_error", detail=f"Error creating backup: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error creating backup: {str(e)}")
+        upload.received = await append_chunk(
+            upload.id, offset, request.stream(), max_bytes,
+            expected_sha256=request.headers.get("X-Chunk-SHA256"),
+        )
+    except OffsetMismatchError as e:
+        raise HTTPException(status_code=409, detail={"message": "Offset mismatch", "offset": e.offset})
+    except UploadBusyError:
+        raise HTTPException(status_code=409, detail={"message": "Upload busy", "offset": partial_size(upload.id)})
+    except FileTooLargeError:
+        raise HTTPException(status_code=413, detail=f"Chunk too large. Maximum: {max_bytes} bytes")
+    except ChecksumMismatchError:
+        raise HTTPException(status_code=400, detail="Chunk SHA-256 mismatch")
+    db.commit()
+    return _upload_status(upload)
+
+@app.post("/evidence/uploads/{upload_id}/complete", response_model=EvidenceRead)
+@limiter.limit("10/minute")
+def complete_evidence_upload(request: Request, upload_id: str, db: Session = Depends(get_db)):
+    """Verifica tamanho e SHA-256 final e registra a evidência"""
+    upload = _get_upload(db, upload_id)
+    if not upload.sha256:
+        # Uploads iniciados antes do SHA-256 ser obrigatório
+        raise HTTPException(status_code=400, detail="SHA-256 required; restart the upload with sha256")
+    received = partial_size(upload.id)
+    if received != upload.size:
+        raise HTTPException(status_code=409, detail={"message": "Upload incomplete", "offset": received})
+    try:
+        blob = finalize_partial(upload.id, expected_sha256=upload.sha256)
+    except UploadBusyError:
+        raise HTTPException(status_code=409, detail={"message": "Upload busy", "offset": received})
+    except ChecksumMismatchError:
+        db.delete(upload)
+        db.commit()
+        raise HTTPException(status_code=400, detail="File SHA-256 mismatch; upload discarded")
+    ev = Evidence(plan_id=upload.plan_id, filename=upload.filename, sha256=blob.sha256, size=blob.size)
+    db.add(ev)
+    db.delete(upload)
+    audit_log(db, action="upload_evidence", detail=f"{ev.filename} {ev.sha256} ({ev.size} bytes, chunked)", plan_id=ev.plan_id, transaction=True)
+    db.commit()
+    db.refresh(ev)
+    return EvidenceRead(id=ev.id, filename=ev.filename, sha256=ev.sha256, size=ev.size)
+
+@app.delete("/evidence/uploads/{upload_id}")
+@limiter.limit("30/minute")
+def abort_evidence_upload(request: Request, upload_id: str, db: Session = Depends(get_db)):
+    """Cancela um upload em blocos e descarta os dados recebidos"""
+    upload = _get_upload(db, upload_id)
+    try:
+        discard_partial(upload.id)
+    except UploadBusyError:
+        raise HTTPException(status_code=409, detail={"message": "Upload busy", "offset": partial_size(upload.id)})
+    db.delete(upload)
+    db.commit()
+    return {"status": "aborted", "upload_id": upload_id}
+
+# Endpoints de Auditoria
+def _audit_query(db: Session, plan_id, action, actor, since, until):
+    q = db.query(AuditLog)
+    if plan_id is not None:
+        q = q.filter(AuditLog.plan_id == plan_id)
+    if action is not None:
+        q = q.filter(AuditLog.action == action)
+    if actor is not None:
+        q = q.filter(AuditLog.actor == actor)
+    if since is not None or until is not None:
+        period = []
+        if since is not None:
+            period.append(AuditLog.created_at >= since)
+        if until is not None:
+            period.append(AuditLog.created_at < until)
+        # O período vira também uma faixa de ids (lida no índice (created_at, id)): a consulta
+        # percorre a chave primária na ordem do cursor, sem varrer a tabela nem ordenar
+        low, high = db.query(func.min(AuditLog.id), func.max(AuditLog.id)).filter(*period).one()
+        if low is None:
+            return q.filter(false())
+        q = q.filter(*period, AuditLog.id.between(low, high))
+    return q
+
+@app.get("/audit", response_model=AuditLogPage)
+@limiter.limit("30/minute")
+def list_audit_logs(
+    request: Request,
+    plan_id: int | None = None,
+    action: str | None = None,
+    actor: str | None = None,
+    since: datetime.datetime | None = Query(None, description="Início (inclusive), ISO 8601 UTC"),
+    until: datetime.datetime | None = Query(None, description="Fim (exclusive), ISO 8601 UTC"),
+    limit: int = Query(PLANS_PAGE_SIZE, ge=1, le=PLANS_MAX_PAGE_SIZE),
+    after: int | None = Query(None, description="Cursor: id do último evento da página anterior"),
+    db: Session = Depends(get_db),
+):
+    """Consulta a trilha de auditoria (mais recentes primeiro) com filtros e paginação por cursor"""
+    # Garante que eventos ainda na fila apareçam na consulta
+    audit_writer.flush()
+    q = _audit_query(db, plan_id, action, actor, since, until)
+    rows, next_cursor = _keyset_page(q, limit, after, key=AuditLog.id)
+    return AuditLogPage(items=[AuditLogRead.model_validate(r) for r in rows], next_cursor=next_cursor)
+
+@app.get("/audit/export")
+@limiter.limit("5/minute")  # Exportações podem cobrir meses de eventos
+def export_audit_logs(
+    request: Request,
+    plan_id: int | None = None,
+    action: str | None = None,
+    actor: str | None = None,
+    since: datetime.datetime | None = Query(None, description="Início (inclusive), ISO 8601 UTC"),
+    until: datetime.datetime | None = Query(None, description="Fim (exclusive), ISO 8601 UTC"),
+):
+    """Exporta a trilha de auditoria em NDJSON (ordem cronológica), lida e enviada em blocos"""
+    audit_writer.flush()
+
+    def generate():
+        # Sessão própria: a dependência get_db é encerrada antes do fim do streaming
+        with SessionLocal() as db:
+            q = _audit_query(db, plan_id, action, actor, since, until)
+            last_id = 0
+            while True:
+                rows = q.filter(AuditLog.id > last_id).order_by(AuditLog.id).limit(AUDIT_EXPORT_CHUNK).all()
+                if not rows:
+                    break
+                yield "".join(AuditLogRead.model_validate(r).model_dump_json() + "\n" for r in rows)
+                last_id = rows[-1].id
+                db.expunge_all()
+
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="audit_logs.ndjson"'},
+    )
+
+# Endpoints de Backup e Recuperação
+# Criação e restauração rodam na thread de backup: os endpoints retornam o job (202)
+# e o andamento é consultado em GET /backup/jobs/{job_id}
+@app.post("/backup/create", response_model=BackupJobRead, status_code=202)
+def create_backup_endpoint():
+    """Enfileira um backup do banco de dados (seguido da limpeza de retenção)"""
+    return backup_worker.submit("create")
+
+
+@app.get("/backup/jobs/{job_id}", response_model=BackupJobRead)
+def get_backup_job(job_id: str):
+    """Estado de um job de backup/restauração"""
+    job = backup_worker.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Backup job not found")
+    return job
 
 
 @app.get("/backup/list")
-def list_backups_endpoint(db: Session = Depends(get_db)):
-    """Lista todos os backups disponíveis"""
+def list_backups_endpoint():
+    """Lista todos os backups disponíveis (leitura do catálogo; não gera auditoria)"""
     try:
         backups = list_backups()
         stats = get_backup_stats()
-        audit_log(db, action="backup_list", detail=f"Listed {len(backups)} backups")
         
         return {
             "backups": backups,
@@ -451,34 +1004,33 @@ def list_backups_endpoint(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Error listing backups: {str(e)}")
 
 
-@app.post("/backup/restore/{backup_filename}")
-def restore_backup_endpoint(backup_filename: str, db: Session = Depends(get_db)):
-    """Restaura um backup específico"""
-    try:
-        from .services.backup import BACKUP_DIR
-        backup_path = os.path.join(BACKUP_DIR, backup_filename)
-        
-        if not os.path.exists(backup_path):
-            raise HTTPException(status_code=404, detail="Backup file not found")
-        
-        success = restore_backup(backup_path)
-        
-        if success:
-            audit_log(db, action="backup_restore", detail=f"Backup restored: {backup_filename}")
-            return {
-                "status": "success",
-                "message": "Backup restored successfully",
-                "backup_file": backup_filename,
-                "restored_at": datetime.datetime.now().isoformat()
-            }
-        else:
-            raise HTTPException(status_code=500, detail="Failed to restore backup")
-    
-    except HTTPException:
-        raise
-    except Exception as e:
-        audit_log(db, action="backup_restore_error", detail=f"Error restoring backup: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error restoring backup: {str(e)}")
+def _backup_file_path(backup_filename: str) -> str:
+    """Caminho de um backup em BACKUP_DIR; 404 para qualquer outro arquivo (catálogo, temporários)"""
+    backup_path = os.path.join(BACKUP_DIR, backup_filename)
+    if (
+        not is_backup_file(backup_filename)
+        or os.path.dirname(os.path.abspath(backup_path)) != os.path.abspath(BACKUP_DIR)
+        or not os.path.exists(backup_path)
+    ):
+        raise HTTPException(status_code=404, detail="Backup file not found")
+    return backup_path
+
+
+@app.post("/backup/restore/{backup_filename}", response_model=BackupJobRead, status_code=202)
+def restore_backup_endpoint(backup_filename: str):
+    """Enfileira a restauração de um backup específico"""
+    backup_path = _backup_file_path(backup_filename)
+    return backup_worker.submit("restore", backup_path)
+
+
+@app.post("/backup/verify/{backup_filename}", response_model=BackupJobRead, status_code=202)
+def verify_backup_endpoint(
+    backup_filename: str,
+    mode: str = Query("full", pattern="^(quick|full)$", description="quick: PRAGMA quick_check; full: PRAGMA integrity_check"),
+):
+    """Enfileira a verificação de um backup (padrão: PRAGMA integrity_check completo)"""
+    backup_path = _backup_file_path(backup_filename)
+    return backup_worker.submit("verify", backup_path, mode=mode)
 
 
 @app.get("/backup/stats")
@@ -489,3 +1041,14 @@ def backup_stats_endpoint(db: Session = Depends(get_db)):
         return stats
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting backup stats: {str(e)}")
+
+
+# Modo async (DB_MODE=async): substitui os endpoints síncronos de planos pelas versões com AsyncSession
+if DB_MODE == "async":
+    from .async_routes import router as async_router
+    _async_paths = {(r.path, m) for r in async_router.routes for m in r.methods}
+    app.router.routes = [
+        r for r in app.router.routes
+        if not (isinstance(r, APIRoute) and any((r.path, m) in _async_paths for m in r.methods))
+    ]
+    app.include_router(async_router)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, ForeignKey, Index
 from sqlalchemy.sql import func
 from ..db.database import Base
 
@@ -29,3 +29,82 @@ class Evidence(Base):
     sha256 = Column(String(64), nullable=False)
     size = Column(Integer, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class EvidenceUpload(Base):
+    """Upload em blocos em andamento (estado persistido para retomada)"""
+    __tablename__ = "evidence_uploads"
+    id = Column(String(32), primary_key=True)
+    plan_id = Column(Integer, nullable=False, index=True)
+    filename = Column(String(255), nullable=False)
+    content_type = Column(String(255), nullable=True)
+    size = Column(BigInteger, nullable=False)
+    sha256 = Column(String(64), nullable=True)
+    received = Column(BigInteger, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+class ExportJob(Base):
+    """Exportação de relatório enfileirada no pool de processos"""
+    __tablename__ = "export_jobs"
+    id = Column(String(32), primary_key=True)
+    plan_id = Column(Integer, nullable=False, index=True)
+    format = Column(String(10), nullable=False)
+    status = Column(String(20), nullable=False, default="queued", index=True)
+    cache_key = Column(String(64), nullable=False)
+    error = Column(Text, nullable=True)
+    owner = Column(String(32), nullable=True)  # Processo da API que executa o job (ExportWorker.id)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+class ExportWorker(Base):
+    """Processo da API que executa jobs de exportação, com batimento periódico"""
+    __tablename__ = "export_workers"
+    id = Column(String(32), primary_key=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=False)
+
+class PlanPir(Base):
+    """PIR normalizada (espelho relacional de Plan.pirs para consultas entre planos)"""
+    __tablename__ = "pirs"
+    id = Column(Integer, primary_key=True, index=True)
+    plan_id = Column(Integer, ForeignKey("plans.id", ondelete="CASCADE"), nullable=False, index=True)
+    position = Column(Integer, nullable=False)
+    aspect_ref = Column(Integer, nullable=True)
+    question = Column(Text, nullable=False)
+    priority = Column(String(20), nullable=False, default="media", index=True)
+    justification = Column(Text, nullable=True)
+
+class PlanCollectionTask(Base):
+    """Tarefa de coleta normalizada (espelho relacional de Plan.collection)"""
+    __tablename__ = "collection_tasks"
+    id = Column(Integer, primary_key=True, index=True)
+    plan_id = Column(Integer, ForeignKey("plans.id", ondelete="CASCADE"), nullable=False, index=True)
+    position = Column(Integer, nullable=False)
+    pir_index = Column(Integer, nullable=False)
+    source = Column(Text, nullable=False)
+    method = Column(Text, nullable=False)
+    frequency = Column(String(20), nullable=False, default="unico", index=True)
+    owner = Column(String(200), nullable=False, index=True)
+    sla_hours = Column(Integer, nullable=False, default=0, index=True)
+
+class SchemaMigration(Base):
+    """Registro das migrações de dados já aplicadas"""
+    __tablename__ = "schema_migrations"
+    name = Column(String(100), primary_key=True)
+    applied_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class AuditLog(Base):
+    __tablename__ = "audit_logs"
+    # A paginação e a exportação percorrem os eventos por id: os índices terminam em id
+    # para que o filtro e a ordenação usem o mesmo índice (sem ordenação temporária);
+    # (created_at, id) converte o período (since/until) em uma faixa de ids
+    __table_args__ = (
+        Index("ix_audit_logs_plan_id_id", "plan_id", "id"),
+        Index("ix_audit_logs_action_id", "action", "id"),
+        Index("ix_audit_logs_created_at_id", "created_at", "id"),
+    )
+    id = Column(Integer, primary_key=True)
+    plan_id = Column(Integer, nullable=True)
+    action = Column(Text)
+    detail = Column(Text)
+    actor = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
 from typing import List, Optional, Literal
+from datetime import datetime
 
 class Subject(BaseModel):
     what: str
@@ -40,6 +41,55 @@ class EvidenceRead(BaseModel):
     sha256: str
     size: int
 
+class EvidenceUploadCreate(BaseModel):
+    plan_id: int
+    filename: str
+    size: int = Field(gt=0)
+    sha256: str = Field(pattern=r"^[0-9a-fA-F]{64}$")  # Obrigatório: conferido ao finalizar
+    content_type: Optional[str] = None
+
+class EvidenceUploadStatus(BaseModel):
+    upload_id: str
+    plan_id: int
+    filename: str
+    size: int
+    offset: int
+    chunk_size: int
+
+class ExportJobCreate(BaseModel):
+    plan_id: int
+    format: Literal["pdf","html"] = "pdf"
+
+class ExportJobRead(BaseModel):
+    job_id: str
+    plan_id: int
+    format: str
+    status: Literal["queued","done","failed"]
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    download_url: Optional[str] = None
+
+class BackupJobRead(BaseModel):
+    job_id: str
+    kind: Literal["create","restore","verify"]
+    status: Literal["queued","running","done","failed"]
+    trigger: str = "api"
+    backup_file: Optional[str] = None
+    mode: Optional[Literal["quick","full"]] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class BulkExportRequest(BaseModel):
+    plan_ids: Optional[List[int]] = None
+    created_since: Optional[datetime] = None
+    created_until: Optional[datetime] = None
+    pir_priority: Optional[Literal["baixa","media","alta","critica"]] = None
+    format: Literal["zip","pdf"] = "zip"
+    kind: Literal["pdf","html"] = "pdf"
+
 class PlanBase(BaseModel):
     title: str = "Plano de Inteligência"
     subject: Subject
@@ -63,3 +113,65 @@ class PlanRead(PlanBase):
     evidences: List[EvidenceRead] = Field(default_factory=list)
     class Config:
         from_attributes = True
+
+class PlanPage(BaseModel):
+    items: List[PlanRead] = Field(default_factory=list)
+    next_cursor: Optional[int] = None
+
+class PlanImportResult(BaseModel):
+    index: int
+    status: Literal["created","error"]
+    id: Optional[int] = None
+    errors: Optional[List[dict]] = None
+
+class PlanImportReport(BaseModel):
+    created: int = 0
+    failed: int = 0
+    truncated: bool = False  # Limite de linhas atingido: as linhas seguintes não foram lidas
+    results: List[PlanImportResult] = Field(default_factory=list)
+
+class PlanSummary(BaseModel):
+    id: int
+    title: str
+    secrecy: Optional[str] = None
+    deadline: Optional[Deadline] = None
+
+class PlanSummaryPage(BaseModel):
+    items: List[PlanSummary] = Field(default_factory=list)
+    next_cursor: Optional[int] = None
+
+class PIRRead(PIR):
+    id: int
+    plan_id: int
+    position: int
+    class Config:
+        from_attributes = True
+
+class PIRPage(BaseModel):
+    items: List[PIRRead] = Field(default_factory=list)
+    next_cursor: Optional[int] = None
+
+class CollectionTaskRead(CollectionTask):
+    id: int
+    plan_id: int
+    position: int
+    class Config:
+        from_attributes = True
+
+class CollectionTaskPage(BaseModel):
+    items: List[CollectionTaskRead] = Field(default_factory=list)
+    next_cursor: Optional[int] = None
+
+class AuditLogRead(BaseModel):
+    id: int
+    plan_id: Optional[int] = None
+    action: Optional[str] = None
+    detail: Optional[str] = None
+    actor: Optional[str] = None
+    created_at: Optional[datetime] = None
+    class Config:
+        from_attributes = True
+
+class AuditLogPage(BaseModel):
+    items: List[AuditLogRead] = Field(default_factory=list)
+    next_cursor: Optional[int] = None
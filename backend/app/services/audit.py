@@ -1,8 +1,227 @@
+"""
+Trilha de auditoria com escrita em lote
+
+Por padrão os eventos vão para um buffer em memória e uma thread os grava em
+lotes (por tamanho ou intervalo), evitando um commit/fsync por requisição.
+O buffer é descarregado de forma síncrona no shutdown da aplicação.
+
+Eventos de auditoria não são descartados: um lote que falha volta para o buffer e é
+tentado de novo (até AUDIT_WRITE_RETRIES vezes); esgotadas as tentativas, os eventos
+são gravados um a um e os que ainda falharem vão para AUDIT_FALLBACK_FILE (NDJSON).
+"""
+import os
+import json
+import threading
+import time
+import logging
+from datetime import datetime, timezone
+from sqlalchemy import event, insert
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from ..db.database import SessionLocal
+from ..models.models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+# AUDIT_BUFFERED=false grava cada evento imediatamente (um commit por evento)
+AUDIT_BUFFERED = os.environ.get("AUDIT_BUFFERED", "true").lower() == "true"
+# AUDIT_IN_TRANSACTION=true grava eventos de operações de escrita na mesma transação do negócio
+AUDIT_IN_TRANSACTION = os.environ.get("AUDIT_IN_TRANSACTION", "false").lower() == "true"
+AUDIT_BATCH_SIZE = int(os.environ.get("AUDIT_BATCH_SIZE", 200))
+AUDIT_FLUSH_INTERVAL = float(os.environ.get("AUDIT_FLUSH_INTERVAL", 1.0))  # segundos
+AUDIT_WRITE_RETRIES = int(os.environ.get("AUDIT_WRITE_RETRIES", 5))
+# Destino dos eventos que não puderam ser gravados no banco
+AUDIT_FALLBACK_FILE = os.environ.get("AUDIT_FALLBACK_FILE", "audit_fallback.ndjson")
+
+
+class AuditWriter:
+    """Buffer de eventos de auditoria gravados em lote por uma thread em segundo plano"""
+
+    def __init__(self, session_factory=SessionLocal, batch_size: int = AUDIT_BATCH_SIZE,
+                 flush_interval: float = AUDIT_FLUSH_INTERVAL, retries: int = AUDIT_WRITE_RETRIES,
+                 fallback_file: str = AUDIT_FALLBACK_FILE):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.fallback_file = fallback_file
+        self._buffer: list[dict] = []
+        self._buffer_started = 0.0
+        self._cond = threading.Condition()
+        # Mantido durante cada gravação para que flush() espere lotes em andamento
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Para a thread e grava tudo o que ainda estiver no buffer"""
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=self.flush_interval + 5)
+            self._thread = None
+        # Lotes que falharem voltam ao buffer até esgotar as tentativas (e ir para o arquivo)
+        self.flush()
+        while self._buffer:
+            self.flush()
+
+    def enqueue(self, entry: dict) -> None:
+        with self._cond:
+            if not self._buffer:
+                self._buffer_started = time.monotonic()
+            self._buffer.append(entry)
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify_all()
+        if self._thread is None:
+            self.start()
+
+    def flush(self) -> int:
+        """
+        Grava imediatamente todos os eventos pendentes; retorna quantos foram gravados
+
+        Eventos de um lote que falhou voltam ao buffer para a próxima tentativa.
+        """
+        with self._write_lock:
+            batch = self._take()
+            written = 0
+            for i in range(0, len(batch), self.batch_size):
+                written += self._write(batch[i:i + self.batch_size])
+            return written
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            with self._cond:
+                # Espera até o lote encher ou o evento mais antigo atingir o intervalo máximo
+                while not self._stop.is_set():
+                    if len(self._buffer) >= self.batch_size:
+                        break
+                    if self._buffer:
+                        remaining = self.flush_interval - (time.monotonic() - self._buffer_started)
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait(self.flush_interval)
+            if self._stop.is_set():
+                return
+            self.flush()
+
+    def _take(self) -> list[dict]:
+        with self._cond:
+            batch, self._buffer = self._buffer, []
+            return batch
 
-def log(db: Session, action: str, detail: str = "", plan_id: int | None = None, actor: str = "analyst"):
-    db.execute(text("CREATE TABLE IF NOT EXISTS audit_logs (id INTEGER PRIMARY KEY AUTOINCREMENT, plan_id INTEGER, action TEXT, detail TEXT, actor TEXT, created_at DATETIME DEFAULT CURRENT_TIMESTAMP)"))
-    db.execute(text("INSERT INTO audit_logs (plan_id, action, detail, actor) VALUES (:pid,:a,:d,:actor)"),
-               {"pid": plan_id, "a": action, "d": detail, "actor": actor})
+    def _write(self, batch: list[dict]) -> int:
+        """Grava um lote; em caso de erro o devolve ao buffer ou, sem tentativas, recorre ao fallback"""
+        try:
+            with self.session_factory() as db:
+                db.execute(insert(AuditLog), [_row(e) for e in batch])
+                db.commit()
+            return len(batch)
+        except Exception as e:
+            logger.warning(f"Error writing {len(batch)} audit events: {str(e)}")
+        retry = [e for e in batch if e.get("_attempts", 0) + 1 < self.retries]
+        exhausted = [e for e in batch if e.get("_attempts", 0) + 1 >= self.retries]
+        for entry in retry:
+            entry["_attempts"] = entry.get("_attempts", 0) + 1
+        self._requeue(retry)
+        return self._write_each(exhausted)
+
+    def _requeue(self, entries: list[dict]) -> None:
+        if not entries:
+            return
+        with self._cond:
+            # Conta o intervalo a partir de agora: a nova tentativa não é imediata
+            self._buffer_started = time.monotonic()
+            self._buffer[:0] = entries
+
+    def _write_each(self, entries: list[dict]) -> int:
+        """Grava os eventos um a um (isola um evento inválido); os que falharem vão para o arquivo"""
+        written = 0
+        failed = []
+        for i, entry in enumerate(entries):
+            try:
+                with self.session_factory() as db:
+                    db.execute(insert(AuditLog), [_row(entry)])
+                    db.commit()
+                written += 1
+            except OperationalError:
+                # Banco indisponível: não adianta tentar os demais
+                failed.extend(entries[i:])
+                break
+            except Exception:
+                failed.append(entry)
+        if failed:
+            self._spill(failed)
+        return written
+
+    def _spill(self, entries: list[dict]) -> None:
+        lines = "".join(json.dumps(_row(e), default=str) + "\n" for e in entries)
+        try:
+            with open(self.fallback_file, "a", encoding="utf-8") as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            logger.error(f"{len(entries)} audit events could not be written to the database; "
+                         f"saved to {self.fallback_file}")
+        except OSError as e:
+            # Último recurso: os eventos ficam no log
+            logger.critical(f"Audit events lost from the database and {self.fallback_file} ({str(e)}): {lines}")
+
+
+def _row(entry: dict) -> dict:
+    """Evento sem os campos de controle da fila"""
+    return {k: v for k, v in entry.items() if k != "_attempts"}
+
+
+audit_writer = AuditWriter()
+
+
+def log(db: Session, action: str, detail: str = "", plan_id: int | None = None, actor: str = "analyst",
+        transaction: bool = False):
+    """
+    Registra um evento de auditoria
+
+    Args:
+        transaction: True quando chamado dentro de uma transação de negócio ainda não
+            commitada; com AUDIT_IN_TRANSACTION=true o evento entra nessa transação
+            (o commit fica a cargo do chamador)
+    """
+    entry = {
+        "plan_id": plan_id,
+        "action": action,
+        "detail": detail,
+        "actor": actor,
+        "created_at": datetime.now(timezone.utc),
+    }
+    if transaction and (AUDIT_IN_TRANSACTION or not AUDIT_BUFFERED):
+        db.add(AuditLog(**entry))
+        return
+    if transaction:
+        # Só entra na fila se a transação do negócio for efetivada
+        db.info.setdefault("pending_audit", []).append(entry)
+        return
+    if AUDIT_BUFFERED:
+        audit_writer.enqueue(entry)
+        return
+    db.add(AuditLog(**entry))
     db.commit()
+
+
+@event.listens_for(Session, "after_commit")
+def _enqueue_pending(session: Session) -> None:
+    for entry in session.info.pop("pending_audit", []):
+        audit_writer.enqueue(entry)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session: Session) -> None:
+    session.info.pop("pending_audit", None)
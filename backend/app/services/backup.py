@@ -2,28 +2,245 @@
 Serviço de Backup e Recuperação do Banco de Dados
 """
 import os
-import shutil
 import sqlite3
+import subprocess
+import time
 from datetime import datetime, timedelta
 from pathlib import Path
 import logging
+from sqlalchemy.engine import make_url
+from ..db.database import BACKEND_DIR, DATABASE_PATH, SQLALCHEMY_DATABASE_URL, IS_SQLITE, pool_gate
+from ..db.schema import prepare_schema_at
+from . import backup_format, backup_catalog
 
 logger = logging.getLogger(__name__)
 
 # Configuração de backup
-# Determinar caminho do diretório do backend (subir 2 níveis: app/services -> backend)
-BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 BACKUP_DIR = os.environ.get("BACKUP_DIR", os.path.join(BACKEND_DIR, "backups"))
 RETENTION_DAYS = int(os.environ.get("BACKUP_RETENTION_DAYS", "30"))  # 30 dias por padrão
-DB_PATH = os.environ.get("DATABASE_PATH", os.path.join(BACKEND_DIR, "plans.db"))
+# Retenção por camadas: mantém o backup mais recente de cada uma das últimas N horas/dias/
+# semanas com backups. Com alguma camada > 0 substitui a retenção por idade (RETENTION_DAYS)
+BACKUP_KEEP_HOURLY = int(os.environ.get("BACKUP_KEEP_HOURLY", 0))
+BACKUP_KEEP_DAILY = int(os.environ.get("BACKUP_KEEP_DAILY", 0))
+BACKUP_KEEP_WEEKLY = int(os.environ.get("BACKUP_KEEP_WEEKLY", 0))
+DB_PATH = DATABASE_PATH
+
+# Backup online do SQLite (API de backup): páginas copiadas por passo e pausa entre passos,
+# para que escritores concorrentes não fiquem bloqueados durante toda a cópia
+BACKUP_PAGES_PER_STEP = int(os.environ.get("BACKUP_PAGES_PER_STEP", 1024))
+BACKUP_STEP_SLEEP = float(os.environ.get("BACKUP_STEP_SLEEP", 0.005))  # segundos
+
+# Formato dos backups SQLite: compressão (gzip, zstd ou none) e incrementais por página
+# (BACKUP_INCREMENTAL=true), com um backup completo a cada BACKUP_FULL_EVERY incrementais
+BACKUP_COMPRESSION = os.environ.get("BACKUP_COMPRESSION", "gzip").lower()
+BACKUP_INCREMENTAL = os.environ.get("BACKUP_INCREMENTAL", "false").lower() == "true"
+BACKUP_FULL_EVERY = int(os.environ.get("BACKUP_FULL_EVERY", 24))
+
+# Verificação do SQLite: "quick" (PRAGMA quick_check, padrão) ou "full" (PRAGMA integrity_check,
+# O(tamanho do banco) com validação de índices). A verificação completa fica para
+# POST /backup/verify ou para a varredura agendada (BACKUP_DEEP_SCAN_INTERVAL)
+BACKUP_VERIFY = os.environ.get("BACKUP_VERIFY", "quick").lower()
+VERIFY_PRAGMAS = {"quick": "quick_check", "full": "integrity_check"}
+
+# SQLite gera cópias .db (comprimidas: .db.gz/.db.zst; incrementais: .inc*);
+# PostgreSQL gera dumps no formato custom do pg_dump (.dump)
+BACKUP_EXTENSIONS = (".db", ".db.gz", ".db.zst", ".inc", ".inc.gz", ".inc.zst", ".dump")
+PG_DUMP_BIN = os.environ.get("PG_DUMP_BIN", "pg_dump")
+PG_RESTORE_BIN = os.environ.get("PG_RESTORE_BIN", "pg_restore")
 
 # Criar diretório de backups se não existir
 Path(BACKUP_DIR).mkdir(parents=True, exist_ok=True)
 
 
+def is_backup_file(filename: str) -> bool:
+    """Nome de um backup gerado por create_backup (somente estes podem ser verificados ou restaurados)"""
+    return filename.startswith("plans_backup_") and filename.endswith(BACKUP_EXTENSIONS)
+
+
+def _work_path(name: str) -> str:
+    """Arquivo temporário em BACKUP_DIR/.work (não altera o mtime de BACKUP_DIR, usado pelo catálogo)"""
+    work_dir = os.path.join(BACKUP_DIR, ".work")
+    os.makedirs(work_dir, exist_ok=True)
+    return os.path.join(work_dir, name)
+
+
+def _source_version(db_path: str) -> str | None:
+    """Última migração de dados aplicada no banco de origem (versão do esquema)"""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        row = conn.execute("SELECT name FROM schema_migrations ORDER BY applied_at DESC, name DESC LIMIT 1").fetchone()
+        return row[0] if row else None
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+
+
+def _catalog_entry(backup_path: str, integrity: str) -> dict:
+    """Entrada do catálogo de um backup recém-criado (integrity: verificação em que passou)"""
+    entry = backup_catalog.entry_from_file(BACKUP_DIR, os.path.basename(backup_path))
+    entry.update(
+        sha256=entry["sha256"] or backup_format.file_sha256(backup_path),
+        integrity=integrity,
+        verified_at=datetime.now().isoformat(),
+    )
+    return entry
+
+
+def _new_backup_path(extension: str, timestamp: str) -> str:
+    """Caminho de um novo backup; acrescenta um sufixo se já houver outro no mesmo segundo"""
+    path = os.path.join(BACKUP_DIR, f"plans_backup_{timestamp}{extension}")
+    n = 1
+    while os.path.exists(path):
+        n += 1
+        path = os.path.join(BACKUP_DIR, f"plans_backup_{timestamp}_{n}{extension}")
+    return path
+
+
+def _needs_materialize(backup_path: str) -> bool:
+    """Backups comprimidos ou incrementais precisam ser reconstruídos antes do uso"""
+    return not backup_path.endswith((".db", ".dump"))
+
+
+def _incremental_parent(page_size: int) -> tuple[str, dict] | None:
+    """Backup mais recente a usar como pai de um incremental (None: fazer um completo)"""
+    for backup in list_backups():
+        path = backup["path"]
+        if path.endswith(".dump"):
+            continue
+        manifest = backup_format.read_manifest(path)
+        if (
+            manifest
+            and manifest.get("page_size") == page_size
+            and manifest.get("depth", 0) < BACKUP_FULL_EVERY
+            and os.path.exists(backup_format.pages_path(path))
+        ):
+            return path, manifest
+        return None
+    return None
+
+
+def _store_snapshot(snapshot: str, timestamp: str) -> str:
+    """Grava um snapshot SQLite consistente como backup completo ou incremental (com manifesto)"""
+    compression = BACKUP_COMPRESSION if BACKUP_COMPRESSION in backup_format.COMPRESSION_SUFFIXES else "none"
+    suffix = backup_format.COMPRESSION_SUFFIXES.get(compression, "")
+    page_size = backup_format.sqlite_page_size(snapshot)
+    hashes, sha256 = backup_format.scan_pages(snapshot, page_size)
+    manifest = {
+        "format": 2,
+        "created_at": datetime.now().isoformat(),
+        "compression": compression,
+        "page_size": page_size,
+        "page_count": len(hashes) // backup_format.PAGE_HASH_SIZE,
+        "db_size": os.path.getsize(snapshot),
+        "sha256": sha256,
+        "source_version": _source_version(snapshot),
+        "sqlite_version": sqlite3.sqlite_version,
+    }
+
+    parent = _incremental_parent(page_size) if BACKUP_INCREMENTAL else None
+    if parent:
+        parent_path, parent_manifest = parent
+        backup_path = _new_backup_path(f".inc{suffix}", timestamp)
+        with open(backup_format.pages_path(parent_path), "rb") as f:
+            parent_hashes = f.read()
+        changed = backup_format.write_incremental(snapshot, backup_path, compression, page_size, hashes, parent_hashes)
+        manifest.update(
+            type="incremental",
+            parent=os.path.basename(parent_path),
+            base=parent_manifest.get("base") or os.path.basename(parent_path),
+            depth=parent_manifest.get("depth", 0) + 1,
+            changed_pages=changed,
+        )
+    else:
+        backup_path = _new_backup_path(f".db{suffix}", timestamp)
+        if compression == "none":
+            os.replace(snapshot, backup_path)
+        else:
+            backup_format.write_full(snapshot, backup_path, compression)
+        manifest.update(type="full", depth=0)
+
+    with open(backup_format.pages_path(backup_path), "wb") as f:
+        f.write(hashes)
+    manifest["file_sha256"] = backup_format.file_sha256(backup_path)
+    backup_format.write_manifest(backup_path, manifest)
+    backup_catalog.record(BACKUP_DIR, _catalog_entry(backup_path, _verify_pragma()))
+    return backup_path
+
+
+def _pg_dsn() -> str:
+    """URL libpq (sem o driver SQLAlchemy) para pg_dump/pg_restore"""
+    url = make_url(SQLALCHEMY_DATABASE_URL).set(drivername="postgresql")
+    return url.render_as_string(hide_password=False)
+
+
+def _pg_dump(backup_path: str) -> None:
+    subprocess.run(
+        [PG_DUMP_BIN, "--format=custom", f"--file={backup_path}", f"--dbname={_pg_dsn()}"],
+        check=True, capture_output=True,
+    )
+
+
+def _pg_restore(backup_path: str) -> None:
+    subprocess.run(
+        [PG_RESTORE_BIN, "--clean", "--if-exists", "--no-owner", f"--dbname={_pg_dsn()}", backup_path],
+        check=True, capture_output=True,
+    )
+
+
+def _verify_pg_dump(backup_path: str) -> bool:
+    """Valida um dump do PostgreSQL lendo seu índice (pg_restore --list)"""
+    try:
+        subprocess.run([PG_RESTORE_BIN, "--list", backup_path], check=True, capture_output=True)
+        logger.info(f"Backup integrity verified: {backup_path}")
+        return True
+    except (OSError, subprocess.CalledProcessError) as e:
+        logger.error(f"Error verifying backup: {str(e)}")
+        return False
+
+
+def _sqlite_online_backup(src_path: str, dest_path: str, pages: int = None, sleep: float = None) -> None:
+    """
+    Copia um banco SQLite em uso com sqlite3.Connection.backup(), em passos de `pages` páginas
+
+    Em modo WAL mantém uma transação de leitura na origem durante a cópia: o backup
+    reflete um único snapshot e os escritores continuam gravando no WAL. Sem WAL, a
+    API reinicia a cópia se a origem for alterada entre passos (o resultado é sempre
+    consistente). O destino é gravado em um arquivo temporário e renomeado ao final.
+    """
+    pages = BACKUP_PAGES_PER_STEP if pages is None else pages
+    sleep = BACKUP_STEP_SLEEP if sleep is None else sleep
+    tmp_path = f"{dest_path}.tmp"
+    src = sqlite3.connect(src_path, isolation_level=None, timeout=30)
+    dst = sqlite3.connect(tmp_path, isolation_level=None)
+    try:
+        if src.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal":
+            src.execute("BEGIN")
+            src.execute("SELECT count(*) FROM sqlite_master").fetchone()
+
+        def progress(status, remaining, total):
+            if remaining and sleep:
+                time.sleep(sleep)
+
+        src.backup(dst, pages=pages, progress=progress)
+        # Backup autocontido em um único arquivo (sem -wal/-shm)
+        dst.execute("PRAGMA journal_mode=DELETE")
+    except BaseException:
+        dst.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        if src.in_transaction:
+            src.execute("ROLLBACK")
+        src.close()
+    dst.close()
+    os.replace(tmp_path, dest_path)
+
+
 def create_backup(db_path: str = None) -> str:
     """
-    Cria um backup do banco de dados SQLite
+    Cria um backup do banco de dados (cópia SQLite ou pg_dump no PostgreSQL)
     
     Args:
         db_path: Caminho do banco de dados (padrão: DB_PATH)
@@ -31,61 +248,102 @@ def create_backup(db_path: str = None) -> str:
     Returns:
         Caminho do arquivo de backup criado
     """
+    # Gerar nome do backup com timestamp
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    if db_path is None and not IS_SQLITE:
+        backup_path = os.path.join(BACKUP_DIR, f"plans_backup_{timestamp}.dump")
+        _pg_dump(backup_path)
+        if not verify_backup(backup_path):
+            raise ValueError(f"Backup verification failed: {backup_path}")
+        backup_catalog.record(BACKUP_DIR, _catalog_entry(backup_path, "pg_restore_list"))
+        logger.info(f"Backup created successfully: {backup_path}")
+        return backup_path
+
     if db_path is None:
         db_path = DB_PATH
     
     if not os.path.exists(db_path):
         raise FileNotFoundError(f"Database file not found: {db_path}")
     
-    # Gerar nome do backup com timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    backup_filename = f"plans_backup_{timestamp}.db"
-    backup_path = os.path.join(BACKUP_DIR, backup_filename)
+    snapshot = _work_path(f".snapshot_{timestamp}_{os.getpid()}.db")
     
     try:
-        # Criar conexão com o banco para garantir que está fechado
-        conn = sqlite3.connect(db_path)
-        conn.close()
-        
-        # Copiar arquivo do banco de dados
-        shutil.copy2(db_path, backup_path)
+        # Backup online (inclui o conteúdo ainda no WAL, sem bloquear escritores)
+        _sqlite_online_backup(db_path, snapshot)
         
-        # Verificar integridade do backup
-        verify_backup(backup_path)
+        # Verificar integridade do snapshot antes de comprimir/gerar o incremental
+        if not verify_backup(snapshot):
+            raise ValueError(f"Backup verification failed: {snapshot}")
         
+        backup_path = _store_snapshot(snapshot, timestamp)
         logger.info(f"Backup created successfully: {backup_path}")
         return backup_path
     
     except Exception as e:
         logger.error(f"Error creating backup: {str(e)}")
         raise
+    finally:
+        if os.path.exists(snapshot):
+            os.remove(snapshot)
+
 
+def _verify_pragma(mode: str = None) -> str:
+    return VERIFY_PRAGMAS.get(mode or BACKUP_VERIFY, "quick_check")
 
-def verify_backup(backup_path: str) -> bool:
+
+def _checksum_matches(backup_path: str) -> bool | None:
+    """Compara o SHA-256 do arquivo com o registrado na criação (None: sem checksum registrado)"""
+    entry = backup_catalog.get(BACKUP_DIR, os.path.basename(backup_path)) or {}
+    expected = entry.get("sha256") or (backup_format.read_manifest(backup_path) or {}).get("file_sha256")
+    if not expected:
+        return None
+    return backup_format.file_sha256(backup_path) == expected
+
+
+def verify_backup(backup_path: str, mode: str = None) -> bool:
     """
     Verifica a integridade de um backup
     
     Args:
         backup_path: Caminho do arquivo de backup
+        mode: "quick" (PRAGMA quick_check) ou "full" (PRAGMA integrity_check); padrão: BACKUP_VERIFY
     
     Returns:
         True se o backup está íntegro
     """
+    if backup_path.endswith(".dump"):
+        return _verify_pg_dump(backup_path)
+
+    if _needs_materialize(backup_path):
+        # Reconstrói a cadeia (confere o SHA-256 do manifesto) e verifica o banco resultante
+        restored = _work_path(f".verify_{os.getpid()}_{os.path.basename(backup_path)}.db")
+        try:
+            backup_format.materialize(backup_path, restored)
+            return verify_backup(restored, mode)
+        except Exception as e:
+            logger.error(f"Error verifying backup: {str(e)}")
+            return False
+        finally:
+            if os.path.exists(restored):
+                os.remove(restored)
+
+    pragma = _verify_pragma(mode)
     try:
         conn = sqlite3.connect(backup_path)
         cursor = conn.cursor()
         
         # Verificar integridade do banco
-        cursor.execute("PRAGMA integrity_check")
+        cursor.execute(f"PRAGMA {pragma}")
         result = cursor.fetchone()
         
         conn.close()
         
         if result and result[0] == "ok":
-            logger.info(f"Backup integrity verified: {backup_path}")
+            logger.info(f"Backup integrity verified ({pragma}): {backup_path}")
             return True
         else:
-            logger.error(f"Backup integrity check failed: {backup_path}")
+            logger.error(f"Backup integrity check failed ({pragma}): {backup_path}")
             return False
     
     except Exception as e:
@@ -93,9 +351,53 @@ def verify_backup(backup_path: str) -> bool:
         return False
 
 
+def deep_verify_backup(backup_path: str = None, mode: str = "full") -> bool:
+    """
+    Verificação sob demanda/agendada de um backup catalogado (padrão: o mais recente),
+    registrando o resultado no catálogo
+    """
+    if backup_path is None:
+        backups = list_backups()
+        if not backups:
+            return True
+        backup_path = backups[0]["path"]
+    ok = verify_backup(backup_path, mode)
+    result = ("pg_restore_list" if backup_path.endswith(".dump") else _verify_pragma(mode)) if ok else "failed"
+    backup_catalog.set_verification(BACKUP_DIR, os.path.basename(backup_path), result)
+    return ok
+
+
+def _sqlite_restore(source_path: str, target_path: str) -> None:
+    """
+    Grava o backup sobre o banco pela API de backup do SQLite, no próprio arquivo
+
+    O conteúdo é substituído em uma única transação do SQLite (sem trocar o inode):
+    conexões ainda abertas no banco passam a ver o conteúdo restaurado em vez de
+    páginas antigas em cache/mmap, e o modo de journal do destino (WAL) é mantido.
+    """
+    src = sqlite3.connect(f"file:{source_path}?mode=ro", uri=True)
+    dst = sqlite3.connect(target_path, isolation_level=None, timeout=30)
+    try:
+        wal = dst.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal"
+        if wal and os.path.getsize(target_path) and (
+            src.execute("PRAGMA page_size").fetchone()[0] != dst.execute("PRAGMA page_size").fetchone()[0]
+        ):
+            # Em WAL o SQLite não altera o tamanho de página do destino
+            raise ValueError(f"Backup page size differs from the WAL database: {source_path}")
+        src.backup(dst)
+    finally:
+        src.close()
+        dst.close()
+
+
 def restore_backup(backup_path: str, target_db_path: str = None) -> bool:
     """
-    Restaura um backup do banco de dados
+    Restaura um backup do banco de dados com a API em execução (restauração a quente)
+    
+    O backup de segurança é copiado online, antes da pausa; depois as conexões do pool
+    são pausadas e drenadas apenas durante a restauração (API de backup do SQLite) e a
+    preparação do esquema (prepare_schema) e, ao final, os engines são descartados e
+    retomados.
     
     Args:
         backup_path: Caminho do arquivo de backup
@@ -104,37 +406,93 @@ def restore_backup(backup_path: str, target_db_path: str = None) -> bool:
     Returns:
         True se a restauração foi bem-sucedida
     """
-    if target_db_path is None:
-        target_db_path = DB_PATH
-    
     if not os.path.exists(backup_path):
         raise FileNotFoundError(f"Backup file not found: {backup_path}")
+    if not is_backup_file(os.path.basename(backup_path)):
+        # Ex.: o catálogo ou um backup de segurança passa na verificação, mas não é um backup
+        raise ValueError(f"Not a backup file: {backup_path}")
     
-    # Verificar integridade do backup antes de restaurar
-    if not verify_backup(backup_path):
-        raise ValueError(f"Backup file is corrupted: {backup_path}")
+    if backup_path.endswith(".dump"):
+        if not verify_backup(backup_path):
+            raise ValueError(f"Backup file is corrupted: {backup_path}")
+        # PostgreSQL: dump de segurança do estado atual e restauração via pg_restore
+        safety_backup = os.path.join(BACKUP_DIR, f"plans_safety_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.dump")
+        _pg_dump(safety_backup)
+        logger.info(f"Safety backup created before restore: {safety_backup}")
+        with pool_gate.paused():
+            _pg_restore(backup_path)
+            # Um dump anterior a uma atualização traz o esquema antigo
+            prepare_schema_at(SQLALCHEMY_DATABASE_URL)
+        logger.info(f"Backup restored successfully: {backup_path}")
+        return True
+
+    if target_db_path is None:
+        target_db_path = DB_PATH
+
+    source = backup_path
+    manifest = backup_format.read_manifest(backup_path) or {}
+    if _needs_materialize(backup_path):
+        # Comprimido/incremental: reconstrói a cadeia completa em um arquivo temporário
+        # (materialize confere o SHA-256 do banco reconstruído com o do manifesto)
+        source = _work_path(f".restore_{os.getpid()}_{os.path.basename(backup_path)}.db")
+        backup_format.materialize(backup_path, source)
+        checksum_ok = bool(manifest.get("sha256"))
+    else:
+        checksum_ok = _checksum_matches(backup_path)
+        if checksum_ok is False:
+            raise ValueError(f"Backup file checksum mismatch: {backup_path}")
     
     try:
-        # Criar backup do banco atual antes de restaurar (segurança)
+        # Conteúdo idêntico ao que passou na verificação da criação: dispensa reler o banco.
+        # Sem checksum registrado (backups antigos), verifica com BACKUP_VERIFY
+        entry = backup_catalog.get(BACKUP_DIR, os.path.basename(backup_path)) or {}
+        if not (checksum_ok and entry.get("integrity") in VERIFY_PRAGMAS.values()):
+            if not verify_backup(source):
+                raise ValueError(f"Backup file is corrupted: {backup_path}")
+
+        # Backup de segurança do banco atual com a cópia online incremental, antes da pausa:
+        # a API continua atendendo durante a cópia (escritas posteriores a ela seriam
+        # substituídas pela restauração de qualquer forma)
         if os.path.exists(target_db_path):
             safety_backup = f"{target_db_path}.safety_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            shutil.copy2(target_db_path, safety_backup)
+            _sqlite_online_backup(target_db_path, safety_backup)
             logger.info(f"Safety backup created before restore: {safety_backup}")
-        
-        # Restaurar backup
-        shutil.copy2(backup_path, target_db_path)
-        
-        # Verificar integridade do banco restaurado
-        if verify_backup(target_db_path):
-            logger.info(f"Backup restored successfully: {backup_path} -> {target_db_path}")
-            return True
-        else:
-            logger.error(f"Restored database integrity check failed")
-            return False
+
+        # Pausa curta de escrita: novos checkouts esperam só enquanto o banco é substituído
+        with pool_gate.paused():
+            # Restaurar backup (a origem já foi verificada; não repete a verificação no destino)
+            _sqlite_restore(source, target_db_path)
+            # O backup pode ser anterior a uma atualização: cria tabelas/índices ausentes e
+            # aplica as migrações, como na inicialização, antes de liberar as conexões
+            prepare_schema_at(f"sqlite:///{os.path.abspath(target_db_path)}")
+        logger.info(f"Backup restored successfully: {backup_path} -> {target_db_path}")
+        return True
     
     except Exception as e:
         logger.error(f"Error restoring backup: {str(e)}")
         raise
+    finally:
+        if source != backup_path and os.path.exists(source):
+            os.remove(source)
+
+
+def _tiered_keep(backups: list) -> set:
+    """Backups mantidos pelas camadas horária/diária/semanal (lista do mais recente ao mais antigo)"""
+    keep = {backups[0]["path"]} if backups else set()
+    for count, bucket in (
+        (BACKUP_KEEP_HOURLY, lambda d: (d.date(), d.hour)),
+        (BACKUP_KEEP_DAILY, lambda d: d.date()),
+        (BACKUP_KEEP_WEEKLY, lambda d: d.isocalendar()[:2]),
+    ):
+        seen = set()
+        for b in backups:
+            if len(seen) >= count:
+                break
+            key = bucket(datetime.fromisoformat(b["created_at"]))
+            if key not in seen:
+                seen.add(key)
+                keep.add(b["path"])
+    return keep
 
 
 def cleanup_old_backups(retention_days: int = None) -> int:
@@ -142,11 +500,13 @@ def cleanup_old_backups(retention_days: int = None) -> int:
     Remove backups antigos conforme política de retenção
     
     Args:
-        retention_days: Número de dias para manter backups (padrão: RETENTION_DAYS)
+        retention_days: Número de dias para manter backups (padrão: RETENTION_DAYS,
+            ou a retenção por camadas quando BACKUP_KEEP_* estiver configurado)
     
     Returns:
         Número de backups removidos
     """
+    tiered = retention_days is None and (BACKUP_KEEP_HOURLY or BACKUP_KEEP_DAILY or BACKUP_KEEP_WEEKLY)
     if retention_days is None:
         retention_days = RETENTION_DAYS
     
@@ -157,17 +517,31 @@ def cleanup_old_backups(retention_days: int = None) -> int:
     removed_count = 0
     
     try:
-        for filename in os.listdir(BACKUP_DIR):
-            if not filename.startswith("plans_backup_") or not filename.endswith(".db"):
+        backups = list_backups()
+        if tiered:
+            expired = {b["path"] for b in backups} - _tiered_keep(backups)
+        else:
+            expired = {b["path"] for b in backups if datetime.fromisoformat(b["created_at"]) < cutoff_date}
+        
+        # Incrementais dependem dos backups anteriores da cadeia: mantê-los enquanto
+        # algum backup retido precisar deles
+        required = set()
+        for b in backups:
+            if b["path"] in expired or b.get("type") != "incremental":
                 continue
-            
-            file_path = os.path.join(BACKUP_DIR, filename)
-            file_time = datetime.fromtimestamp(os.path.getmtime(file_path))
-            
-            if file_time < cutoff_date:
-                os.remove(file_path)
-                removed_count += 1
-                logger.info(f"Removed old backup: {filename}")
+            try:
+                required.update(backup_format.chain(b["path"]))
+            except backup_format.BackupFormatError as e:
+                logger.warning(f"Incomplete backup chain: {str(e)}")
+        
+        removed = []
+        for file_path in sorted(expired - required):
+            backup_format.remove(file_path)
+            removed.append(os.path.basename(file_path))
+            removed_count += 1
+            logger.info(f"Removed old backup: {os.path.basename(file_path)}")
+        if removed:
+            backup_catalog.forget(BACKUP_DIR, removed)
         
         logger.info(f"Cleanup completed: {removed_count} old backups removed")
         return removed_count
@@ -179,7 +553,7 @@ def cleanup_old_backups(retention_days: int = None) -> int:
 
 def list_backups() -> list:
     """
-    Lista todos os backups disponíveis
+    Lista todos os backups disponíveis (lidos do catálogo, sem varrer o diretório)
     
     Returns:
         Lista de dicionários com informações dos backups
@@ -187,27 +561,12 @@ def list_backups() -> list:
     if not os.path.exists(BACKUP_DIR):
         return []
     
-    backups = []
-    
     try:
-        for filename in os.listdir(BACKUP_DIR):
-            if not filename.startswith("plans_backup_") or not filename.endswith(".db"):
-                continue
-            
-            file_path = os.path.join(BACKUP_DIR, filename)
-            file_size = os.path.getsize(file_path)
-            file_time = datetime.fromtimestamp(os.path.getmtime(file_path))
-            
-            backups.append({
-                "filename": filename,
-                "path": file_path,
-                "size": file_size,
-                "created_at": file_time.isoformat(),
-                "age_days": (datetime.now() - file_time).days
-            })
-        
-        # Ordenar por data (mais recente primeiro)
-        backups.sort(key=lambda x: x["created_at"], reverse=True)
+        now = datetime.now()
+        backups = backup_catalog.entries(BACKUP_DIR, is_backup_file)
+        for b in backups:
+            b["path"] = os.path.join(BACKUP_DIR, b["filename"])
+            b["age_days"] = (now - datetime.fromisoformat(b["created_at"])).days
         return backups
     
     except Exception as e:
@@ -217,14 +576,14 @@ def list_backups() -> list:
 
 def get_backup_stats() -> dict:
     """
-    Retorna estatísticas dos backups
+    Retorna estatísticas dos backups (agregadas no catálogo)
     
     Returns:
         Dicionário com estatísticas
     """
-    backups = list_backups()
+    stats = backup_catalog.stats(BACKUP_DIR, is_backup_file) if os.path.exists(BACKUP_DIR) else {"total": 0}
     
-    if not backups:
+    if not stats["total"]:
         return {
             "total_backups": 0,
             "total_size": 0,
@@ -232,14 +591,11 @@ def get_backup_stats() -> dict:
             "newest_backup": None
         }
     
-    total_size = sum(b["size"] for b in backups)
-    
     return {
-        "total_backups": len(backups),
-        "total_size": total_size,
-        "total_size_mb": round(total_size / (1024 * 1024), 2),
-        "oldest_backup": backups[-1]["created_at"] if backups else None,
-        "newest_backup": backups[0]["created_at"] if backups else None,
+        "total_backups": stats["total"],
+        "total_size": stats["size"],
+        "total_size_mb": round(stats["size"] / (1024 * 1024), 2),
+        "oldest_backup": stats["oldest"],
+        "newest_backup": stats["newest"],
         "retention_days": RETENTION_DAYS
     }
-
@@ -0,0 +1,166 @@
+"""
+Catálogo persistente dos backups (BACKUP_DIR/.catalog/catalog.sqlite)
+
+Registra tamanho, checksum, resultado da verificação e versão do banco de origem de
+cada backup, atualizado na criação/remoção. Listagens e estatísticas leem o catálogo
+em vez de varrer o diretório; a varredura (reconciliação) só ocorre quando o mtime
+de BACKUP_DIR difere do registrado após a última escrita do próprio catálogo.
+
+O catálogo fica em um subdiretório, fora do espaço de nomes dos arquivos de backup:
+um arquivo SQLite solto em BACKUP_DIR poderia ser escolhido para restauração.
+"""
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+from . import backup_format
+
+CATALOG_DIR = ".catalog"
+CATALOG_FILENAME = "catalog.sqlite"
+
+COLUMNS = (
+    "filename", "size", "created_at", "type", "parent", "compression", "db_size",
+    "sha256", "integrity", "verified_at", "source_version", "sqlite_version",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS backups (
+    filename TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    type TEXT NOT NULL DEFAULT 'full',
+    parent TEXT,
+    compression TEXT,
+    db_size INTEGER,
+    sha256 TEXT,
+    integrity TEXT,
+    verified_at TEXT,
+    source_version TEXT,
+    sqlite_version TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_backups_created_at ON backups (created_at);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+def catalog_path(backup_dir: str) -> str:
+    """Caminho do catálogo (move o catálogo de versões anteriores, gravado em BACKUP_DIR)"""
+    path = os.path.join(backup_dir, CATALOG_DIR, CATALOG_FILENAME)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        legacy = os.path.join(backup_dir, CATALOG_FILENAME)
+        if os.path.exists(legacy):
+            os.replace(legacy, path)
+    return path
+
+
+def _connect(backup_dir: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(catalog_path(backup_dir), timeout=30)
+    conn.row_factory = sqlite3.Row
+    # Sem arquivo de journal: criar/remover -journal alteraria o mtime de BACKUP_DIR
+    # (usado para detectar mudanças externas). O catálogo pode ser reconstruído do disco.
+    conn.execute("PRAGMA journal_mode=MEMORY")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _dir_stamp(backup_dir: str) -> str:
+    return str(os.stat(backup_dir).st_mtime_ns)
+
+
+def _mark_fresh(conn: sqlite3.Connection, backup_dir: str) -> None:
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dir_mtime', ?)", (_dir_stamp(backup_dir),))
+
+
+def _is_stale(conn: sqlite3.Connection, backup_dir: str) -> bool:
+    row = conn.execute("SELECT value FROM meta WHERE key = 'dir_mtime'").fetchone()
+    return row is None or row["value"] != _dir_stamp(backup_dir)
+
+
+def _upsert(conn: sqlite3.Connection, entry: dict) -> None:
+    values = [entry.get(c) for c in COLUMNS]
+    placeholders = ", ".join("?" for _ in COLUMNS)
+    conn.execute(f"INSERT OR REPLACE INTO backups ({', '.join(COLUMNS)}) VALUES ({placeholders})", values)
+
+
+def entry_from_file(backup_dir: str, filename: str) -> dict:
+    """Entrada do catálogo a partir do arquivo e do manifesto (usada na reconciliação)"""
+    path = os.path.join(backup_dir, filename)
+    stat = os.stat(path)
+    manifest = backup_format.read_manifest(path) or {}
+    return {
+        "filename": filename,
+        "size": stat.st_size,
+        "created_at": datetime.fromtimestamp(stat.st_mtime).isoformat(),
+        "type": manifest.get("type", "full"),
+        "parent": manifest.get("parent"),
+        "compression": manifest.get("compression", "pg_dump" if filename.endswith(".dump") else "none"),
+        "db_size": manifest.get("db_size", stat.st_size),
+        "sha256": manifest.get("file_sha256"),
+        "source_version": manifest.get("source_version"),
+        "sqlite_version": manifest.get("sqlite_version"),
+    }
+
+
+def record(backup_dir: str, entry: dict) -> None:
+    """Registra (ou atualiza) um backup recém-criado"""
+    with closing(_connect(backup_dir)) as conn, conn:
+        _upsert(conn, entry)
+        _mark_fresh(conn, backup_dir)
+
+
+def forget(backup_dir: str, filenames: list[str]) -> None:
+    """Remove backups apagados do catálogo"""
+    with closing(_connect(backup_dir)) as conn, conn:
+        conn.executemany("DELETE FROM backups WHERE filename = ?", [(f,) for f in filenames])
+        _mark_fresh(conn, backup_dir)
+
+
+def set_verification(backup_dir: str, filename: str, result: str) -> None:
+    """Registra o resultado da última verificação de integridade"""
+    with closing(_connect(backup_dir)) as conn, conn:
+        conn.execute(
+            "UPDATE backups SET integrity = ?, verified_at = ? WHERE filename = ?",
+            (result, datetime.now().isoformat(), filename),
+        )
+
+
+def get(backup_dir: str, filename: str) -> dict | None:
+    with closing(_connect(backup_dir)) as conn:
+        row = conn.execute("SELECT * FROM backups WHERE filename = ?", (filename,)).fetchone()
+        return dict(row) if row else None
+
+
+def reconcile(backup_dir: str, is_backup_file) -> None:
+    """Sincroniza o catálogo com o diretório: inclui arquivos novos e remove os apagados"""
+    with closing(_connect(backup_dir)) as conn, conn:
+        known = {row["filename"] for row in conn.execute("SELECT filename FROM backups")}
+        present = {f for f in os.listdir(backup_dir) if is_backup_file(f)}
+        for filename in present - known:
+            _upsert(conn, entry_from_file(backup_dir, filename))
+        conn.executemany("DELETE FROM backups WHERE filename = ?", [(f,) for f in known - present])
+        _mark_fresh(conn, backup_dir)
+
+
+def entries(backup_dir: str, is_backup_file) -> list[dict]:
+    """Backups catalogados, do mais recente ao mais antigo (reconcilia se o diretório mudou)"""
+    with closing(_connect(backup_dir)) as conn:
+        stale = _is_stale(conn, backup_dir)
+    if stale:
+        reconcile(backup_dir, is_backup_file)
+    with closing(_connect(backup_dir)) as conn:
+        return [dict(row) for row in conn.execute("SELECT * FROM backups ORDER BY created_at DESC, filename DESC")]
+
+
+def stats(backup_dir: str, is_backup_file) -> dict:
+    """Totais agregados no próprio catálogo"""
+    with closing(_connect(backup_dir)) as conn:
+        stale = _is_stale(conn, backup_dir)
+    if stale:
+        reconcile(backup_dir, is_backup_file)
+    with closing(_connect(backup_dir)) as conn:
+        row = conn.execute(
+            "SELECT count(*) AS total, coalesce(sum(size), 0) AS size, coalesce(sum(db_size), 0) AS db_size, "
+            "min(created_at) AS oldest, max(created_at) AS newest FROM backups"
+        ).fetchone()
+        return dict(row)
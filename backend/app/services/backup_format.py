@@ -0,0 +1,204 @@
+"""
+Formato dos backups SQLite: snapshots comprimidos e incrementais por página
+
+- Completo: o arquivo do banco comprimido (plans_backup_<ts>.db.gz / .db.zst)
+- Incremental: apenas as páginas alteradas em relação ao backup anterior da cadeia
+  (plans_backup_<ts>.inc.gz / .inc.zst)
+
+Cada backup tem um manifesto JSON (<arquivo>.json) com tipo, pai, tamanho de página,
+número de páginas e SHA-256 do banco reconstruído, e um arquivo <arquivo>.pages com o
+hash de cada página, usado para calcular o próximo incremental sem reler a cadeia.
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import struct
+
+INCREMENTAL_MAGIC = b"ROCINC1\n"
+END_OF_PAGES = 0xFFFFFFFF
+PAGE_HASH_SIZE = 16
+COPY_CHUNK_SIZE = 1024 * 1024
+
+try:
+    import zstandard
+except ImportError:  # zstd é opcional (pip install zstandard)
+    zstandard = None
+
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+
+
+class BackupFormatError(Exception):
+    """Backup ilegível, cadeia incompleta ou conteúdo divergente do manifesto"""
+
+
+def compression_for(path: str) -> str:
+    for name, suffix in COMPRESSION_SUFFIXES.items():
+        if path.endswith(suffix):
+            return name
+    return "none"
+
+
+def open_compressed(path: str, mode: str, compression: str):
+    """Abre um arquivo para leitura/escrita (binária) com a compressão indicada"""
+    if compression == "gzip":
+        return gzip.open(path, mode + "b", compresslevel=6)
+    if compression == "zstd":
+        if zstandard is None:
+            raise BackupFormatError("zstd compression requires the 'zstandard' package")
+        raw = open(path, mode + "b")
+        if mode == "r":
+            return zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        return zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=True)
+    return open(path, mode + "b")
+
+
+def manifest_path(backup_path: str) -> str:
+    return f"{backup_path}.json"
+
+
+def pages_path(backup_path: str) -> str:
+    return f"{backup_path}.pages"
+
+
+def read_manifest(backup_path: str) -> dict | None:
+    """Manifesto do backup; None para backups antigos sem manifesto (cópia .db simples)"""
+    try:
+        with open(manifest_path(backup_path), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_manifest(backup_path: str, manifest: dict) -> None:
+    tmp = f"{manifest_path(backup_path)}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, manifest_path(backup_path))
+
+
+def sqlite_page_size(db_path: str) -> int:
+    """Tamanho de página lido do cabeçalho do arquivo SQLite (offset 16, big-endian)"""
+    with open(db_path, "rb") as f:
+        header = f.read(100)
+    if not header.startswith(b"SQLite format 3\x00"):
+        raise BackupFormatError(f"Not a SQLite database: {db_path}")
+    size = struct.unpack(">H", header[16:18])[0]
+    return 65536 if size == 1 else size
+
+
+def scan_pages(db_path: str, page_size: int) -> tuple[bytes, str]:
+    """Hashes das páginas (concatenados) e SHA-256 do arquivo, em uma única leitura"""
+    hashes = bytearray()
+    digest = hashlib.sha256()
+    with open(db_path, "rb") as f:
+        while page := f.read(page_size):
+            digest.update(page)
+            hashes += hashlib.blake2b(page, digest_size=PAGE_HASH_SIZE).digest()
+    return bytes(hashes), digest.hexdigest()
+
+
+def file_sha256(path: str) -> str:
+    """SHA-256 do arquivo de backup como gravado em disco (comprimido/incremental)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(COPY_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_full(db_path: str, backup_path: str, compression: str) -> None:
+    with open(db_path, "rb") as src, open_compressed(backup_path, "w", compression) as dst:
+        shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+
+
+def write_incremental(db_path: str, backup_path: str, compression: str, page_size: int,
+                      hashes: bytes, parent_hashes: bytes) -> int:
+    """Grava as páginas que diferem do pai; retorna quantas páginas foram gravadas"""
+    page_count = len(hashes) // PAGE_HASH_SIZE
+    changed = 0
+    with open(db_path, "rb") as src, open_compressed(backup_path, "w", compression) as dst:
+        dst.write(INCREMENTAL_MAGIC + struct.pack(">II", page_size, page_count))
+        for page_no in range(page_count):
+            start = page_no * PAGE_HASH_SIZE
+            if hashes[start:start + PAGE_HASH_SIZE] == parent_hashes[start:start + PAGE_HASH_SIZE]:
+                continue
+            src.seek(page_no * page_size)
+            dst.write(struct.pack(">I", page_no) + src.read(page_size))
+            changed += 1
+        dst.write(struct.pack(">I", END_OF_PAGES))
+    return changed
+
+
+def _read_exact(src, size: int) -> bytes:
+    """Lê exatamente size bytes (leitores de streams comprimidos podem retornar menos)"""
+    data = bytearray()
+    while len(data) < size:
+        chunk = src.read(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return bytes(data)
+
+
+def _apply_incremental(backup_path: str, target, expected_page_size: int) -> None:
+    with open_compressed(backup_path, "r", compression_for(backup_path)) as src:
+        header = _read_exact(src, len(INCREMENTAL_MAGIC) + 8)
+        if not header.startswith(INCREMENTAL_MAGIC):
+            raise BackupFormatError(f"Invalid incremental backup: {backup_path}")
+        page_size, page_count = struct.unpack(">II", header[len(INCREMENTAL_MAGIC):])
+        if page_size != expected_page_size:
+            raise BackupFormatError(f"Page size mismatch in {backup_path}")
+        while True:
+            record = _read_exact(src, 4)
+            if len(record) != 4:
+                raise BackupFormatError(f"Truncated incremental backup: {backup_path}")
+            (page_no,) = struct.unpack(">I", record)
+            if page_no == END_OF_PAGES:
+                break
+            page = _read_exact(src, page_size)
+            if len(page) != page_size:
+                raise BackupFormatError(f"Truncated incremental backup: {backup_path}")
+            target.seek(page_no * page_size)
+            target.write(page)
+        target.truncate(page_count * page_size)
+
+
+def chain(backup_path: str) -> list[str]:
+    """Backups necessários para reconstruir backup_path, do completo até ele"""
+    members = [backup_path]
+    manifest = read_manifest(backup_path)
+    while manifest and manifest.get("type") == "incremental":
+        parent = os.path.join(os.path.dirname(backup_path), manifest["parent"])
+        if not os.path.exists(parent):
+            raise BackupFormatError(f"Missing parent backup in chain: {manifest['parent']}")
+        members.insert(0, parent)
+        manifest = read_manifest(parent)
+    return members
+
+
+def materialize(backup_path: str, out_path: str) -> None:
+    """Reconstrói o banco de um backup (completo ou incremental) em out_path"""
+    members = chain(backup_path)
+    base = members[0]
+    with open_compressed(base, "r", compression_for(base)) as src, open(out_path, "wb") as dst:
+        shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+    if len(members) > 1:
+        page_size = sqlite_page_size(out_path)
+        with open(out_path, "r+b") as target:
+            for member in members[1:]:
+                _apply_incremental(member, target, page_size)
+
+    manifest = read_manifest(backup_path)
+    if manifest and manifest.get("sha256"):
+        _, sha256 = scan_pages(out_path, manifest["page_size"])
+        if sha256 != manifest["sha256"]:
+            raise BackupFormatError(f"Restored content does not match manifest checksum: {backup_path}")
+
+
+def remove(backup_path: str) -> None:
+    """Remove o backup e seus arquivos auxiliares (manifesto e hashes de página)"""
+    for path in (backup_path, manifest_path(backup_path), pages_path(backup_path)):
+        if os.path.exists(path):
+            os.remove(path)
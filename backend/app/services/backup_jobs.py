@@ -0,0 +1,294 @@
+"""
+Jobs de backup/restauração em segundo plano e agendador interno
+
+Os endpoints apenas enfileiram o job e retornam seu identificador; os jobs são
+executados em sequência (cópia, verificação de integridade e retenção nunca ocupam
+uma requisição HTTP nem se sobrepõem). Com BACKUP_SCHEDULE=true uma segunda thread
+enfileira backups a cada BACKUP_INTERVAL segundos (mais um atraso aleatório de até
+BACKUP_JITTER segundos), substituindo o cron externo, e a cada
+BACKUP_DEEP_SCAN_INTERVAL segundos a verificação completa do backup mais recente.
+
+O estado dos jobs fica em BACKUP_DIR/.catalog/jobs.sqlite, compartilhado pelos
+processos da API (uvicorn --workers N), e não no banco: a restauração substitui o
+banco, então registrá-los em uma tabela os faria desaparecer (ou voltar no tempo) a
+cada restauração. Cada processo procura jobs na fila a cada BACKUP_JOBS_POLL_INTERVAL
+segundos, mas só executa sob o lock de execução (fcntl.flock em .catalog/worker.lock):
+um job por vez entre todos os processos. O agendador roda apenas no processo que
+detém .catalog/scheduler.lock; se esse processo terminar, outro assume. Sem fcntl
+(Windows) os locks valem só dentro do processo.
+"""
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+import logging
+from contextlib import closing, contextmanager
+from datetime import datetime, timezone
+from ..db.database import SessionLocal
+from . import backup
+from .audit import log as audit_log
+from .backup_catalog import CATALOG_DIR
+
+try:
+    import fcntl
+except ImportError:  # Windows: apenas o lock dentro do processo
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+BACKUP_SCHEDULE = os.environ.get("BACKUP_SCHEDULE", "false").lower() == "true"
+BACKUP_INTERVAL = float(os.environ.get("BACKUP_INTERVAL", 24 * 3600))  # segundos
+BACKUP_JITTER = float(os.environ.get("BACKUP_JITTER", 300))  # segundos
+# Varredura profunda agendada (PRAGMA integrity_check do backup mais recente); 0 desativa
+BACKUP_DEEP_SCAN_INTERVAL = float(os.environ.get("BACKUP_DEEP_SCAN_INTERVAL", 7 * 24 * 3600))  # segundos
+# Jobs concluídos mantidos para consulta (os mais antigos são descartados)
+BACKUP_JOBS_KEPT = int(os.environ.get("BACKUP_JOBS_KEPT", 100))
+# Intervalo com que cada processo procura jobs enfileirados por outros processos
+BACKUP_JOBS_POLL_INTERVAL = float(os.environ.get("BACKUP_JOBS_POLL_INTERVAL", 1.0))  # segundos
+# Intervalo com que os demais processos tentam assumir o agendador
+SCHEDULER_ELECTION_INTERVAL = 60  # segundos
+
+JOBS_FILENAME = "jobs.sqlite"
+WORKER_LOCK = "worker.lock"
+SCHEDULER_LOCK = "scheduler.lock"
+FIELDS = ("job_id", "kind", "status", "trigger", "backup_file", "mode", "error",
+          "created_at", "started_at", "finished_at")
+_TIMESTAMPS = ("created_at", "started_at", "finished_at")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    trigger TEXT NOT NULL,
+    backup_file TEXT,
+    backup_path TEXT,
+    mode TEXT,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_status_created_at ON jobs (status, created_at);
+"""
+
+
+def _catalog_file(name: str) -> str:
+    path = os.path.join(backup.BACKUP_DIR, CATALOG_DIR, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+@contextmanager
+def _jobs_db():
+    """Transação (BEGIN IMMEDIATE) no registro de jobs compartilhado entre processos"""
+    with closing(sqlite3.connect(_catalog_file(JOBS_FILENAME), timeout=30, isolation_level=None)) as conn:
+        conn.row_factory = sqlite3.Row
+        conn.executescript(_SCHEMA)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+def _try_lock(name: str):
+    """Abre e trava (sem esperar) um arquivo de lock em .catalog; None se outro processo o detém"""
+    f = open(_catalog_file(name), "a")
+    if fcntl is not None:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return None
+    # O lock é liberado ao fechar o arquivo
+    return f
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _job(row: sqlite3.Row) -> dict:
+    job = {field: row[field] for field in FIELDS}
+    for field in _TIMESTAMPS:
+        if job[field]:
+            job[field] = datetime.fromisoformat(job[field])
+    return job
+
+
+class BackupWorker:
+    """Fila de jobs de backup/restauração executados por uma thread de trabalho"""
+
+    def __init__(self, interval: float = BACKUP_INTERVAL, jitter: float = BACKUP_JITTER,
+                 deep_scan_interval: float = BACKUP_DEEP_SCAN_INTERVAL, jobs_kept: int = BACKUP_JOBS_KEPT,
+                 poll_interval: float = BACKUP_JOBS_POLL_INTERVAL):
+        self.interval = interval
+        self.jitter = jitter
+        self.deep_scan_interval = deep_scan_interval
+        self.jobs_kept = jobs_kept
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._scheduler: threading.Thread | None = None
+
+    def start(self, schedule: bool = BACKUP_SCHEDULE) -> None:
+        self._stop.clear()
+        if not (self._thread and self._thread.is_alive()):
+            self._thread = threading.Thread(target=self._run, name="backup-worker", daemon=True)
+            self._thread.start()
+        if schedule and not (self._scheduler and self._scheduler.is_alive()):
+            self._scheduler = threading.Thread(target=self._schedule, name="backup-scheduler", daemon=True)
+            self._scheduler.start()
+
+    def stop(self, timeout: float = 5) -> None:
+        """Para o agendador; o job em execução tem até timeout segundos para terminar"""
+        self._stop.set()
+        self._wake.set()
+        for thread in (self._scheduler, self._thread):
+            if thread:
+                thread.join(timeout=timeout)
+        self._thread = self._scheduler = None
+
+    def submit(self, kind: str, backup_path: str | None = None, trigger: str = "api", mode: str | None = None) -> dict:
+        """
+        Enfileira um job e retorna uma cópia do seu estado
+
+        Args:
+            kind: "create", "restore" ou "verify" (verify sem backup_path: o mais recente)
+            mode: nível da verificação ("quick" ou "full") nos jobs "verify"
+        """
+        with _jobs_db() as conn:
+            if kind == "create":
+                # Um backup ainda na fila (de qualquer processo) já cobrirá o estado atual do banco
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE kind = 'create' AND status = 'queued' LIMIT 1"
+                ).fetchone()
+                if row:
+                    return _job(row)
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO jobs (job_id, kind, status, trigger, backup_file, backup_path, mode, created_at) "
+                "VALUES (?, ?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, kind, trigger, os.path.basename(backup_path) if backup_path else None,
+                 backup_path, mode, _now()),
+            )
+            self._trim(conn)
+            job = _job(conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone())
+        if self._thread is None:
+            self.start(schedule=False)
+        self._wake.set()
+        return job
+
+    def get(self, job_id: str) -> dict | None:
+        with _jobs_db() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            return _job(row) if row else None
+
+    def _trim(self, conn: sqlite3.Connection) -> None:
+        conn.execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND job_id NOT IN "
+            "(SELECT job_id FROM jobs ORDER BY created_at DESC LIMIT ?)",
+            (self.jobs_kept,),
+        )
+
+    def _update(self, job_id: str, **fields) -> None:
+        for field in _TIMESTAMPS:
+            if isinstance(fields.get(field), datetime):
+                fields[field] = fields[field].isoformat()
+        assignments = ", ".join(f"{field} = ?" for field in fields)
+        with _jobs_db() as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id))
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            while not self._stop.is_set() and self._run_next():
+                pass
+
+    def _run_next(self) -> bool:
+        """Executa o job mais antigo da fila se obtiver o lock de execução; False se não houver"""
+        lock = _try_lock(WORKER_LOCK)
+        if lock is None:
+            return False
+        try:
+            with _jobs_db() as conn:
+                if fcntl is not None:
+                    # Sob o lock de execução, um job "running" é de um processo encerrado durante o job
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', error = 'Interrupted: the API process exited', "
+                        "finished_at = ? WHERE status = 'running'",
+                        (_now(),),
+                    )
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    return False
+                conn.execute("UPDATE jobs SET status = 'running', started_at = ? WHERE job_id = ?",
+                             (_now(), row["job_id"]))
+            self._execute(_job(row), row["backup_path"])
+            return True
+        finally:
+            lock.close()
+
+    def _execute(self, job: dict, backup_path: str | None) -> None:
+        job_id = job["job_id"]
+        try:
+            if job["kind"] == "create":
+                backup_path = backup.create_backup()
+                self._update(job_id, backup_file=os.path.basename(backup_path))
+                backup.cleanup_old_backups()
+                detail = f"Backup created ({job['trigger']}): {backup_path}"
+            elif job["kind"] == "verify":
+                if backup_path is None:
+                    latest = backup.list_backups()
+                    backup_path = latest[0]["path"] if latest else None
+                    self._update(job_id, backup_file=latest[0]["filename"] if latest else None)
+                if backup_path and not backup.deep_verify_backup(backup_path, job["mode"] or "full"):
+                    raise ValueError(f"Backup integrity check failed: {os.path.basename(backup_path)}")
+                detail = f"Backup verified ({job['mode'] or 'full'}): {backup_path}"
+            else:
+                if not backup.restore_backup(backup_path):
+                    raise ValueError("Restored database integrity check failed")
+                detail = f"Backup restored: {job['backup_file']}"
+            self._update(job_id, status="done", finished_at=datetime.now(timezone.utc))
+            self._audit(f"backup_{job['kind']}", detail)
+        except Exception as e:
+            logger.error(f"Backup job {job_id} failed: {str(e)}")
+            self._update(job_id, status="failed", error=str(e), finished_at=datetime.now(timezone.utc))
+            self._audit(f"backup_{job['kind']}_error" if job["kind"] != "create" else "backup_error", str(e))
+
+    def _schedule(self) -> None:
+        # Um único agendador entre os processos: quem obtiver o lock; os demais tentam de novo
+        lock = None
+        while lock is None:
+            lock = _try_lock(SCHEDULER_LOCK)
+            if lock is None and self._stop.wait(SCHEDULER_ELECTION_INTERVAL):
+                return
+        try:
+            last_scan = time.monotonic()
+            while not self._stop.wait(self.interval + random.uniform(0, self.jitter)):
+                self.submit("create", trigger="schedule")
+                if self.deep_scan_interval and time.monotonic() - last_scan >= self.deep_scan_interval:
+                    # Enfileirada após o backup: verifica o backup recém-criado
+                    self.submit("verify", trigger="schedule", mode="full")
+                    last_scan = time.monotonic()
+        finally:
+            lock.close()
+
+    def _audit(self, action: str, detail: str) -> None:
+        try:
+            with SessionLocal() as db:
+                audit_log(db, action=action, detail=detail)
+        except Exception as e:
+            logger.error(f"Error auditing backup job: {str(e)}")
+
+
+backup_worker = BackupWorker()
@@ -0,0 +1,79 @@
+"""
+Exportação em lote de planos (ZIP em streaming ou PDF único com sumário)
+
+Os relatórios ausentes do cache são renderizados em paralelo no pool de
+exportação; o ZIP é enviado ao cliente entrada por entrada, na ordem dos
+planos, enquanto os seguintes ainda estão sendo renderizados.
+"""
+import io
+import os
+import zipfile
+from collections import deque
+from typing import Iterable, Iterator
+from . import export_cache
+from .export_jobs import export_queue, render_export, EXPORT_WORKERS
+
+# Renderizações em andamento por requisição de lote (janela deslizante)
+BULK_EXPORT_WINDOW = int(os.environ.get("BULK_EXPORT_WINDOW", EXPORT_WORKERS * 2))
+
+
+class _ZipStream(io.RawIOBase):
+    """Destino não pesquisável para o zipfile; os bytes escritos são drenados a cada entrada"""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def render_many(items: Iterable[tuple[int, str, dict]], kind: str, logo_path: str | None = None,
+                window: int = BULK_EXPORT_WINDOW) -> Iterator[tuple[int, str]]:
+    """
+    Garante o relatório de cada plano no cache, preservando a ordem de entrada
+
+    Args:
+        items: tuplas (plan_id, chave de cache, dados do plano)
+
+    Yields:
+        (plan_id, caminho do relatório no cache)
+    """
+    in_flight: deque = deque()
+    for plan_id, key, data in items:
+        path = export_cache.lookup(key, kind)
+        if path:
+            in_flight.append((plan_id, path))
+        else:
+            in_flight.append((plan_id, export_queue.render(
+                key, kind, render_export, kind=kind, data=data, logo_path=logo_path,
+            )))
+        while len(in_flight) > window:
+            yield _resolve(in_flight.popleft())
+    while in_flight:
+        yield _resolve(in_flight.popleft())
+
+
+def _resolve(entry) -> tuple[int, str]:
+    plan_id, result = entry
+    return plan_id, result if isinstance(result, str) else result.result()
+
+
+def iter_zip(entries: Iterable[tuple[int, str]], kind: str) -> Iterator[bytes]:
+    """Gera um ZIP em streaming com um arquivo plan_<id>.<kind> por entrada"""
+    # PDF já é comprimido; HTML comprime bem
+    compression = zipfile.ZIP_STORED if kind == "pdf" else zipfile.ZIP_DEFLATED
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, "w", compression=compression) as zf:
+        for plan_id, path in entries:
+            zf.write(path, arcname=f"plan_{plan_id}.{kind}")
+            yield stream.drain()
+    yield stream.drain()
@@ -0,0 +1,285 @@
+"""
+Armazenamento de evidências endereçado por conteúdo
+
+Cada arquivo é gravado uma única vez em UPLOAD_DIR/ab/cd/<sha256>, independente
+do nome original ou do plano ao qual foi anexado. O upload é copiado em blocos
+para um arquivo temporário enquanto o SHA-256 é calculado incrementalmente e,
+ao final, movido atomicamente (os.replace) para o caminho definitivo.
+
+Nos uploads em blocos, cada operação sobre o arquivo parcial (.part) é exclusiva:
+um lock por upload no processo e, onde existe, fcntl.flock em um arquivo de lock ao
+lado (<upload_id>.lock, vários workers); o .part nunca é renomeado ou removido aberto. Uma segunda requisição para o mesmo upload recebe UploadBusyError em vez
+de esperar. Parciais sem atividade há mais de UPLOAD_PARTIAL_TTL são removidos por
+cleanup_stale_partials.
+"""
+import os
+import time
+import hashlib
+import tempfile
+import threading
+import logging
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+try:
+    import fcntl
+except ImportError:  # Windows: apenas o lock dentro do processo
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR", "uploads")
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB por bloco
+# Uploads em blocos sem atividade por mais que isso são descartados
+UPLOAD_PARTIAL_TTL = float(os.environ.get("UPLOAD_PARTIAL_TTL", 24 * 3600))  # segundos
+
+
+class FileTooLargeError(ValueError):
+    pass
+
+
+class EmptyFileError(ValueError):
+    pass
+
+
+class OffsetMismatchError(ValueError):
+    def __init__(self, offset: int):
+        super().__init__(f"Expected offset {offset}")
+        self.offset = offset
+
+
+class ChecksumMismatchError(ValueError):
+    pass
+
+
+class UploadBusyError(ValueError):
+    pass
+
+
+@dataclass
+class StoredBlob:
+    sha256: str
+    size: int
+    path: str
+    deduplicated: bool
+
+
+def blob_path(sha256: str) -> str:
+    """Caminho do conteúdo no armazenamento: UPLOAD_DIR/ab/cd/<sha256>"""
+    return os.path.join(UPLOAD_DIR, sha256[:2], sha256[2:4], sha256)
+
+
+def resolve_evidence_path(sha256: str, filename: str) -> str | None:
+    """Localiza o arquivo de uma evidência (conteúdo endereçado ou layout antigo uploads/<filename>)"""
+    path = blob_path(sha256)
+    if os.path.exists(path):
+        return path
+    legacy = os.path.join(UPLOAD_DIR, os.path.basename(filename))
+    return legacy if os.path.exists(legacy) else None
+
+
+def _tmp_dir() -> str:
+    path = os.path.join(UPLOAD_DIR, "tmp")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def commit_blob(tmp_path: str, sha256: str, size: int) -> StoredBlob:
+    """Move um arquivo temporário já verificado para o armazenamento (ou descarta se já existir)"""
+    final_path = blob_path(sha256)
+    if os.path.exists(final_path):
+        os.remove(tmp_path)
+        return StoredBlob(sha256=sha256, size=size, path=final_path, deduplicated=True)
+    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+    os.replace(tmp_path, final_path)
+    return StoredBlob(sha256=sha256, size=size, path=final_path, deduplicated=False)
+
+
+async def store_upload(file, max_size: int, chunk_size: int = UPLOAD_CHUNK_SIZE) -> StoredBlob:
+    """
+    Grava um UploadFile no armazenamento sem mantê-lo inteiro em memória
+
+    Raises:
+        FileTooLargeError: arquivo maior que max_size
+        EmptyFileError: arquivo vazio
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=_tmp_dir(), suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise FileTooLargeError(f"File exceeds {max_size} bytes")
+                digest.update(chunk)
+                tmp.write(chunk)
+        if size == 0:
+            raise EmptyFileError("File is empty")
+        return commit_blob(tmp_path, digest.hexdigest(), size)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+# Uploads em blocos (retomáveis): o arquivo parcial é a fonte da verdade do offset
+def partial_path(upload_id: str) -> str:
+    return os.path.join(_tmp_dir(), f"{upload_id}.part")
+
+
+def partial_size(upload_id: str) -> int:
+    path = partial_path(upload_id)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+_busy: set[str] = set()
+_busy_lock = threading.Lock()
+
+
+def _lock_path(upload_id: str) -> str:
+    return os.path.join(_tmp_dir(), f"{upload_id}.lock")
+
+
+@contextmanager
+def _locked_upload(upload_id: str, release: bool = False):
+    """
+    Acesso exclusivo a um upload em blocos
+
+    O lock entre processos fica em um arquivo próprio (<upload_id>.lock), e não no
+    .part: assim o arquivo parcial pode ser renomeado ou removido sem estar aberto
+    (no Windows, os.replace/os.remove falham sobre um arquivo aberto). Com release,
+    o arquivo de lock é removido ao final (upload concluído ou descartado).
+
+    Raises:
+        UploadBusyError: outra requisição já está operando sobre o mesmo upload
+    """
+    with _busy_lock:
+        if upload_id in _busy:
+            raise UploadBusyError(f"Upload {upload_id} is busy")
+        _busy.add(upload_id)
+    try:
+        if fcntl is None:  # Windows: apenas o lock dentro do processo
+            yield
+            return
+        path = _lock_path(upload_id)
+        with open(path, "a") as lock:
+            try:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadBusyError(f"Upload {upload_id} is busy")
+            # Outro processo pode ter removido o arquivo de lock (release) entre o open e o flock
+            try:
+                if os.stat(path).st_ino != os.fstat(lock.fileno()).st_ino:
+                    raise UploadBusyError(f"Upload {upload_id} is busy")
+            except FileNotFoundError:
+                raise UploadBusyError(f"Upload {upload_id} is busy")
+            try:
+                yield
+            finally:
+                # Removido ainda sob o lock; o lock é liberado ao fechar o arquivo
+                if release and os.path.exists(path):
+                    os.remove(path)
+    finally:
+        with _busy_lock:
+            _busy.discard(upload_id)
+
+
+async def append_chunk(upload_id: str, offset: int, chunks, max_bytes: int,
+                       expected_sha256: str | None = None) -> int:
+    """
+    Acrescenta um bloco (iterável assíncrono de bytes) ao arquivo parcial
+
+    A conferência do offset e a escrita acontecem sob o lock do upload. Se o bloco
+    for rejeitado (tamanho, checksum ou conexão interrompida), o arquivo é truncado
+    de volta ao offset anterior.
+
+    Returns:
+        Novo offset (bytes recebidos)
+    """
+    with _locked_upload(upload_id), open(partial_path(upload_id), "ab") as f:
+        current = os.fstat(f.fileno()).st_size
+        if offset != current:
+            raise OffsetMismatchError(current)
+        digest = hashlib.sha256()
+        written = 0
+        try:
+            async for chunk in chunks:
+                written += len(chunk)
+                if written > max_bytes:
+                    raise FileTooLargeError(f"Chunk exceeds {max_bytes} bytes")
+                digest.update(chunk)
+                f.write(chunk)
+            if expected_sha256 and digest.hexdigest() != expected_sha256.lower():
+                raise ChecksumMismatchError("Chunk SHA-256 mismatch")
+        except BaseException:
+            f.truncate(current)
+            raise
+    return current + written
+
+
+def hash_file(path: str, chunk_size: int = UPLOAD_CHUNK_SIZE) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def finalize_partial(upload_id: str, expected_sha256: str) -> StoredBlob:
+    """Verifica o SHA-256 final do arquivo parcial e o move para o armazenamento"""
+    path = partial_path(upload_id)
+    with _locked_upload(upload_id, release=True):
+        sha256 = hash_file(path)
+        if sha256 != expected_sha256.lower():
+            os.remove(path)
+            raise ChecksumMismatchError("File SHA-256 mismatch")
+        return commit_blob(path, sha256, os.path.getsize(path))
+
+
+def discard_partial(upload_id: str) -> None:
+    if not os.path.exists(partial_path(upload_id)):
+        return
+    with _locked_upload(upload_id, release=True):
+        if os.path.exists(partial_path(upload_id)):
+            os.remove(partial_path(upload_id))
+
+
+def partial_mtime(upload_id: str) -> float | None:
+    """Horário (epoch) do último bloco recebido, ou None sem arquivo parcial"""
+    path = partial_path(upload_id)
+    return os.path.getmtime(path) if os.path.exists(path) else None
+
+
+def cleanup_stale_partials(ttl: float = UPLOAD_PARTIAL_TTL) -> int:
+    """
+    Remove arquivos parciais sem escrita há mais de ttl segundos (uploads em blocos
+    abandonados e temporários de uploads interrompidos); os que estiverem em uso são
+    mantidos. Retorna quantos foram removidos.
+    """
+    cutoff = time.time() - ttl
+    removed = 0
+    for entry in os.scandir(_tmp_dir()):
+        if not entry.name.endswith(".part") or entry.stat().st_mtime >= cutoff:
+            continue
+        try:
+            with _locked_upload(entry.name[:-len(".part")], release=True):
+                os.remove(entry.path)
+            removed += 1
+        except (UploadBusyError, FileNotFoundError):
+            continue
+    # Arquivos de lock sem parcial (ex.: processo encerrado no meio de uma operação)
+    for entry in os.scandir(_tmp_dir()):
+        upload_id = entry.name[:-len(".lock")]
+        if (not entry.name.endswith(".lock") or entry.stat().st_mtime >= cutoff
+                or os.path.exists(partial_path(upload_id))):
+            continue
+        try:
+            with _locked_upload(upload_id, release=True):
+                pass
+        except (UploadBusyError, FileNotFoundError):
+            continue
+    return removed
@@ -0,0 +1,126 @@
+"""
+Cache de relatórios exportados (PDF/HTML)
+
+Cada artefato é identificado por um hash do conteúdo serializado do plano, da
+versão do template e (quando usado) do logo. Um plano inalterado é servido do
+cache sem nova renderização; o diretório é limitado por tamanho com remoção
+dos arquivos menos usados recentemente (LRU por mtime).
+"""
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+EXPORT_DIR = os.environ.get("EXPORT_DIR", "exports")
+EXPORT_CACHE_MAX_BYTES = int(os.environ.get("EXPORT_CACHE_MAX_BYTES", 500 * 1024 * 1024))  # 500MB
+
+_logo_hashes: dict[tuple, str] = {}
+_evict_lock = threading.Lock()
+
+
+def file_hash(path: str | None) -> str:
+    """SHA-256 de um arquivo (ex.: logo), recalculado apenas quando mtime/tamanho mudam"""
+    if not path or not os.path.exists(path):
+        return ""
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if key not in _logo_hashes:
+        with open(path, "rb") as f:
+            _logo_hashes[key] = hashlib.sha256(f.read()).hexdigest()
+    return _logo_hashes[key]
+
+
+def cache_key(plan: dict, kind: str, template_version: str, logo_path: str | None = None) -> str:
+    payload = json.dumps(plan, sort_keys=True, ensure_ascii=False, default=str)
+    digest = hashlib.sha256()
+    for part in (kind, template_version, file_hash(logo_path), payload):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def cached_path(key: str, ext: str) -> str:
+    return os.path.join(EXPORT_DIR, f"{key}.{ext}")
+
+
+def lookup(key: str, ext: str) -> str | None:
+    """Caminho do artefato em cache (marcando-o como usado recentemente) ou None"""
+    path = cached_path(key, ext)
+    if os.path.exists(path):
+        # Marca como usado recentemente para a política LRU
+        os.utime(path)
+        return path
+    return None
+
+
+def reserve_tmp(ext: str) -> str:
+    """Cria um arquivo temporário no diretório do cache para receber uma renderização"""
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=EXPORT_DIR, suffix=f".{ext}.tmp")
+    os.close(fd)
+    return tmp_path
+
+
+def commit(tmp_path: str, key: str, ext: str) -> str:
+    """Move atomicamente uma renderização concluída para o cache e aplica a política LRU"""
+    path = cached_path(key, ext)
+    os.replace(tmp_path, path)
+    evict(keep=path)
+    return path
+
+
+def get_or_render(key: str, ext: str, render) -> tuple[str, bool]:
+    """
+    Retorna o caminho do artefato em cache, renderizando-o se necessário
+
+    Args:
+        render: função que recebe o caminho de saída e grava o artefato
+
+    Returns:
+        (caminho, True se veio do cache)
+    """
+    path = lookup(key, ext)
+    if path:
+        return path, True
+
+    tmp_path = reserve_tmp(ext)
+    try:
+        render(tmp_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return commit(tmp_path, key, ext), False
+
+
+def evict(max_bytes: int = None, keep: str | None = None) -> int:
+    """Remove os artefatos menos usados até o cache caber em max_bytes; retorna quantos removeu"""
+    if max_bytes is None:
+        max_bytes = EXPORT_CACHE_MAX_BYTES
+    with _evict_lock:
+        entries = []
+        with os.scandir(EXPORT_DIR) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except FileNotFoundError:
+                pass
+        if removed:
+            logger.info(f"Export cache eviction: {removed} files removed")
+        return removed
@@ -0,0 +1,265 @@
+"""
+Fila de exportação de relatórios (PDF/HTML) em processos separados
+
+A renderização com ReportLab é CPU-bound; executá-la no handler ocupa o worker
+e degrada a latência dos demais endpoints. Aqui cada exportação vira um job
+persistido (tabela export_jobs) e é renderizada em um ProcessPoolExecutor
+limitado, gravando o resultado no cache de exportação.
+
+Jobs ainda pendentes quando o processo termina não têm mais quem os execute: cada
+job registra o processo dono, e os de processos sem batimento recente são marcados
+como "failed" (o cliente cria um novo job); os de outros processos ativos não. Jobs
+concluídos há mais de EXPORT_JOBS_RETENTION segundos são removidos periodicamente;
+os relatórios em cache seguem apenas a política LRU do cache de exportação.
+"""
+import os
+import time
+import uuid
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import or_, select
+from ..db.database import SessionLocal
+from ..models.models import ExportJob, ExportWorker
+from . import export_cache
+from .pdf import generate_plan_pdf
+from .html_report import render_plan_html
+
+logger = logging.getLogger(__name__)
+
+# Processos de renderização e limite de jobs pendentes (acima dele a API responde 503)
+EXPORT_WORKERS = int(os.environ.get("EXPORT_WORKERS", min(4, os.cpu_count() or 1)))
+EXPORT_QUEUE_MAX = int(os.environ.get("EXPORT_QUEUE_MAX", EXPORT_WORKERS * 8))
+# Jobs concluídos (done/failed) mantidos por este tempo; a limpeza roda a cada EXPORT_JOBS_CLEANUP_INTERVAL
+EXPORT_JOBS_RETENTION = float(os.environ.get("EXPORT_JOBS_RETENTION", 7 * 24 * 3600))  # segundos
+EXPORT_JOBS_CLEANUP_INTERVAL = float(os.environ.get("EXPORT_JOBS_CLEANUP_INTERVAL", 3600))  # segundos
+# Cada processo registra um batimento em export_workers; sem batimento por EXPORT_WORKER_TIMEOUT
+# o processo é considerado encerrado e seus jobs pendentes falham
+EXPORT_HEARTBEAT_INTERVAL = float(os.environ.get("EXPORT_HEARTBEAT_INTERVAL", 15))  # segundos
+EXPORT_WORKER_TIMEOUT = float(os.environ.get("EXPORT_WORKER_TIMEOUT", EXPORT_HEARTBEAT_INTERVAL * 4))  # segundos
+# Identificador deste processo, gravado em cada job que ele enfileira (ExportJob.owner)
+EXPORT_WORKER_ID = uuid.uuid4().hex
+
+
+class QueueFullError(Exception):
+    """A fila de exportação atingiu EXPORT_QUEUE_MAX"""
+
+
+def render_export(kind: str, data: dict, outfile: str, logo_path: str | None = None) -> None:
+    """Renderiza um relatório em outfile (executado no processo de trabalho)"""
+    if kind == "pdf":
+        generate_plan_pdf(data, outfile)
+    else:
+        with open(outfile, "w", encoding="utf-8") as f:
+            f.write(render_plan_html(data, logo_path))
+
+
+class ExportQueue:
+    def __init__(self, workers: int = EXPORT_WORKERS, max_pending: int = EXPORT_QUEUE_MAX):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Criado sob demanda; "spawn" evita fork de um processo com threads (auditoria, event loop)
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def render(self, key: str, ext: str, fn, **kwargs) -> Future:
+        """
+        Executa fn(outfile=..., **kwargs) no pool e grava o resultado no cache
+
+        fn deve ser uma função de módulo (serializável para o processo de trabalho).
+        O Future retornado resolve para o caminho do artefato no cache.
+        """
+        with self._lock:
+            executor = self._get_executor()
+        tmp_path = export_cache.reserve_tmp(ext)
+        try:
+            try:
+                inner = executor.submit(fn, outfile=tmp_path, **kwargs)
+            except BrokenProcessPool:
+                # Um processo de trabalho morreu (ex.: OOM): recria o pool e tenta novamente
+                logger.warning("Export process pool is broken; recreating")
+                executor = self._reset(executor)
+                inner = executor.submit(fn, outfile=tmp_path, **kwargs)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+        outer = Future()
+
+        def done(f):
+            try:
+                f.result()
+                outer.set_result(export_cache.commit(tmp_path, key, ext))
+            except BaseException as e:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                outer.set_exception(e)
+
+        inner.add_done_callback(done)
+        return outer
+
+    def submit(self, job_id: str, kind: str, key: str, data: dict, logo_path: str | None = None) -> None:
+        """Enfileira a renderização de um job já persistido como "queued" """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFullError(f"Export queue is full ({self.max_pending} pending jobs)")
+            self._pending += 1
+        try:
+            future = self.render(key, kind, render_export, kind=kind, data=data, logo_path=logo_path)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        future.add_done_callback(lambda f: self._finish(f, job_id))
+
+    def _finish(self, future: Future, job_id: str) -> None:
+        with self._lock:
+            self._pending -= 1
+        status, error = "done", None
+        try:
+            future.result()
+        except BaseException as e:
+            status, error = "failed", str(e) or e.__class__.__name__
+            logger.error(f"Export job {job_id} failed: {error}")
+        mark_finished(job_id, status, error)
+
+    def _reset(self, broken: ProcessPoolExecutor) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is broken:
+                self._executor = None
+            executor = self._get_executor()
+        broken.shutdown(wait=False, cancel_futures=True)
+        return executor
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def mark_finished(job_id: str, status: str, error: str | None = None) -> None:
+    """Registra o resultado de um job (usa sessão própria; chamado fora da requisição)"""
+    with SessionLocal() as db:
+        job = db.get(ExportJob, job_id)
+        if job is None:
+            return
+        job.status = status
+        job.error = error
+        job.finished_at = datetime.now(timezone.utc)
+        db.commit()
+
+
+def heartbeat(worker_id: str = None) -> None:
+    """Registra que este processo está ativo (e portanto seus jobs pendentes também)"""
+    with SessionLocal() as db:
+        db.merge(ExportWorker(id=worker_id or EXPORT_WORKER_ID, heartbeat_at=datetime.now(timezone.utc)))
+        db.commit()
+
+
+def fail_orphaned_jobs(timeout: float = EXPORT_WORKER_TIMEOUT) -> int:
+    """
+    Marca como "failed" os jobs pendentes cujo processo não está mais ativo (sem
+    batimento há mais de timeout segundos, encerrado ou de versões sem dono registrado)
+
+    Jobs de outros processos ativos (vários workers do uvicorn ou nós da API) são mantidos.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=timeout)
+    with SessionLocal() as db:
+        alive = select(ExportWorker.id).where(ExportWorker.heartbeat_at >= cutoff)
+        jobs = db.query(ExportJob).filter(
+            ExportJob.status == "queued",
+            or_(ExportJob.owner.is_(None), ExportJob.owner.not_in(alive)),
+        ).all()
+        for job in jobs:
+            job.status = "failed"
+            job.error = "Interrupted: the export worker stopped before finishing"
+            job.finished_at = datetime.now(timezone.utc)
+        db.query(ExportWorker).filter(ExportWorker.heartbeat_at < cutoff).delete(synchronize_session=False)
+        db.commit()
+    if jobs:
+        logger.warning(f"Export jobs of stopped workers marked as failed: {len(jobs)}")
+    return len(jobs)
+
+
+def cleanup_finished_jobs(retention: float = EXPORT_JOBS_RETENTION) -> int:
+    """
+    Remove jobs concluídos há mais de retention segundos; retorna quantos foram removidos
+
+    Os relatórios ficam no cache de exportação, compartilhado com GET /export/*, e
+    saem dele apenas pela política LRU de export_cache.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=retention)
+    with SessionLocal() as db:
+        removed = db.query(ExportJob).filter(
+            ExportJob.status.in_(("done", "failed")), ExportJob.finished_at < cutoff
+        ).delete(synchronize_session=False)
+        db.commit()
+    if removed:
+        logger.info(f"Expired export jobs removed: {removed}")
+    return removed
+
+
+class ExportJobJanitor:
+    """
+    Thread que mantém o batimento deste processo, falha jobs de processos encerrados e
+    executa cleanup_finished_jobs a cada cleanup_interval segundos
+    """
+
+    def __init__(self, heartbeat_interval: float = EXPORT_HEARTBEAT_INTERVAL,
+                 cleanup_interval: float = EXPORT_JOBS_CLEANUP_INTERVAL, retention: float = EXPORT_JOBS_RETENTION):
+        self.heartbeat_interval = heartbeat_interval
+        self.cleanup_interval = cleanup_interval
+        self.retention = retention
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        self._stop.clear()
+        # Registrado antes de aceitar jobs: outros processos não os tomam por órfãos
+        heartbeat()
+        if not (self._thread and self._thread.is_alive()):
+            self._thread = threading.Thread(target=self._run, name="export-jobs-janitor", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+        self._thread = None
+        # Encerramento normal: os jobs ainda pendentes deste processo ficam órfãos imediatamente
+        try:
+            with SessionLocal() as db:
+                db.query(ExportWorker).filter(ExportWorker.id == EXPORT_WORKER_ID).delete()
+                db.commit()
+        except Exception as e:
+            logger.error(f"Error unregistering export worker: {str(e)}")
+
+    def _run(self) -> None:
+        last_cleanup = None
+        while True:
+            try:
+                heartbeat()
+                fail_orphaned_jobs()
+                if last_cleanup is None or time.monotonic() - last_cleanup >= self.cleanup_interval:
+                    cleanup_finished_jobs(self.retention)
+                    last_cleanup = time.monotonic()
+            except Exception as e:
+                logger.error(f"Error maintaining export jobs: {str(e)}")
+            if self._stop.wait(self.heartbeat_interval):
+                return
+
+
+export_queue = ExportQueue()
+export_jobs_janitor = ExportJobJanitor()
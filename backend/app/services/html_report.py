@@ -0,0 +1,60 @@
+"""
+Renderização do relatório HTML do plano
+
+O template Jinja2 (templates/plan_report.html) é compilado uma única vez na
+importação do módulo, com autoescape do conteúdo do plano. O logo é convertido
+em data URI apenas quando o arquivo muda (cache por mtime/tamanho).
+"""
+import os
+import base64
+import datetime
+import mimetypes
+from typing import Iterator
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+# Versão do template HTML (entra na chave do cache de exportação; incrementar ao alterar o layout)
+HTML_TEMPLATE_VERSION = "2"
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates")
+
+_env = Environment(
+    loader=FileSystemLoader(TEMPLATES_DIR),
+    autoescape=select_autoescape(["html"]),
+    auto_reload=False,
+)
+_template = _env.get_template("plan_report.html")
+
+_logo_uris: dict[str, tuple[tuple, str]] = {}
+
+
+def logo_data_uri(logo_path: str | None) -> str:
+    """Data URI do logo, recalculado apenas quando mtime/tamanho do arquivo mudam"""
+    if not logo_path or not os.path.exists(logo_path):
+        return ""
+    stat = os.stat(logo_path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    cached = _logo_uris.get(logo_path)
+    if cached and cached[0] == version:
+        return cached[1]
+    mime = mimetypes.guess_type(logo_path)[0] or "image/png"
+    with open(logo_path, "rb") as f:
+        uri = f"data:{mime};base64,{base64.b64encode(f.read()).decode('ascii')}"
+    _logo_uris[logo_path] = (version, uri)
+    return uri
+
+
+def _context(data: dict, logo_path: str | None) -> dict:
+    return {
+        "data": data,
+        "logo_uri": logo_data_uri(logo_path),
+        "generated_at": datetime.datetime.utcnow().isoformat(),
+    }
+
+
+def render_plan_html(data: dict, logo_path: str | None = None) -> str:
+    return _template.render(_context(data, logo_path))
+
+
+def iter_plan_html(data: dict, logo_path: str | None = None) -> Iterator[str]:
+    """Renderiza o relatório em partes, para envio em streaming"""
+    return _template.generate(_context(data, logo_path))
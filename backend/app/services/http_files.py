@@ -0,0 +1,133 @@
+"""
+Envio de arquivos em streaming com suporte a Range, ETag e If-None-Match
+"""
+import os
+import mimetypes
+from urllib.parse import quote
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+STREAM_CHUNK_SIZE = 256 * 1024  # 256KB por bloco enviado
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """True se o If-None-Match da requisição corresponde ao ETag (ou é '*')"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [t.strip().removeprefix("W/") for t in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """
+    Interpreta um cabeçalho Range de intervalo único (bytes=a-b, bytes=a-, bytes=-n)
+
+    Returns:
+        (início, fim) inclusivos; None se ausente ou com múltiplos intervalos
+
+    Raises:
+        ValueError: intervalo malformado ou fora do arquivo (responder 416)
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start_s, _, end_s = spec.strip().partition("-")
+    if start_s == "":
+        suffix = int(end_s)
+        if suffix <= 0:
+            raise ValueError("Invalid suffix range")
+        start, end = max(0, size - suffix), size - 1
+    else:
+        start = int(start_s)
+        end = int(end_s) if end_s else size - 1
+        end = min(end, size - 1)
+    if start > end or start >= size:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+def iter_file(path: str, start: int = 0, length: int | None = None, chunk_size: int = STREAM_CHUNK_SIZE):
+    """Lê um arquivo em blocos a partir de start, sem carregá-lo inteiro em memória"""
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = length
+        while remaining is None or remaining > 0:
+            chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+
+def iter_buffered(chunks, chunk_size: int = 64 * 1024):
+    """Agrupa partes pequenas (ex.: saída de um template) em blocos de ~chunk_size bytes"""
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+        if len(buffer) >= chunk_size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def iter_fileobj(f, chunk_size: int = STREAM_CHUNK_SIZE):
+    """Lê um arquivo aberto (ex.: SpooledTemporaryFile) desde o início, fechando-o ao final"""
+    try:
+        f.seek(0)
+        while chunk := f.read(chunk_size):
+            yield chunk
+    finally:
+        f.close()
+
+
+def content_disposition(filename: str, disposition: str = "attachment") -> str:
+    """
+    Content-Disposition seguro para qualquer nome de arquivo: filename= com fallback
+    ASCII (aspas e barras escapadas) e filename*= (RFC 5987) com o nome em UTF-8
+    """
+    fallback = filename.encode("ascii", "replace").decode("ascii").replace("\\", "\\\\").replace('"', '\\"')
+    fallback = "".join(c if c.isprintable() else "_" for c in fallback)
+    value = f'{disposition}; filename="{fallback}"'
+    encoded = quote(filename, safe="")
+    if encoded != filename:
+        value += f"; filename*=UTF-8''{encoded}"
+    return value
+
+
+def send_file(request: Request, path: str, etag: str, filename: str, media_type: str | None = None) -> Response:
+    """Responde com o arquivo (200/206), 304 se o cliente já tem a versão ou 416 para Range inválido"""
+    etag = f'"{etag}"'
+    media_type = media_type or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": content_disposition(filename),
+    }
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    size = os.path.getsize(path)
+    range_header = request.headers.get("range")
+    # If-Range: só aplica o Range se o cliente ainda tem a mesma versão
+    if_range = request.headers.get("if-range")
+    if if_range and if_range.strip() != etag:
+        range_header = None
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}", **headers})
+
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(iter_file(path), media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    length = end - start + 1
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(length)
+    return StreamingResponse(iter_file(path, start, length), status_code=206, media_type=media_type, headers=headers)
@@ -1,145 +1,202 @@
 from reportlab.lib.pagesizes import A4
 from reportlab.lib import colors
-from reportlab.pdfgen import canvas
 from reportlab.lib.units import cm
-from reportlab.platypus import Table, TableStyle
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak, LongTable, TableStyle, Flowable
+from xml.sax.saxutils import escape
 from datetime import datetime
 import json
 
-def _kv_block(c, x, y, title, body, w, h):
-    c.setFillColor(colors.black)
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(x, y, title)
-    y -= 16
-    c.setFont("Helvetica", 10)
-    for line in body.split("\n"):
-        c.drawString(x, y, line[:120])
-        y -= 14
-        if y < 3*cm:
-            c.showPage()
-            y = h - 2*cm
-            c.setFont("Helvetica", 10)
-    return y - 8
-
-def generate_plan_pdf(plan: dict, outfile: str):
-    c = canvas.Canvas(outfile, pagesize=A4)
+# Versão do layout do PDF (entra na chave do cache de exportação; incrementar ao alterar o layout)
+PDF_TEMPLATE_VERSION = "4"
+
+JSON_FIELDS = (
+    "subject", "time_window", "user", "deadline", "aspects_essential", "aspects_known",
+    "aspects_to_know", "pirs", "collection", "extraordinary", "security",
+)
+OBJECT_FIELDS = ("subject", "time_window", "user", "deadline")
+
+# Estilos criados uma única vez (reutilizados por todas as renderizações)
+_styles = getSampleStyleSheet()
+STYLE_HEADING = ParagraphStyle("PlanHeading", parent=_styles["Heading4"], fontName="Helvetica-Bold",
+                               fontSize=12, leading=15, spaceBefore=4, spaceAfter=2)
+STYLE_BODY = ParagraphStyle("PlanBody", parent=_styles["BodyText"], fontName="Helvetica", fontSize=10, leading=14,
+                            spaceBefore=0, spaceAfter=0)
+STYLE_CELL = ParagraphStyle("PlanCell", parent=STYLE_BODY, fontSize=9, leading=11)
+STYLE_TOC = ParagraphStyle("PlanToc", parent=STYLE_BODY, textColor=colors.HexColor("#1D4ED8"))
+
+TABLE_STYLE = TableStyle([
+    ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#E2E8F0")),
+    ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+    ("FONT", (0, 0), (-1, 0), "Helvetica-Bold", 9),
+    ("FONT", (0, 1), (-1, -1), "Helvetica", 9),
+    ("VALIGN", (0, 0), (-1, -1), "TOP"),
+])
+
+HEADER_HEIGHT = 60
+CELL_PADDING = 12  # padding horizontal padrão das células (6pt de cada lado)
+# Linhas por LongTable: cada quebra de página re-mede as linhas restantes da tabela,
+# então blocos limitados mantêm o custo linear em planos com milhares de linhas
+TABLE_CHUNK_ROWS = 300
+
+
+def _parse_plan(plan: dict) -> dict:
+    """Converte campos ainda serializados como JSON (texto) em objetos/listas"""
+    for field in JSON_FIELDS:
+        if isinstance(plan.get(field), str):
+            empty = {} if field in OBJECT_FIELDS else []
+            plan[field] = json.loads(plan[field]) if plan[field] else empty
+    return plan
+
+
+def _text(value) -> str:
+    """Texto do plano escapado para o mini-markup do Paragraph, preservando quebras de linha"""
+    return escape("" if value is None else str(value)).replace("\n", "<br/>")
+
+
+def _cell(value, width: float):
+    """Texto simples quando cabe em uma linha da coluna; Paragraph (com quebra) caso contrário"""
+    text = "" if value is None else str(value)
+    if "\n" not in text and stringWidth(text, "Helvetica", 9) <= width - CELL_PADDING:
+        return text
+    return Paragraph(_text(text), STYLE_CELL)
+
+
+def _kv_block(title: str, body: str) -> list:
+    # Um Paragraph por linha: um parágrafo longo é re-quebrado a cada página em que é dividido
+    lines = [Paragraph(_text(line), STYLE_BODY) for line in str(body or "").split("\n")]
+    return [Paragraph(escape(title), STYLE_HEADING), *lines, Spacer(1, 6)]
+
+
+def _table(title: str, header: list, rows: list, col_widths: list) -> list:
+    story = [PageBreak(), Paragraph(escape(title), STYLE_HEADING), Spacer(1, 6)]
+    # LongTable com cabeçalho repetido em cada página
+    for start in range(0, len(rows), TABLE_CHUNK_ROWS):
+        # splitInRow: uma célula mais alta que a página é dividida entre páginas
+        table = LongTable([header] + rows[start:start + TABLE_CHUNK_ROWS], colWidths=col_widths, repeatRows=1,
+                          splitInRow=1)
+        table.setStyle(TABLE_STYLE)
+        story.append(table)
+    return story
+
+
+def _on_page(canvas, doc):
+    """Faixa de cabeçalho desenhada em todas as páginas"""
     w, h = A4
-    x, y = 2*cm, h - 2*cm
-
-    # Parse JSON strings in plan data
-    if isinstance(plan.get("subject"), str):
-        plan["subject"] = json.loads(plan["subject"]) if plan["subject"] else {}
-    if isinstance(plan.get("time_window"), str):
-        plan["time_window"] = json.loads(plan["time_window"]) if plan["time_window"] else {}
-    if isinstance(plan.get("user"), str):
-        plan["user"] = json.loads(plan["user"]) if plan["user"] else {}
-    if isinstance(plan.get("deadline"), str):
-        plan["deadline"] = json.loads(plan["deadline"]) if plan["deadline"] else {}
-    if isinstance(plan.get("aspects_essential"), str):
-        plan["aspects_essential"] = json.loads(plan["aspects_essential"]) if plan["aspects_essential"] else []
-    if isinstance(plan.get("aspects_known"), str):
-        plan["aspects_known"] = json.loads(plan["aspects_known"]) if plan["aspects_known"] else []
-    if isinstance(plan.get("aspects_to_know"), str):
-        plan["aspects_to_know"] = json.loads(plan["aspects_to_know"]) if plan["aspects_to_know"] else []
-    if isinstance(plan.get("pirs"), str):
-        plan["pirs"] = json.loads(plan["pirs"]) if plan["pirs"] else []
-    if isinstance(plan.get("collection"), str):
-        plan["collection"] = json.loads(plan["collection"]) if plan["collection"] else []
-    if isinstance(plan.get("extraordinary"), str):
-        plan["extraordinary"] = json.loads(plan["extraordinary"]) if plan["extraordinary"] else []
-    if isinstance(plan.get("security"), str):
-        plan["security"] = json.loads(plan["security"]) if plan["security"] else []
-
-    c.setFillColor(colors.HexColor("#0F172A"))
-    c.rect(0, h-60, w, 60, fill=1, stroke=0)
-    c.setFillColor(colors.white)
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(2*cm, h-40, "Plano de Inteligência — 1ª Fase (Planejamento)")
-    c.setFont("Helvetica", 9)
-    c.drawRightString(w-2*cm, h-30, datetime.utcnow().isoformat()+"Z")
-    c.setFillColor(colors.black)
-
-    y = h - 80
-    y = _kv_block(c, x, y, "Título", plan.get("title",""), w, h)
-    
-    # Format Assunto nicely
+    canvas.saveState()
+    canvas.setFillColor(colors.HexColor("#0F172A"))
+    canvas.rect(0, h - HEADER_HEIGHT, w, HEADER_HEIGHT, fill=1, stroke=0)
+    canvas.setFillColor(colors.white)
+    canvas.setFont("Helvetica-Bold", 16)
+    canvas.drawString(2*cm, h - 40, doc.title)
+    canvas.setFont("Helvetica", 9)
+    canvas.drawRightString(w - 2*cm, h - 30, doc.generated_at)
+    canvas.drawRightString(w - 2*cm, 1*cm, f"{canvas.getPageNumber()}")
+    canvas.restoreState()
+
+
+def _document(outfile, title: str) -> SimpleDocTemplate:
+    doc = SimpleDocTemplate(
+        outfile, pagesize=A4, title=title,
+        leftMargin=2*cm, rightMargin=2*cm, topMargin=HEADER_HEIGHT + 0.8*cm, bottomMargin=2*cm,
+    )
+    doc.generated_at = datetime.utcnow().isoformat() + "Z"
+    return doc
+
+
+def _plan_story(plan: dict) -> list:
+    """Flowables de um plano (o documento quebra páginas e tabelas conforme necessário)"""
+    plan = _parse_plan(plan)
+    story = _kv_block("Título", plan.get("title", ""))
+
     subject = plan.get("subject", {})
-    subject_text = f"O quê: {subject.get('what','')}\nQuem: {subject.get('who','')}\nOnde: {subject.get('where','')}"
-    y = _kv_block(c, x, y, "Assunto", subject_text, w, h)
-    
-    # Format Faixa de Tempo nicely
+    story += _kv_block("Assunto", f"O quê: {subject.get('what','')}\nQuem: {subject.get('who','')}\nOnde: {subject.get('where','')}")
+
     time_window = plan.get("time_window", {})
-    time_text = f"Início: {time_window.get('start','')}\nFim: {time_window.get('end','')}\nNotas: {time_window.get('research_notes','') or '(nenhuma anotação)'}"
-    y = _kv_block(c, x, y, "Faixa de Tempo (Pesquisa)", time_text, w, h)
-    
-    # Format Usuário nicely
+    story += _kv_block(
+        "Faixa de Tempo (Pesquisa)",
+        f"Início: {time_window.get('start','')}\nFim: {time_window.get('end','')}\nNotas: {time_window.get('research_notes','') or '(nenhuma anotação)'}",
+    )
+
     user = plan.get("user", {})
-    user_text = f"Principal: {user.get('principal','')}\nOutros: {user.get('others','') or '(nenhum)'}\nProfundidade: {user.get('depth','')}\nSigilo: {user.get('secrecy','')}"
-    y = _kv_block(c, x, y, "Usuário", user_text, w, h)
-    
-    y = _kv_block(c, x, y, "Finalidade", plan.get("purpose",""), w, h)
-    
-    # Format Prazo nicely
+    story += _kv_block(
+        "Usuário",
+        f"Principal: {user.get('principal','')}\nOutros: {user.get('others','') or '(nenhum)'}\nProfundidade: {user.get('depth','')}\nSigilo: {user.get('secrecy','')}",
+    )
+
+    story += _kv_block("Finalidade", plan.get("purpose", ""))
+
     deadline = plan.get("deadline", {})
-    deadline_text = f"Data Limite: {deadline.get('date','')}\nUrgência: {deadline.get('urgency','')}"
-    y = _kv_block(c, x, y, "Prazo", deadline_text, w, h)
+    story += _kv_block("Prazo", f"Data Limite: {deadline.get('date','')}\nUrgência: {deadline.get('urgency','')}")
 
     def list_to_text(lst):
         return "\n".join([f"• {i}" for i in lst]) if lst else "-"
 
-    sections = [
-        ("Aspectos Essenciais", list_to_text(plan.get("aspects_essential",[]))),
-        ("Aspectos Conhecidos", list_to_text(plan.get("aspects_known",[]))),
-        ("Aspectos a Conhecer", list_to_text(plan.get("aspects_to_know",[]))),
-        ("Medidas Extraordinárias", list_to_text(plan.get("extraordinary",[]))),
-        ("Medidas de Segurança", list_to_text(plan.get("security",[]))),
-    ]
-    for title, body in sections:
-        y = _kv_block(c, x, y, title, body, w, h)
-        if y < 3*cm:
-            c.showPage(); y = h - 2*cm
+    for title, field in (
+        ("Aspectos Essenciais", "aspects_essential"),
+        ("Aspectos Conhecidos", "aspects_known"),
+        ("Aspectos a Conhecer", "aspects_to_know"),
+        ("Medidas Extraordinárias", "extraordinary"),
+        ("Medidas de Segurança", "security"),
+    ):
+        story += _kv_block(title, list_to_text(plan.get(field, [])))
 
     pirs = plan.get("pirs", [])
     if pirs:
-        c.showPage()
-        y = h - 2*cm
-        c.setFont("Helvetica-Bold", 12)
-        c.drawString(x, y, "PIRs (Requisitos de Inteligência)")
-        y -= 20
-        data = [["#", "Aspecto Ref", "Pergunta", "Prioridade"]]
-        for i, p in enumerate(pirs):
-            data.append([str(i), str(p.get("aspect_ref","-")), p.get("question",""), p.get("priority","")])
-        table = Table(data, colWidths=[1.2*cm, 3*cm, 10*cm, 3*cm])
-        table.setStyle(TableStyle([
-            ("BACKGROUND",(0,0),(-1,0), colors.HexColor("#E2E8F0")),
-            ("GRID",(0,0),(-1,-1), 0.5, colors.grey),
-            ("FONT",(0,0),(-1,0),"Helvetica-Bold"),
-            ("FONT",(0,1),(-1,-1),"Helvetica"),
-        ]))
-        table.wrapOn(c, w, h)
-        table_height = 18 * (len(data))
-        table.drawOn(c, x, y - table_height)
+        widths = [1.2*cm, 2.3*cm, 10.5*cm, 3*cm]
+        rows = [
+            [str(i), str(p.get("aspect_ref", "-")), _cell(p.get("question", ""), widths[2]), p.get("priority", "")]
+            for i, p in enumerate(pirs)
+        ]
+        story += _table(
+            "PIRs (Requisitos de Inteligência)", ["#", "Aspecto Ref", "Pergunta", "Prioridade"], rows, widths,
+        )
 
     col = plan.get("collection", [])
     if col:
-        c.showPage()
-        y = h - 2*cm
-        c.setFont("Helvetica-Bold", 12)
-        c.drawString(x, y, "Plano de Coleta")
-        y -= 20
-        data = [["PIR #","Fonte","Método","Freq.","Owner","SLA (h)"]]
-        for t in col:
-            data.append([str(t.get("pir_index","")), t.get("source",""), t.get("method",""), t.get("frequency",""), t.get("owner",""), str(t.get("sla_hours",0))])
-        table = Table(data, colWidths=[2*cm, 4*cm, 5*cm, 2*cm, 3*cm, 2*cm])
-        table.setStyle(TableStyle([
-            ("BACKGROUND",(0,0),(-1,0), colors.HexColor("#E2E8F0")),
-            ("GRID",(0,0),(-1,-1), 0.5, colors.grey),
-            ("FONT",(0,0),(-1,0),"Helvetica-Bold"),
-            ("FONT",(0,1),(-1,-1),"Helvetica"),
-        ]))
-        table.wrapOn(c, w, h)
-        table_height = 18 * (len(data))
-        table.drawOn(c, x, y - table_height)
-
-    c.showPage()
-    c.save()
+        widths = [1.5*cm, 4*cm, 4.5*cm, 2*cm, 3.3*cm, 1.7*cm]
+        rows = [
+            [str(t.get("pir_index", "")), _cell(t.get("source", ""), widths[1]), _cell(t.get("method", ""), widths[2]),
+             t.get("frequency", ""), _cell(t.get("owner", ""), widths[4]), str(t.get("sla_hours", 0))]
+            for t in col
+        ]
+        story += _table(
+            "Plano de Coleta", ["PIR #", "Fonte", "Método", "Freq.", "Owner", "SLA (h)"], rows, widths,
+        )
+    return story
+
+
+class _Bookmark(Flowable):
+    """Marcador invisível: destino dos links do sumário e entrada no índice do PDF"""
+
+    def __init__(self, key: str, title: str):
+        super().__init__()
+        self.key = key
+        self.title = title
+
+    def wrap(self, availWidth, availHeight):
+        return 0, 0
+
+    def draw(self):
+        self.canv.bookmarkPage(self.key)
+        self.canv.addOutlineEntry(self.title, self.key, level=0)
+
+
+def generate_plan_pdf(plan: dict, outfile):
+    """Gera o PDF de um plano em outfile (caminho ou arquivo aberto)"""
+    doc = _document(outfile, "Plano de Inteligência — 1ª Fase (Planejamento)")
+    doc.build(_plan_story(plan), onFirstPage=_on_page, onLaterPages=_on_page)
+
+
+def generate_plans_pdf(plans: list[dict], outfile):
+    """PDF único com vários planos, precedido de um sumário com links e marcadores"""
+    doc = _document(outfile, f"Planos de Inteligência ({len(plans)})")
+    story = [Paragraph("Sumário", STYLE_HEADING)]
+    for plan in plans:
+        label = escape(f"#{plan.get('id')} — {plan.get('title', '')}")
+        story.append(Paragraph(f'<a href="#plan_{plan.get("id")}">{label}</a>', STYLE_TOC))
+    for plan in plans:
+        story += [PageBreak(), _Bookmark(f"plan_{plan.get('id')}", f"#{plan.get('id')} — {plan.get('title', '')}")]
+        story += _plan_story(plan)
+    doc.build(story, onFirstPage=_on_page, onLaterPages=_on_page)
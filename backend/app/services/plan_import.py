@@ -0,0 +1,127 @@
+"""
+Importação de planos em lote (POST /plans/bulk)
+
+O corpo (NDJSON ou array JSON) é lido em streaming e decodificado incrementalmente;
+cada linha é validada com PlanCreate e as válidas são inseridas em lotes, com um
+executemany por tabela e um commit por lote.
+"""
+import codecs
+import json
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from ..models.models import Plan, PlanPir, PlanCollectionTask
+from ..schemas.schemas import PlanCreate
+from .plan_items import pir_rows, collection_rows
+from .audit import log as audit_log
+
+_WHITESPACE = " \t\r\n"
+
+
+class RowDecoder:
+    """
+    Decodificador incremental de linhas: NDJSON (um objeto por linha) ou um array JSON
+
+    O formato é detectado pelo primeiro caractere não branco ('[' = array). feed()
+    retorna os valores completos já disponíveis; valores com JSON inválido são
+    retornados como a própria exceção (no array, a leitura para no primeiro erro).
+    """
+
+    def __init__(self):
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._array: bool | None = None
+        self._done = False
+
+    def feed(self, chunk: bytes, final: bool = False) -> list:
+        self._buffer += self._text.decode(chunk, final=final)
+        if self._array is None:
+            stripped = self._buffer.lstrip(_WHITESPACE)
+            if not stripped:
+                return []
+            self._array = stripped[0] == "["
+            self._buffer = stripped[1:] if self._array else stripped
+        return self._array_values(final) if self._array else self._ndjson_values(final)
+
+    def _ndjson_values(self, final: bool) -> list:
+        lines = self._buffer.split("\n")
+        self._buffer = "" if final else lines.pop()
+        values = []
+        for line in lines:
+            if line.strip():
+                try:
+                    values.append(json.loads(line))
+                except json.JSONDecodeError as e:
+                    values.append(e)
+        return values
+
+    def _array_values(self, final: bool) -> list:
+        values = []
+        while not self._done:
+            self._buffer = self._buffer.lstrip(_WHITESPACE + ",")
+            if self._buffer.startswith("]"):
+                self._done = True
+                break
+            if not self._buffer:
+                if final:
+                    values.append(ValueError("Unterminated JSON array"))
+                    self._done = True
+                break
+            try:
+                value, end = self._decoder.raw_decode(self._buffer)
+            except json.JSONDecodeError as e:
+                # Objeto ainda incompleto: espera mais dados (no fim do corpo, é um erro)
+                if final:
+                    values.append(e)
+                    self._done = True
+                break
+            values.append(value)
+            self._buffer = self._buffer[end:]
+        return values
+
+
+def plan_row(payload: PlanCreate) -> dict:
+    """Colunas de Plan para um PlanCreate validado (campos estruturados serializados em JSON)"""
+    return {
+        "title": payload.title,
+        "subject": json.dumps(payload.subject.model_dump(), ensure_ascii=False),
+        "time_window": json.dumps(payload.time_window.model_dump(), ensure_ascii=False),
+        "user": json.dumps(payload.user.model_dump(), ensure_ascii=False),
+        "purpose": payload.purpose,
+        "deadline": json.dumps(payload.deadline.model_dump(), ensure_ascii=False),
+        "aspects_essential": json.dumps(payload.aspects_essential, ensure_ascii=False),
+        "aspects_known": json.dumps(payload.aspects_known, ensure_ascii=False),
+        "aspects_to_know": json.dumps(payload.aspects_to_know, ensure_ascii=False),
+        "pirs": json.dumps([p.model_dump() for p in payload.pirs], ensure_ascii=False),
+        "collection": json.dumps([c.model_dump() for c in payload.collection], ensure_ascii=False),
+        "extraordinary": json.dumps(payload.extraordinary, ensure_ascii=False),
+        "security": json.dumps(payload.security, ensure_ascii=False),
+    }
+
+
+def insert_plans(db: Session, payloads: list[PlanCreate]) -> list[int]:
+    """
+    Insere um lote de planos com executemany (planos, PIRs e tarefas de coleta) e
+    confirma em uma única transação; retorna os ids na ordem dos payloads
+    """
+    try:
+        ids = db.scalars(
+            insert(Plan).returning(Plan.id, sort_by_parameter_order=True),
+            [plan_row(p) for p in payloads],
+        ).all()
+        pirs, collection = [], []
+        for plan_id, payload in zip(ids, payloads):
+            pirs += pir_rows(plan_id, [p.model_dump() for p in payload.pirs])
+            collection += collection_rows(plan_id, [c.model_dump() for c in payload.collection])
+            audit_log(db, action="create_plan", detail=f"Plan {plan_id} created (bulk import)",
+                      plan_id=plan_id, transaction=True)
+        # Mesmas linhas de insert_plan_items, agregadas para o lote inteiro
+        if pirs:
+            db.execute(insert(PlanPir), pirs)
+        if collection:
+            db.execute(insert(PlanCollectionTask), collection)
+        db.commit()
+        return list(ids)
+    except Exception:
+        db.rollback()
+        raise
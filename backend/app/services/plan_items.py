@@ -0,0 +1,95 @@
+"""
+PIRs e tarefas de coleta normalizadas em tabelas relacionais
+"""
+import json
+import logging
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from ..models.models import Plan, PlanPir, PlanCollectionTask, SchemaMigration
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_MIGRATION = "0001_normalize_pirs_collection"
+BACKFILL_BATCH_SIZE = 500
+
+
+def pir_rows(plan_id: int, pirs: list[dict]) -> list[dict]:
+    """Converte a lista de PIRs (JSON) de um plano em linhas da tabela pirs"""
+    return [
+        {
+            "plan_id": plan_id,
+            "position": i,
+            "aspect_ref": p.get("aspect_ref"),
+            "question": p.get("question", ""),
+            "priority": p.get("priority", "media"),
+            "justification": p.get("justification", ""),
+        }
+        for i, p in enumerate(pirs)
+    ]
+
+
+def collection_rows(plan_id: int, collection: list[dict]) -> list[dict]:
+    """Converte a lista de tarefas de coleta (JSON) de um plano em linhas da tabela collection_tasks"""
+    return [
+        {
+            "plan_id": plan_id,
+            "position": i,
+            "pir_index": t.get("pir_index", 0),
+            "source": t.get("source", ""),
+            "method": t.get("method", ""),
+            "frequency": t.get("frequency", "unico"),
+            "owner": t.get("owner", ""),
+            "sla_hours": t.get("sla_hours", 0),
+        }
+        for i, t in enumerate(collection)
+    ]
+
+
+def insert_plan_items(db: Session, plan_id: int, pirs: list[dict], collection: list[dict]) -> None:
+    """Insere (sem commit) as linhas normalizadas de um plano usando executemany"""
+    pr = pir_rows(plan_id, pirs)
+    cr = collection_rows(plan_id, collection)
+    if pr:
+        db.execute(insert(PlanPir), pr)
+    if cr:
+        db.execute(insert(PlanCollectionTask), cr)
+
+
+def backfill_plan_items(db: Session) -> int:
+    """
+    Migração única: popula pirs/collection_tasks a partir das colunas JSON existentes
+
+    Returns:
+        Número de planos processados (0 se a migração já havia sido aplicada)
+    """
+    if db.get(SchemaMigration, BACKFILL_MIGRATION):
+        return 0
+
+    # Recomeça do zero caso uma execução anterior tenha sido interrompida
+    db.query(PlanPir).delete()
+    db.query(PlanCollectionTask).delete()
+
+    count = 0
+    pirs_batch, collection_batch = [], []
+    rows = db.query(Plan.id, Plan.pirs, Plan.collection).order_by(Plan.id).yield_per(BACKFILL_BATCH_SIZE)
+    for row in rows:
+        pirs_batch.extend(pir_rows(row.id, json.loads(row.pirs or "[]")))
+        collection_batch.extend(collection_rows(row.id, json.loads(row.collection or "[]")))
+        count += 1
+        if count % BACKFILL_BATCH_SIZE == 0:
+            _flush(db, pirs_batch, collection_batch)
+    _flush(db, pirs_batch, collection_batch)
+
+    db.add(SchemaMigration(name=BACKFILL_MIGRATION))
+    db.commit()
+    logger.info(f"Backfill {BACKFILL_MIGRATION} applied to {count} plans")
+    return count
+
+
+def _flush(db: Session, pirs_batch: list, collection_batch: list) -> None:
+    if pirs_batch:
+        db.execute(insert(PlanPir), pirs_batch)
+        pirs_batch.clear()
+    if collection_batch:
+        db.execute(insert(PlanCollectionTask), collection_batch)
+        collection_batch.clear()
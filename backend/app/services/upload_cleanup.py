@@ -0,0 +1,84 @@
+"""
+Limpeza de uploads em blocos abandonados
+
+Um upload iniciado e nunca concluído deixa um arquivo parcial em UPLOAD_DIR/tmp e
+um registro em evidence_uploads. Na inicialização e a cada UPLOAD_CLEANUP_INTERVAL
+segundos, uploads sem atividade (último bloco recebido ou, sem blocos, criação) há
+mais de UPLOAD_PARTIAL_TTL segundos são descartados: arquivo parcial e registro.
+"""
+import os
+import time
+import threading
+import logging
+from datetime import timezone
+from ..db.database import SessionLocal
+from ..models.models import EvidenceUpload
+from .evidence_store import UPLOAD_PARTIAL_TTL, UploadBusyError, cleanup_stale_partials, discard_partial, partial_mtime
+from .audit import log as audit_log
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CLEANUP_INTERVAL = float(os.environ.get("UPLOAD_CLEANUP_INTERVAL", 3600))  # segundos
+
+
+def cleanup_abandoned_uploads(ttl: float = UPLOAD_PARTIAL_TTL) -> int:
+    """Descarta uploads em blocos sem atividade há mais de ttl segundos; retorna quantos"""
+    cutoff = time.time() - ttl
+    removed = 0
+    with SessionLocal() as db:
+        for upload in db.query(EvidenceUpload).all():
+            last = partial_mtime(upload.id)
+            if last is None and upload.created_at is not None:
+                created = upload.created_at
+                # SQLite devolve o horário do servidor (UTC) sem fuso
+                last = (created if created.tzinfo else created.replace(tzinfo=timezone.utc)).timestamp()
+            if last is None or last >= cutoff:
+                continue
+            try:
+                discard_partial(upload.id)
+            except UploadBusyError:
+                continue
+            db.delete(upload)
+            audit_log(db, action="upload_expired", detail=f"Chunked upload {upload.id} ({upload.filename}) expired",
+                      plan_id=upload.plan_id, transaction=True)
+            removed += 1
+        db.commit()
+    # Parciais sem registro (ou de uploads diretos interrompidos)
+    cleanup_stale_partials(ttl)
+    if removed:
+        logger.info(f"Abandoned chunked uploads removed: {removed}")
+    return removed
+
+
+class UploadJanitor:
+    """Thread que executa cleanup_abandoned_uploads periodicamente"""
+
+    def __init__(self, interval: float = UPLOAD_CLEANUP_INTERVAL, ttl: float = UPLOAD_PARTIAL_TTL):
+        self.interval = interval
+        self.ttl = ttl
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        self._stop.clear()
+        if not (self._thread and self._thread.is_alive()):
+            self._thread = threading.Thread(target=self._run, name="upload-janitor", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            try:
+                cleanup_abandoned_uploads(self.ttl)
+            except Exception as e:
+                logger.error(f"Error cleaning up abandoned uploads: {str(e)}")
+            if self._stop.wait(self.interval):
+                return
+
+
+upload_janitor = UploadJanitor()
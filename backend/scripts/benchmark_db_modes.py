@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Benchmark de carga: endpoints de planos em DB_MODE=sync vs DB_MODE=async
+Uso: python benchmark_db_modes.py [--requests 2000] [--concurrency 100] [--plans 200] [--output resultado.json]
+
+Sobe um uvicorn por modo com um banco SQLite temporário, cria planos de exemplo
+e dispara requisições concorrentes (GET /plans/{id} e GET /plans) medindo
+throughput e latências p50/p95/p99.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+# Raiz do repositório (backend/scripts -> raiz)
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SAMPLE_PLAN = {
+    "title": "Plano Benchmark",
+    "subject": {"what": "Benchmark", "who": "QA", "where": "Local"},
+    "time_window": {"start": "2025-01-01", "end": "2025-12-31"},
+    "user": {"principal": "bench@example.com", "others": "", "depth": "tecnico", "secrecy": "publico"},
+    "purpose": "Medir desempenho",
+    "deadline": {"date": "2025-12-31", "urgency": "media"},
+    "aspects_essential": ["Aspecto 1"],
+    "aspects_known": [],
+    "aspects_to_know": ["A Conhecer 1"],
+    "pirs": [{"aspect_ref": 0, "question": "Pergunta?", "priority": "alta", "justification": ""}],
+    "collection": [{"pir_index": 0, "source": "Fonte", "method": "API", "frequency": "diario", "owner": "QA", "sla_hours": 24}],
+    "extraordinary": [],
+    "security": ["controle de acesso"],
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_server(mode: str, workdir: str, port: int) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        DB_MODE=mode,
+        DATABASE_PATH=os.path.join(workdir, f"bench_{mode}.db"),
+        BACKUP_DIR=os.path.join(workdir, "backups"),
+        RATE_LIMIT_ENABLED="false",
+    )
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.app.main:app", "--app-dir", REPO_DIR,
+         "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env,
+    )
+    for _ in range(100):
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError(f"Servidor ({mode}) não respondeu em http://127.0.0.1:{port}")
+
+
+async def _run_load(base_url: str, total: int, concurrency: int, plan_ids: list[int]) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(i)
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal errors
+        while True:
+            try:
+                i = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            # 80% leituras de plano, 20% listagens paginadas
+            url = f"/plans/{random.choice(plan_ids)}" if i % 5 else "/plans?limit=20"
+            start = time.perf_counter()
+            r = await client.get(url)
+            latencies.append(time.perf_counter() - start)
+            if r.status_code != 200:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 1),
+        "latency_ms": {
+            "mean": round(statistics.mean(latencies) * 1000, 2),
+            "p50": round(pct(0.50), 2),
+            "p95": round(pct(0.95), 2),
+            "p99": round(pct(0.99), 2),
+        },
+    }
+
+
+def benchmark_mode(mode: str, args) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        port = _free_port()
+        proc = _start_server(mode, workdir, port)
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            with httpx.Client(base_url=base_url, timeout=30) as client:
+                plan_ids = [client.post("/plans", json=SAMPLE_PLAN).json()["id"] for _ in range(args.plans)]
+            return asyncio.run(_run_load(base_url, args.requests, args.concurrency, plan_ids))
+        finally:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark DB_MODE=sync vs DB_MODE=async")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--plans", type=int, default=200)
+    parser.add_argument("--modes", default="sync,async")
+    parser.add_argument("--output", help="Arquivo JSON para salvar os resultados")
+    args = parser.parse_args()
+
+    results = {}
+    for mode in args.modes.split(","):
+        print(f"🔄 Executando benchmark em DB_MODE={mode}...")
+        results[mode] = benchmark_mode(mode, args)
+        r = results[mode]
+        print(f"   {r['throughput_rps']} req/s | p50 {r['latency_ms']['p50']} ms | "
+              f"p99 {r['latency_ms']['p99']} ms | erros: {r['errors']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"✅ Resultados salvos em {args.output}")
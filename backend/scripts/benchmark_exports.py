@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Benchmark de renderização de relatórios (PDF e HTML) por tamanho do plano
+Uso: python benchmark_exports.py [--sizes 10,100,1000] [--repeat 3] [--output resultado.json]
+                                 [--compare anterior.json] [--plot escala.png]
+
+Gera planos sintéticos em que cada tamanho N define o número de PIRs, de tarefas
+de coleta e de linhas de aspectos/medidas. Cada caso roda em um processo novo
+para medir o pico de memória (RSS) isoladamente; registra tempo de parede
+(mínimo e mediana), pico de RSS e tamanho do arquivo gerado.
+"""
+import argparse
+import copy
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+# Raiz do repositório (backend/scripts -> raiz)
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+KINDS = ("pdf", "html")
+PRIORITIES = ("baixa", "media", "alta", "critica")
+FREQUENCIES = ("unico", "diario", "semanal", "mensal")
+
+
+def synthetic_plan(size: int) -> dict:
+    """Plano com size PIRs, size tarefas de coleta e size linhas em cada lista de aspectos/medidas"""
+    lines = [f"Item {i}: descrição de tamanho médio para ocupar parte da linha" for i in range(size)]
+    return {
+        "id": 1,
+        "title": f"Plano Benchmark ({size})",
+        "subject": {"what": "Benchmark de exportação", "who": "QA", "where": "Local"},
+        "time_window": {"start": "2025-01-01", "end": "2025-12-31", "research_notes": "Plano sintético"},
+        "user": {"principal": "bench@example.com", "others": "", "depth": "tecnico", "secrecy": "publico"},
+        "purpose": "Medir o custo de renderização por tamanho do plano",
+        "deadline": {"date": "2025-12-31", "urgency": "media"},
+        "aspects_essential": lines,
+        "aspects_known": lines,
+        "aspects_to_know": lines,
+        "pirs": [
+            {"aspect_ref": i, "question": f"Pergunta {i}: qual é o estado atual do tema monitorado?" * (1 + i % 3),
+             "priority": PRIORITIES[i % 4], "justification": ""}
+            for i in range(size)
+        ],
+        "collection": [
+            {"pir_index": i, "source": f"Fonte {i}", "method": "Coleta em fontes abertas" * (1 + i % 2),
+             "frequency": FREQUENCIES[i % 4], "owner": f"Equipe {i % 7}", "sla_hours": 24}
+            for i in range(size)
+        ],
+        "extraordinary": lines,
+        "security": lines,
+    }
+
+
+def _max_rss_bytes() -> int:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KiB; macOS em bytes
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def _run_case(kind: str, size: int, repeat: int) -> dict:
+    """Executado em um processo novo: importa o renderizador, mede e retorna as métricas"""
+    sys.path.insert(0, REPO_DIR)
+    from backend.app.services.pdf import generate_plan_pdf
+    from backend.app.services.html_report import render_plan_html
+
+    plan = synthetic_plan(size)
+    baseline_rss = _max_rss_bytes()
+    times = []
+    with tempfile.TemporaryDirectory() as workdir:
+        outfile = os.path.join(workdir, f"plan.{kind}")
+        for _ in range(repeat):
+            data = copy.deepcopy(plan)
+            start = time.perf_counter()
+            if kind == "pdf":
+                generate_plan_pdf(data, outfile)
+            else:
+                with open(outfile, "w", encoding="utf-8") as f:
+                    f.write(render_plan_html(data))
+            times.append(time.perf_counter() - start)
+        output_bytes = os.path.getsize(outfile)
+    peak_rss = _max_rss_bytes()
+    return {
+        "kind": kind,
+        "size": size,
+        "repeat": repeat,
+        "wall_s": {"min": round(min(times), 4), "median": round(statistics.median(times), 4)},
+        "peak_rss_bytes": peak_rss,
+        "rss_growth_bytes": peak_rss - baseline_rss,
+        "output_bytes": output_bytes,
+    }
+
+
+def run_benchmark(sizes: list[int], kinds: list[str], repeat: int) -> list[dict]:
+    results = []
+    ctx = multiprocessing.get_context("spawn")
+    for kind in kinds:
+        for size in sizes:
+            # Um processo por caso: o pico de RSS não é contaminado pelos casos anteriores
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                r = pool.submit(_run_case, kind, size, repeat).result()
+            results.append(r)
+            print(f"   {kind:4} N={size:<6} {r['wall_s']['median'] * 1000:9.1f} ms | "
+                  f"RSS pico {r['peak_rss_bytes'] / 1024 / 1024:7.1f} MB | saída {r['output_bytes'] / 1024:8.1f} KB")
+    return results
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results: list[dict], previous_path: str) -> None:
+    """Imprime a variação de tempo e memória em relação a um resultado anterior"""
+    with open(previous_path, encoding="utf-8") as f:
+        previous = {(r["kind"], r["size"]): r for r in json.load(f)["results"]}
+    print(f"📊 Comparação com {previous_path}:")
+    for r in results:
+        old = previous.get((r["kind"], r["size"]))
+        if not old:
+            continue
+        time_ratio = r["wall_s"]["median"] / old["wall_s"]["median"] if old["wall_s"]["median"] else float("inf")
+        rss_ratio = r["peak_rss_bytes"] / old["peak_rss_bytes"] if old["peak_rss_bytes"] else float("inf")
+        print(f"   {r['kind']:4} N={r['size']:<6} tempo x{time_ratio:.2f} | RSS x{rss_ratio:.2f}")
+
+
+def plot(results: list[dict], path: str) -> None:
+    """Gráficos de tempo e pico de RSS por tamanho (requer matplotlib)"""
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("⚠️ matplotlib não instalado; gráfico não gerado (pip install matplotlib)")
+        return
+    fig, (ax_time, ax_rss) = plt.subplots(1, 2, figsize=(11, 4))
+    for kind in KINDS:
+        rows = [r for r in results if r["kind"] == kind]
+        if not rows:
+            continue
+        sizes = [r["size"] for r in rows]
+        ax_time.plot(sizes, [r["wall_s"]["median"] for r in rows], marker="o", label=kind)
+        ax_rss.plot(sizes, [r["peak_rss_bytes"] / 1024 / 1024 for r in rows], marker="o", label=kind)
+    for ax, label in ((ax_time, "Tempo (s, mediana)"), (ax_rss, "Pico de RSS (MB)")):
+        ax.set_xscale("log")
+        ax.set_xlabel("Tamanho do plano (N)")
+        ax.set_ylabel(label)
+        ax.grid(True, alpha=0.3)
+        ax.legend()
+    fig.tight_layout()
+    fig.savefig(path)
+    print(f"✅ Gráfico salvo em {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de renderização PDF/HTML por tamanho do plano")
+    parser.add_argument("--sizes", default="10,100,1000", help="Tamanhos N separados por vírgula")
+    parser.add_argument("--kinds", default="pdf,html")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Arquivo JSON para salvar os resultados")
+    parser.add_argument("--compare", help="JSON de uma execução anterior para comparação")
+    parser.add_argument("--plot", help="Arquivo PNG com os gráficos de escala")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    kinds = [k for k in args.kinds.split(",") if k in KINDS]
+    print(f"🔄 Renderizando {', '.join(kinds)} para N = {sizes} ({args.repeat} repetições)...")
+    results = run_benchmark(sizes, kinds, args.repeat)
+
+    if args.compare:
+        compare(results, args.compare)
+    if args.plot:
+        plot(results, args.plot)
+    if args.output:
+        report = {
+            "commit": _git_commit(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Resultados salvos em {args.output}")
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
 Script manual para restaurar backup do banco de dados
-Uso: python restore_backup.py <nome_do_backup.db>
+Uso: python restore_backup.py <nome_do_backup>
 """
 import sys
 import os
@@ -16,7 +16,7 @@ logging.basicConfig(level=logging.INFO)
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("❌ Uso: python restore_backup.py <nome_do_backup.db>")
+        print("❌ Uso: python restore_backup.py <nome_do_backup>")
         print("\n📋 Backups disponíveis:")
         backups = list_backups()
         if backups:
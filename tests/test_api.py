@@ -10,9 +10,14 @@ Para rodar com cobertura:
   pytest --cov=backend --cov-report=html
 """
 
+import hashlib
+import io
 import httpx
 import json
 import pytest
+import threading
+import time
+import zipfile
 
 BASE_URL = "http://127.0.0.1:8000"
 TIMEOUT = 5.0
@@ -82,14 +87,120 @@ class TestPlans:
         assert data["id"] is not None
         return data["id"]
 
+    def test_bulk_import(self, sample_plan):
+        """Deve importar planos em lote (NDJSON e array JSON) com resultado por linha"""
+        invalid = {**sample_plan, "subject": {"what": "Sem quem"}}
+        ndjson = "\n".join([json.dumps(sample_plan), "{não é json", json.dumps(invalid), json.dumps(sample_plan)])
+        body = json.dumps([sample_plan] * 3).encode()
+
+        def chunks():
+            # Corpo enviado em pedaços menores que um plano (decodificação incremental)
+            for i in range(0, len(body), 100):
+                yield body[i:i + 100]
+
+        with httpx.Client(timeout=TIMEOUT) as client:
+            lines = client.post(f"{BASE_URL}/plans/bulk", content=ndjson.encode(),
+                                headers={"Content-Type": "application/x-ndjson"})
+            array = client.post(f"{BASE_URL}/plans/bulk", content=chunks(),
+                                headers={"Content-Type": "application/json"})
+            assert lines.status_code == 200 and array.status_code == 200
+            created = client.get(f"{BASE_URL}/plans/{lines.json()['results'][3]['id']}").json()
+
+        report = lines.json()
+        assert (report["created"], report["failed"]) == (2, 2)
+        assert [r["status"] for r in report["results"]] == ["created", "error", "error", "created"]
+        assert report["results"][2]["errors"][0]["loc"] == ["subject", "who"]
+        assert array.json()["created"] == 3
+        assert created["title"] == sample_plan["title"] and created["pirs"] == sample_plan["pirs"]
+
+    def test_bulk_import_row_limit(self, sample_plan):
+        """Acima do limite de linhas o relatório deve vir com as linhas já importadas e o excedente como erro"""
+        # Limite padrão (PLANS_IMPORT_MAX_ROWS=20000); linhas inválidas também contam
+        ndjson = "\n".join([json.dumps(sample_plan)] + ["x"] * 19999 + [json.dumps(sample_plan)] * 2)
+
+        with httpx.Client(timeout=60) as client:
+            response = client.post(f"{BASE_URL}/plans/bulk", content=ndjson.encode(),
+                                   headers={"Content-Type": "application/x-ndjson"})
+
+        assert response.status_code == 200
+        report = response.json()
+        assert report["truncated"] is True
+        assert (report["created"], report["failed"]) == (1, 20000)
+        assert report["results"][0]["status"] == "created"
+        assert report["results"][-1]["index"] == 20000
+        assert "Row limit exceeded" in report["results"][-1]["errors"][0]["msg"]
+
     def test_list_plans(self):
-        """Deve listar todos os planos"""
+        """Deve listar os planos em páginas"""
         with httpx.Client(timeout=TIMEOUT) as client:
             response = client.get(f"{BASE_URL}/plans")
 
         assert response.status_code == 200
-        plans = response.json()
-        assert isinstance(plans, list)
+        page = response.json()
+        assert isinstance(page["items"], list)
+        assert "next_cursor" in page
+
+    def test_list_plans_cursor(self, sample_plan):
+        """Deve paginar por cursor sem repetir planos entre páginas"""
+        with httpx.Client(timeout=TIMEOUT) as client:
+            for _ in range(3):
+                client.post(f"{BASE_URL}/plans", json=sample_plan)
+            first = client.get(f"{BASE_URL}/plans", params={"limit": 2}).json()
+            assert len(first["items"]) == 2
+            assert first["next_cursor"] == first["items"][-1]["id"]
+            second = client.get(
+                f"{BASE_URL}/plans", params={"limit": 2, "after": first["next_cursor"]}
+            ).json()
+
+        first_ids = [p["id"] for p in first["items"]]
+        second_ids = [p["id"] for p in second["items"]]
+        assert first_ids == sorted(first_ids, reverse=True)
+        assert all(i < min(first_ids) for i in second_ids)
+
+    def test_plan_summary(self, sample_plan):
+        """Deve retornar apenas os campos resumidos do plano"""
+        with httpx.Client(timeout=TIMEOUT) as client:
+            client.post(f"{BASE_URL}/plans", json=sample_plan)
+            response = client.get(f"{BASE_URL}/plans/summary", params={"limit": 1})
+
+        assert response.status_code == 200
+        item = response.json()["items"][0]
+        assert set(item) == {"id", "title", "secrecy", "deadline"}
+        assert item["secrecy"] == "publico"
+
+    def test_list_plans_fields(self, sample_plan):
+        """Deve projetar apenas os campos pedidos em ?fields="""
+        with httpx.Client(timeout=TIMEOUT) as client:
+            client.post(f"{BASE_URL}/plans", json=sample_plan)
+            response = client.get(f"{BASE_URL}/plans", params={"limit": 1, "fields": "title,pirs"})
+            invalid = client.get(f"{BASE_URL}/plans", params={"fields": "title,nope"})
+
+        assert response.status_code == 200
+        item = response.json()["items"][0]
+        assert set(item) == {"id", "title", "pirs"}
+        assert item["pirs"][0]["priority"] == "alta"
+        assert invalid.status_code == 400
+
+    def test_query_pirs_and_collection_tasks(self, sample_plan):
+        """Deve consultar PIRs e tarefas de coleta entre planos com filtros no banco"""
+        sample_plan["pirs"][0]["priority"] = "critica"
+        sample_plan["collection"][0]["owner"] = "Equipe SLA"
+        sample_plan["collection"][0]["sla_hours"] = 12
+        with httpx.Client(timeout=TIMEOUT) as client:
+            plan_id = client.post(f"{BASE_URL}/plans", json=sample_plan).json()["id"]
+            pirs = client.get(f"{BASE_URL}/pirs", params={"priority": "critica", "plan_id": plan_id}).json()
+            tasks = client.get(
+                f"{BASE_URL}/collection_tasks", params={"owner": "Equipe SLA", "max_sla_hours": 24}
+            ).json()
+            none = client.get(
+                f"{BASE_URL}/collection_tasks", params={"owner": "Equipe SLA", "max_sla_hours": 6}
+            ).json()
+
+        assert [p["plan_id"] for p in pirs["items"]] == [plan_id]
+        assert pirs["items"][0]["question"] == "Qual é a resposta?"
+        assert plan_id in [t["plan_id"] for t in tasks["items"]]
+        assert all(t["sla_hours"] <= 24 for t in tasks["items"])
+        assert none["items"] == []
 
     def test_get_plan_not_found(self):
         """Deve retornar 404 para plano inexistente"""
@@ -99,5 +210,320 @@ class TestPlans:
         assert response.status_code == 404
 
 
+
+class TestExport:
+    """Testes de exportação de relatórios"""
+
+    @pytest.fixture
+    def plan_id(self):
+        plan = {
+            "title": "Plano Exportação",
+            "subject": {"what": "Exportação", "who": "QA", "where": "Local"},
+            "time_window": {"start": "2025-11-01", "end": "2025-11-30"},
+            "user": {"principal": "qa@example.com", "depth": "tecnico", "secrecy": "publico"},
+            "purpose": "Testar exportação",
+            "deadline": {"date": "2025-11-30", "urgency": "baixa"},
+            "pirs": [{"question": "Pergunta <b>1</b>?", "priority": "alta"}],
+        }
+        with httpx.Client(timeout=TIMEOUT) as client:
+            return client.post(f"{BASE_URL}/plans", json=plan).json()["id"]
+
+    @pytest.mark.parametrize("kind, media_type", [("pdf", "application/pdf"), ("html", "text/html")])
+    def test_export_cached_with_etag(self, plan_id, kind, media_type):
+        """Deve reutilizar o relatório renderizado e responder 304 para o mesmo ETag"""
+        with httpx.Client(timeout=30) as client:
+            first = client.get(f"{BASE_URL}/export/{kind}/{plan_id}")
+            second = client.get(f"{BASE_URL}/export/{kind}/{plan_id}")
+            cached = client.get(f"{BASE_URL}/export/{kind}/{plan_id}", headers={"If-None-Match": first.headers["ETag"]})
+
+        assert first.status_code == 200
+        assert first.headers["content-type"].startswith(media_type)
+        assert second.headers["ETag"] == first.headers["ETag"]
+        assert second.content == first.content
+        assert cached.status_code == 304
+        if kind == "html":
+            # Conteúdo do plano é escapado pelo template
+            assert b"Pergunta &lt;b&gt;1&lt;/b&gt;?" in first.content
+
+    def test_export_pdf_cell_taller_than_page(self, plan_id):
+        """Uma célula de tabela maior que uma página deve ser dividida, não derrubar a exportação"""
+        with httpx.Client(timeout=60) as client:
+            plan = client.get(f"{BASE_URL}/plans/{plan_id}").json()
+            plan["pirs"] = [{"question": "palavra " * 3000, "priority": "alta"}]
+            long_id = client.post(f"{BASE_URL}/plans", json=plan).json()["id"]
+            response = client.get(f"{BASE_URL}/export/pdf/{long_id}")
+
+        assert response.status_code == 200
+        assert response.content.startswith(b"%PDF")
+
+    def test_export_stream(self, plan_id):
+        """Deve renderizar em memória (?stream=true) com o ETag do cache em versão fraca"""
+        with httpx.Client(timeout=30) as client:
+            pdf = client.get(f"{BASE_URL}/export/pdf/{plan_id}", params={"stream": True})
+            html = client.get(f"{BASE_URL}/export/html/{plan_id}", params={"stream": True})
+            cached = client.get(f"{BASE_URL}/export/html/{plan_id}", headers={"If-None-Match": html.headers["ETag"]})
+            restream = client.get(
+                f"{BASE_URL}/export/html/{plan_id}", params={"stream": True},
+                headers={"If-None-Match": cached.headers["ETag"]},
+            )
+
+        assert pdf.status_code == 200
+        assert pdf.content.startswith(b"%PDF")
+        assert int(pdf.headers["Content-Length"]) == len(pdf.content)
+        assert html.status_code == 200
+        assert b"Plano Exporta" in html.content
+        assert cached.status_code == 304
+        # Renderização sob demanda: ETag fraco, equivalente (não idêntico byte a byte) ao do cache
+        assert html.headers["ETag"] == "W/" + cached.headers["ETag"]
+        assert restream.status_code == 304
+
+    def test_export_job(self, plan_id):
+        """Deve renderizar o PDF em segundo plano e disponibilizá-lo pelo job"""
+        with httpx.Client(timeout=TIMEOUT) as client:
+            job = client.post(f"{BASE_URL}/exports", json={"plan_id": plan_id, "format": "pdf"})
+            assert job.status_code == 202
+            job_id = job.json()["job_id"]
+
+            deadline = time.time() + 60
+            status = job.json()
+            while status["status"] == "queued" and time.time() < deadline:
+                time.sleep(0.5)
+                status = client.get(f"{BASE_URL}/exports/{job_id}").json()
+            assert status["status"] == "done", status
+
+            download = client.get(f"{BASE_URL}{status['download_url']}")
+            missing = client.get(f"{BASE_URL}/exports/{'0' * 32}")
+
+        assert download.status_code == 200
+        assert download.content.startswith(b"%PDF")
+        assert missing.status_code == 404
+
+    def test_bulk_export(self, plan_id):
+        """Deve exportar vários planos em um ZIP e em um PDF único"""
+        with httpx.Client(timeout=60) as client:
+            other = client.post(f"{BASE_URL}/plans", json=client.get(f"{BASE_URL}/plans/{plan_id}").json()).json()["id"]
+            ids = [plan_id, other]
+            archive = client.post(f"{BASE_URL}/exports/bulk", json={"plan_ids": ids, "format": "zip"})
+            merged = client.post(f"{BASE_URL}/exports/bulk", json={"plan_ids": ids, "format": "pdf"})
+
+        assert archive.status_code == 200
+        with zipfile.ZipFile(io.BytesIO(archive.content)) as zf:
+            assert zf.namelist() == [f"plan_{i}.pdf" for i in ids]
+            assert zf.read(f"plan_{other}.pdf").startswith(b"%PDF")
+        assert merged.status_code == 200
+        assert merged.content.startswith(b"%PDF")
+
+
+class TestEvidence:
+    """Testes de upload de evidências"""
+
+    # Um plano para toda a classe (POST /plans tem limite de 20/minuto)
+    @pytest.fixture(scope="class")
+    @classmethod
+    def plan_id(cls):
+        plan = {
+            "subject": {"what": "Evidências", "who": "QA", "where": "Local"},
+            "time_window": {"start": "2025-11-01", "end": "2025-11-30"},
+            "user": {"principal": "qa@example.com", "depth": "tecnico", "secrecy": "publico"},
+            "purpose": "Testar evidências",
+            "deadline": {"date": "2025-11-30", "urgency": "baixa"},
+        }
+        with httpx.Client(timeout=TIMEOUT) as client:
+            return client.post(f"{BASE_URL}/plans", json=plan).json()["id"]
+
+    def test_upload_deduplicates_content(self, plan_id):
+        """Deve calcular o SHA-256 e reutilizar o mesmo conteúdo para nomes diferentes"""
+        content = b"conteudo de evidencia " * 1000
+        with httpx.Client(timeout=TIMEOUT) as client:
+            first = client.post(
+                f"{BASE_URL}/evidence/upload",
+                data={"plan_id": plan_id},
+                files={"file": ("a.txt", content, "text/plain")},
+            ).json()
+            second = client.post(
+                f"{BASE_URL}/evidence/upload",
+                data={"plan_id": plan_id},
+                files={"file": ("b.txt", content, "text/plain")},
+            ).json()
+
+        assert first["sha256"] == hashlib.sha256(content).hexdigest()
+        assert second["sha256"] == first["sha256"]
+        assert first["size"] == len(content)
+        assert (first["filename"], second["filename"]) == ("a.txt", "b.txt")
+        assert first["id"] != second["id"]
+
+    def test_chunked_upload_resume(self, plan_id):
+        """Deve aceitar blocos com offset, retomar do offset salvo e verificar o SHA-256 final"""
+        content = bytes(range(256)) * 400
+        part1, part2 = content[:60000], content[60000:]
+        with httpx.Client(timeout=TIMEOUT) as client:
+            upload = client.post(f"{BASE_URL}/evidence/uploads", json={
+                "plan_id": plan_id, "filename": "grande.zip", "size": len(content),
+                "sha256": hashlib.sha256(content).hexdigest(),
+            }).json()
+            url = f"{BASE_URL}/evidence/uploads/{upload['upload_id']}"
+            r1 = client.put(url, params={"offset": 0}, content=part1,
+                            headers={"X-Chunk-SHA256": hashlib.sha256(part1).hexdigest()})
+            bad = client.put(url, params={"offset": 60000}, content=part2,
+                             headers={"X-Chunk-SHA256": "0" * 64})
+            wrong_offset = client.put(url, params={"offset": 10}, content=part2)
+            status = client.get(url).json()
+            client.put(url, params={"offset": status["offset"]}, content=part2)
+            done = client.post(f"{url}/complete")
+
+        assert r1.json()["offset"] == len(part1)
+        assert bad.status_code == 400
+        assert wrong_offset.status_code == 409
+        assert status["offset"] == len(part1)
+        assert done.status_code == 200
+        assert done.json()["sha256"] == hashlib.sha256(content).hexdigest()
+        assert done.json()["size"] == len(content)
+
+    def test_chunked_upload_concurrent_chunks(self, plan_id):
+        """Dois blocos simultâneos no mesmo offset não podem ser intercalados: o segundo recebe 409"""
+        content = b"a" * 2000
+        with httpx.Client(timeout=TIMEOUT) as client:
+            upload = client.post(f"{BASE_URL}/evidence/uploads", json={
+                "plan_id": plan_id, "filename": "lento.zip", "size": len(content),
+                "sha256": hashlib.sha256(content).hexdigest(),
+            }).json()
+        url = f"{BASE_URL}/evidence/uploads/{upload['upload_id']}"
+
+        def slow_body():
+            yield content[:1000]
+            time.sleep(1)
+            yield content[1000:]
+
+        results = {}
+        first = threading.Thread(target=lambda: results.setdefault(
+            "first", httpx.put(url, params={"offset": 0}, content=slow_body(), timeout=TIMEOUT)))
+        first.start()
+        time.sleep(0.3)
+        second = httpx.put(url, params={"offset": 0}, content=content, timeout=TIMEOUT)
+        first.join()
+        done = httpx.post(f"{url}/complete", timeout=TIMEOUT)
+
+        assert second.status_code == 409
+        assert second.json()["detail"]["message"] == "Upload busy"
+        assert results["first"].json()["offset"] == len(content)
+        assert done.status_code == 200
+
+    def test_chunked_upload_requires_sha256(self, plan_id):
+        """Deve exigir o SHA-256 do arquivo ao iniciar um upload em blocos"""
+        with httpx.Client(timeout=TIMEOUT) as client:
+            response = client.post(f"{BASE_URL}/evidence/uploads", json={
+                "plan_id": plan_id, "filename": "grande.zip", "size": 100,
+            })
+
+        assert response.status_code == 422
+
+    def test_download_range_and_etag(self, plan_id):
+        """Deve servir o arquivo com Range (206) e responder 304 para ETag conhecido"""
+        content = b"0123456789abcdefghij" * 50
+        with httpx.Client(timeout=TIMEOUT) as client:
+            ev = client.post(
+                f"{BASE_URL}/evidence/upload",
+                data={"plan_id": plan_id},
+                files={"file": ("dados.txt", content, "text/plain")},
+            ).json()
+            url = f"{BASE_URL}/evidence/{ev['id']}"
+            full = client.get(url)
+            partial = client.get(url, headers={"Range": "bytes=10-19"})
+            cached = client.get(url, headers={"If-None-Match": full.headers["ETag"]})
+            invalid = client.get(url, headers={"Range": f"bytes={len(content)}-"})
+
+        assert full.status_code == 200
+        assert full.content == content
+        assert full.headers["ETag"] == f'"{ev["sha256"]}"'
+        assert partial.status_code == 206
+        assert partial.content == content[10:20]
+        assert partial.headers["Content-Range"] == f"bytes 10-19/{len(content)}"
+        assert cached.status_code == 304
+        assert invalid.status_code == 416
+
+    def test_download_non_ascii_filename(self, plan_id):
+        """Deve servir arquivos com nome não ASCII (filename* RFC 5987 e fallback ASCII)"""
+        content = "conteúdo do relatório".encode()
+        with httpx.Client(timeout=TIMEOUT) as client:
+            ev = client.post(
+                f"{BASE_URL}/evidence/upload",
+                data={"plan_id": plan_id},
+                files={"file": ("报告.txt", content, "text/plain")},
+            ).json()
+            response = client.get(f"{BASE_URL}/evidence/{ev['id']}")
+
+        assert response.status_code == 200
+        assert response.content == content
+        disposition = response.headers["Content-Disposition"]
+        assert disposition == "attachment; filename=\"??.txt\"; filename*=UTF-8''%E6%8A%A5%E5%91%8A.txt"
+
+
+class TestBackup:
+    """Testes de backup em segundo plano"""
+
+    def test_backup_job(self):
+        """Deve criar o backup na thread de backup e expô-lo pelo job e na listagem"""
+        with httpx.Client(timeout=TIMEOUT) as client:
+            job = client.post(f"{BASE_URL}/backup/create")
+            assert job.status_code == 202
+            status = job.json()
+
+            deadline = time.time() + 60
+            while status["status"] in ("queued", "running") and time.time() < deadline:
+                time.sleep(0.2)
+                status = client.get(f"{BASE_URL}/backup/jobs/{status['job_id']}").json()
+            assert status["status"] == "done", status
+
+            listed = client.get(f"{BASE_URL}/backup/list").json()
+            missing = client.post(f"{BASE_URL}/backup/restore/plans_backup_missing.db")
+            not_backup = [client.post(f"{BASE_URL}/backup/{action}/catalog.sqlite") for action in ("restore", "verify")]
+
+            # Verificação completa sob demanda, registrada no catálogo
+            check = client.post(f"{BASE_URL}/backup/verify/{status['backup_file']}").json()
+            deadline = time.time() + 60
+            while check["status"] in ("queued", "running") and time.time() < deadline:
+                time.sleep(0.2)
+                check = client.get(f"{BASE_URL}/backup/jobs/{check['job_id']}").json()
+            entry = next(b for b in client.get(f"{BASE_URL}/backup/list").json()["backups"]
+                         if b["filename"] == status["backup_file"])
+
+        assert status["backup_file"] in {b["filename"] for b in listed["backups"]}
+        assert missing.status_code == 404
+        assert [r.status_code for r in not_backup] == [404, 404]
+        assert check["status"] == "done" and check["mode"] == "full"
+        assert entry["integrity"] == "integrity_check"
+
+
+class TestAudit:
+    """Testes da trilha de auditoria"""
+
+    def test_audit_filters_and_export(self):
+        """Deve filtrar eventos por plano/ação/período e exportar em NDJSON"""
+        plan = {
+            "subject": {"what": "Auditoria", "who": "QA", "where": "Local"},
+            "time_window": {"start": "2025-11-01", "end": "2025-11-30"},
+            "user": {"principal": "qa@example.com", "depth": "tecnico", "secrecy": "publico"},
+            "purpose": "Testar auditoria",
+            "deadline": {"date": "2025-11-30", "urgency": "baixa"},
+        }
+        with httpx.Client(timeout=TIMEOUT) as client:
+            plan_id = client.post(f"{BASE_URL}/plans", json=plan).json()["id"]
+            page = client.get(f"{BASE_URL}/audit", params={"plan_id": plan_id, "action": "create_plan"}).json()
+            future = client.get(
+                f"{BASE_URL}/audit", params={"plan_id": plan_id, "since": "2999-01-01T00:00:00"}
+            ).json()
+            export = client.get(f"{BASE_URL}/audit/export", params={"plan_id": plan_id})
+            period = client.get(
+                f"{BASE_URL}/audit/export", params={"since": "2000-01-01T00:00:00", "until": "2999-01-01T00:00:00"}
+            )
+
+        assert [e["plan_id"] for e in page["items"]] == [plan_id]
+        assert page["items"][0]["action"] == "create_plan"
+        assert future["items"] == []
+        assert export.status_code == 200
+        lines = [json.loads(line) for line in export.text.splitlines()]
+        assert any(e["action"] == "create_plan" for e in lines)
+        assert any(json.loads(line)["plan_id"] == plan_id for line in period.text.splitlines())
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
@@ -0,0 +1,65 @@
+"""
+Testes da gravação em lote da auditoria (executados diretamente, sem o servidor)
+"""
+
+import json
+from datetime import datetime, timezone
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from backend.app.db.database import Base
+from backend.app.models.models import AuditLog
+from backend.app.services.audit import AuditWriter
+
+
+def _entry(action):
+    return {"plan_id": None, "action": action, "detail": "", "actor": "qa",
+            "created_at": datetime.now(timezone.utc)}
+
+
+def _writer(tmp_path, failures, retries=3):
+    """AuditWriter cujas primeiras `failures` sessões falham ao gravar"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'audit.db'}")
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    calls = {"n": 0}
+
+    def session_factory():
+        calls["n"] += 1
+        session = factory()
+        if calls["n"] <= failures:
+            def fail(*args, **kwargs):
+                raise OperationalError("INSERT", {}, Exception("database is locked"))
+            session.execute = fail
+        return session
+
+    writer = AuditWriter(session_factory=session_factory, retries=retries,
+                         fallback_file=str(tmp_path / "fallback.ndjson"))
+    return writer, factory
+
+
+def test_failed_batch_is_retried(tmp_path):
+    """Um lote que falha volta ao buffer e é gravado na tentativa seguinte"""
+    writer, factory = _writer(tmp_path, failures=1)
+    writer._buffer = [_entry("a"), _entry("b")]
+
+    assert writer.flush() == 0
+    assert writer.flush() == 2
+    with factory() as db:
+        assert sorted(r.action for r in db.query(AuditLog)) == ["a", "b"]
+    assert not (tmp_path / "fallback.ndjson").exists()
+
+
+def test_exhausted_retries_go_to_fallback_file(tmp_path):
+    """Esgotadas as tentativas com o banco indisponível, os eventos vão para o arquivo"""
+    writer, _ = _writer(tmp_path, failures=100, retries=2)
+    writer._buffer = [_entry("a"), _entry("b")]
+
+    writer.stop()
+
+    lines = [json.loads(line) for line in (tmp_path / "fallback.ndjson").read_text().splitlines()]
+    assert [e["action"] for e in lines] == ["a", "b"]
+    assert "_attempts" not in lines[0]
+    assert writer._buffer == []
@@ -0,0 +1,281 @@
+"""
+Testes do serviço de backup (executados diretamente, sem o servidor)
+"""
+
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from backend.app.services import backup, backup_jobs
+
+TOTAL = 1000  # soma invariante dos saldos: toda transação preserva o total
+
+
+@pytest.fixture
+def live_db(tmp_path, monkeypatch):
+    """Banco em WAL com dados suficientes para o backup levar vários passos"""
+    monkeypatch.setattr(backup, "BACKUP_DIR", str(tmp_path / "backups"))
+    (tmp_path / "backups").mkdir()
+    path = str(tmp_path / "live.db")
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE accounts (id INTEGER PRIMARY KEY, balance INTEGER NOT NULL)")
+    conn.execute("CREATE TABLE filler (id INTEGER PRIMARY KEY, data BLOB)")
+    conn.execute("INSERT INTO accounts VALUES (1, ?), (2, 0)", (TOTAL,))
+    conn.executemany("INSERT INTO filler (data) VALUES (?)", [(b"x" * 4000,) for _ in range(500)])
+    conn.close()
+    return path
+
+
+def test_sqlite_database_url_sets_backup_path(tmp_path):
+    """Com DATABASE_URL sqlite:/// (sem DATABASE_PATH), o backup deve usar o mesmo arquivo da API"""
+    db_file = str(tmp_path / "x.db")
+    env = {k: v for k, v in os.environ.items() if k != "DATABASE_PATH"}
+    env.update(DATABASE_URL=f"sqlite:///{db_file}", BACKUP_DIR=str(tmp_path / "backups"))
+    out = subprocess.run(
+        [sys.executable, "-c", "from backend.app.services import backup; print(backup.DB_PATH)"],
+        env=env, capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    assert out.stdout.strip() == db_file
+
+
+def test_online_backup_consistent_under_writes(live_db, monkeypatch):
+    """O backup deve refletir um snapshot consistente mesmo com escritas concorrentes"""
+    # Um passo por página para que a cópia se intercale com as escritas
+    monkeypatch.setattr(backup, "BACKUP_PAGES_PER_STEP", 1)
+    monkeypatch.setattr(backup, "BACKUP_STEP_SLEEP", 0.0005)
+    monkeypatch.setattr(backup, "BACKUP_COMPRESSION", "none")
+    stop = threading.Event()
+    writes = 0
+
+    def writer():
+        nonlocal writes
+        conn = sqlite3.connect(live_db, isolation_level=None, timeout=30)
+        while not stop.is_set():
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("UPDATE accounts SET balance = balance - 1 WHERE id = 1")
+            conn.execute("UPDATE accounts SET balance = balance + 1 WHERE id = 2")
+            conn.execute("INSERT INTO filler (data) VALUES (?)", (b"y" * 4000,))
+            conn.execute("COMMIT")
+            writes += 1
+        conn.close()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        backup_path = backup.create_backup(live_db)
+    finally:
+        stop.set()
+        thread.join()
+
+    assert writes > 0
+    conn = sqlite3.connect(backup_path)
+    try:
+        assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+        assert conn.execute("SELECT sum(balance) FROM accounts").fetchone()[0] == TOTAL
+        moved = conn.execute("SELECT balance FROM accounts WHERE id = 2").fetchone()[0]
+        # Cada transferência insere exatamente uma linha em filler
+        assert conn.execute("SELECT count(*) FROM filler").fetchone()[0] == 500 + moved
+    finally:
+        conn.close()
+
+
+def test_incremental_chain_restore(live_db, tmp_path, monkeypatch):
+    """Incrementais devem gravar só as páginas alteradas e restaurar a cadeia completa"""
+    monkeypatch.setattr(backup, "BACKUP_INCREMENTAL", True)
+    monkeypatch.setattr(backup, "BACKUP_COMPRESSION", "gzip")
+    conn = sqlite3.connect(live_db, isolation_level=None)
+
+    full = backup.create_backup(live_db)
+    conn.execute("UPDATE accounts SET balance = balance - 10 WHERE id = 1")
+    first = backup.create_backup(live_db)
+    conn.execute("UPDATE accounts SET balance = balance + 10 WHERE id = 2")
+    conn.execute("INSERT INTO filler (data) VALUES (?)", (b"z" * 4000,))
+    latest = backup.create_backup(live_db)
+    conn.close()
+
+    listed = {b["path"]: b for b in backup.list_backups()}
+    assert listed[full]["type"] == "full" and full.endswith(".db.gz")
+    assert listed[latest]["type"] == "incremental"
+    assert listed[latest]["parent"] == listed[first]["filename"]
+    assert listed[latest]["size"] < listed[full]["size"]
+
+    target = str(tmp_path / "restored.db")
+    assert backup.restore_backup(latest, target)
+    restored = sqlite3.connect(target)
+    try:
+        assert restored.execute("SELECT balance FROM accounts ORDER BY id").fetchall() == [(TOTAL - 10,), (10,)]
+        assert restored.execute("SELECT count(*) FROM filler").fetchone()[0] == 501
+    finally:
+        restored.close()
+
+    # A retenção não pode remover o backup completo do qual um incremental retido depende
+    os.utime(full, (0, 0))
+    assert backup.cleanup_old_backups(retention_days=1) == 0
+    assert os.path.exists(full)
+
+
+def test_catalog_lists_without_scanning(live_db, monkeypatch):
+    """Listagens devem vir do catálogo; o diretório só é varrido quando muda por fora"""
+    created = backup.create_backup(live_db)
+    entry = backup.list_backups()[0]
+    assert entry["path"] == created
+    assert entry["integrity"] == "quick_check" and len(entry["sha256"]) == 64
+    assert entry["sqlite_version"]
+
+    scans = []
+    listdir = os.listdir
+    monkeypatch.setattr(os, "listdir", lambda path: scans.append(path) or listdir(path))
+    assert backup.get_backup_stats()["total_backups"] == 1
+    assert backup.list_backups()[0]["filename"] == entry["filename"]
+    assert scans == []
+
+    # Arquivo removido fora do serviço: o catálogo fica obsoleto e é reconciliado
+    os.remove(created)
+    assert backup.list_backups() == []
+    assert len(scans) == 1
+
+
+def test_tiered_retention(live_db, monkeypatch):
+    """A retenção por camadas mantém o backup mais recente de cada uma das últimas N horas"""
+    monkeypatch.setattr(backup, "BACKUP_COMPRESSION", "none")
+    monkeypatch.setattr(backup, "BACKUP_KEEP_HOURLY", 2)
+    # Meio da hora anterior: os deslocamentos abaixo não cruzam a virada da hora
+    anchor = (time.time() // 3600 - 1) * 3600 + 1800
+    paths = []
+    for offset in (0, 60, 3600, 26 * 3600, 27 * 3600, 50 * 3600):
+        path = backup.create_backup(live_db)
+        os.utime(path, (anchor - offset, anchor - offset))
+        paths.append(path)
+    # Datas alteradas por fora: sem o catálogo, ele é reconstruído a partir do diretório
+    os.remove(backup.backup_catalog.catalog_path(backup.BACKUP_DIR))
+
+    assert backup.cleanup_old_backups() == 4
+    assert {b["path"] for b in backup.list_backups()} == {paths[0], paths[2]}
+
+
+def test_restore_checks_recorded_checksum(live_db, tmp_path, monkeypatch):
+    """A restauração confere o SHA-256 da criação e recusa um backup alterado"""
+    monkeypatch.setattr(backup, "BACKUP_COMPRESSION", "none")
+    created = backup.create_backup(live_db)
+    target = str(tmp_path / "restored.db")
+
+    checks = []
+    monkeypatch.setattr(backup, "verify_backup", lambda path, mode=None: checks.append(path) or True)
+    assert backup.restore_backup(created, target)
+    assert checks == []  # checksum igual ao do backup verificado: sem reler o banco
+
+    with open(created, "r+b") as f:
+        f.seek(-1, os.SEEK_END)
+        f.write(b"\x01")
+    with pytest.raises(ValueError, match="checksum"):
+        backup.restore_backup(created, target)
+
+
+def test_restore_rejects_non_backup_files(live_db, tmp_path):
+    """O catálogo (um SQLite válido) não é um backup e não pode substituir o banco"""
+    backup.create_backup(live_db)
+    catalog = backup.backup_catalog.catalog_path(backup.BACKUP_DIR)
+    assert os.path.dirname(catalog) != backup.BACKUP_DIR
+    stray = os.path.join(backup.BACKUP_DIR, "catalog.sqlite")
+    with open(catalog, "rb") as src, open(stray, "wb") as dst:
+        dst.write(src.read())
+
+    with pytest.raises(ValueError, match="Not a backup file"):
+        backup.restore_backup(stray, live_db)
+    conn = sqlite3.connect(live_db)
+    try:
+        assert conn.execute("SELECT balance FROM accounts WHERE id = 1").fetchone()[0] == TOTAL
+    finally:
+        conn.close()
+
+
+def test_hot_restore_upgrades_old_schema(live_db, tmp_path):
+    """Um backup anterior às tabelas normalizadas deve ganhar o esquema atual ao ser restaurado"""
+    from sqlalchemy import create_engine, inspect
+    from backend.app.models.models import Plan, Evidence, AuditLog
+
+    old_db = str(tmp_path / "old.db")
+    engine = create_engine(f"sqlite:///{old_db}")
+    Plan.metadata.create_all(engine, tables=[Plan.__table__, Evidence.__table__, AuditLog.__table__])
+    engine.dispose()
+    conn = sqlite3.connect(old_db)
+    with conn:
+        conn.execute(
+            "INSERT INTO plans (title, subject, time_window, user, purpose, deadline, aspects_essential, "
+            "aspects_known, aspects_to_know, pirs, collection) VALUES ('Antigo', '{}', '{}', '{}', 'p', '{}', "
+            "'[]', '[]', '[]', '[{\"question\": \"Quem?\", \"priority\": \"alta\"}]', '[]')"
+        )
+    conn.close()
+    created = backup.create_backup(old_db)
+
+    assert backup.restore_backup(created, live_db)
+    engine = create_engine(f"sqlite:///{live_db}")
+    try:
+        tables = set(inspect(engine).get_table_names())
+        with engine.connect() as db:
+            questions = [row[0] for row in db.exec_driver_sql("SELECT question FROM pirs")]
+    finally:
+        engine.dispose()
+    assert {"pirs", "collection_tasks", "export_jobs", "evidence_uploads", "schema_migrations"} <= tables
+    assert questions == ["Quem?"]
+
+
+def test_hot_restore_visible_to_open_connections(live_db, tmp_path, monkeypatch):
+    """A restauração a quente mantém o WAL e não deixa conexões abertas lendo páginas antigas"""
+    monkeypatch.setattr(backup, "BACKUP_COMPRESSION", "none")
+    created = backup.create_backup(live_db)
+
+    # Conexão de longa duração (como as do pool), com mmap e cache já aquecidos
+    conn = sqlite3.connect(live_db, isolation_level=None)
+    conn.execute("PRAGMA mmap_size=268435456")
+    conn.execute("UPDATE accounts SET balance = 0 WHERE id = 1")
+    conn.execute("DELETE FROM filler WHERE id > 100")
+    assert conn.execute("SELECT count(*) FROM filler").fetchone()[0] == 100
+
+    assert backup.restore_backup(created, live_db)
+    try:
+        assert conn.execute("SELECT balance FROM accounts WHERE id = 1").fetchone()[0] == TOTAL
+        assert conn.execute("SELECT count(*) FROM filler").fetchone()[0] == 500
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    finally:
+        conn.close()
+    safety = [f for f in os.listdir(tmp_path) if ".safety_backup_" in f]
+    assert len(safety) == 1
+
+
+def test_backup_jobs_shared_between_processes(live_db, monkeypatch):
+    """Vários processos (aqui, duas instâncias): estado dos jobs compartilhado e um só agendador"""
+    monkeypatch.setattr(backup, "DB_PATH", live_db)
+    monkeypatch.setattr(backup_jobs.BackupWorker, "_audit", lambda self, action, detail: None)
+    first = backup_jobs.BackupWorker(poll_interval=0.05, interval=3600)
+    second = backup_jobs.BackupWorker(poll_interval=0.05, interval=3600)
+    try:
+        first.start(schedule=True)
+        second.start(schedule=True)
+        job = first.submit("create")
+        # O job enfileirado em um processo é consultado nos demais
+        assert second.get(job["job_id"])["kind"] == "create"
+        deadline = time.time() + 30
+        while second.get(job["job_id"])["status"] in ("queued", "running") and time.time() < deadline:
+            time.sleep(0.05)
+        done = second.get(job["job_id"])
+        # Um processo detém o lock do agendador; o outro aguarda para assumir
+        held = backup_jobs._try_lock(backup_jobs.SCHEDULER_LOCK)
+    finally:
+        first.stop()
+        second.stop()
+
+    assert done["status"] == "done"
+    assert os.path.exists(os.path.join(backup.BACKUP_DIR, done["backup_file"]))
+    assert held is None
+    released = backup_jobs._try_lock(backup_jobs.SCHEDULER_LOCK)
+    assert released is not None
+    released.close()